@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import PlainTextResponse
-from typing import Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from typing import Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import json
+import os
 import core_logic
+import metrics
+from batch_jobs import BatchJobStore
+
+# Synchronous batches answer in one response; larger ones go through the job endpoints.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_JOB_MAX_ITEMS = int(os.getenv("BATCH_JOB_MAX_ITEMS", "1000"))
 
 # Rate Limiting Setup
 limiter = Limiter(key_func=get_remote_address)
@@ -58,6 +70,17 @@ class AnalysisResponse(BaseModel):
 class SearchResponseWrapper(BaseModel):
     status: str
     analysis_data: AnalysisResponse
+    source_status: Optional[dict[str, str]] = None
+
+class SearchFilters(BaseModel):
+    # Hard filters on Lark's Database, applied before the vector search; list fields accept any of their values.
+    level: list[str] = Field([])
+    industry: list[str] = Field([])
+    job_title: list[str] = Field([])
+    must_have_skills: list[str] = Field([])
+    must_not_have_skills: list[str] = Field([])
+    min_years: Optional[float] = Field(None, ge=0)
+    max_years: Optional[float] = Field(None, ge=0)
 
 class SearchRequest(BaseModel):
     query: str
@@ -65,6 +88,59 @@ class SearchRequest(BaseModel):
     num_results: int = 7
     google_drive_folder_ids: list[str] = Field([])
     google_auth_token: Optional[dict] = Field(None)
+    filters: Optional[SearchFilters] = None
+
+class FacetsRequest(BaseModel):
+    query: Optional[str] = None
+    filters: Optional[SearchFilters] = None
+
+class FacetsResponse(BaseModel):
+    filters: dict
+    total: int
+    facets: dict[str, dict[str, int]]
+    years_of_experience: dict[str, int]
+    version: str
+
+class BatchItem(BaseModel):
+    query: str
+    num_results: int = 7
+    id: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    items: list[BatchItem] = Field(..., min_length=1)
+    source: str = "Lark's Database"
+    google_drive_folder_ids: list[str] = Field([])
+    google_auth_token: Optional[dict] = Field(None)
+    filters: Optional[SearchFilters] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str
+    analysis_data: Optional[AnalysisResponse] = None
+    source_status: Optional[dict[str, str]] = None
+    error: Optional[str] = None
+    cache: Optional[str] = None
+
+class BatchSearchResponse(BaseModel):
+    status: Literal["success", "partial", "error"]
+    results: list[BatchItemResult]
+
+class BatchJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
+    results: list[BatchItemResult] = Field([])
+
+batch_jobs = BatchJobStore()
+_batch_tasks = set()  # the event loop only keeps weak references to tasks
+# One thread owns this worker's batch job writes: they stay off the event loop and land in submission order.
+_batch_job_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-jobs")
+
+def _batch_job_write(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(_batch_job_writer, functools.partial(fn, *args))
 
 # Startup Event
 @app.on_event("startup")
@@ -75,29 +151,172 @@ async def startup_event():
     core_logic.initialize_database()
     print("--- Startup Complete ---")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    core_logic.shutdown_executors()
+    _batch_job_writer.shutdown(wait=True)
+
+def _filters(filters: Optional[SearchFilters]) -> Optional[dict]:
+    return filters.model_dump(exclude_none=True) if filters else None
+
 # API Endpoints
 @app.get("/", summary="API Root / Health Check")
 async def read_root():
     return {"message": "Lark Talent API is running."}
 
+@app.get("/v1/cache/stats", summary="Cache hit/miss counters")
+async def cache_stats(api_key: str = Depends(get_api_key)):
+    return {"embedding_cache": core_logic.embedding_cache.stats(), "search_cache": core_logic.search_cache.stats(), "query_planner": core_logic.query_planner.stats(),
+            "lexical_index": core_logic.lexical_index.stats(), "reranker": core_logic.reranker.stats(), "index_snapshot": core_logic.index_snapshots.stats()}
+
+@app.get("/metrics", summary="Prometheus metrics for this worker", response_class=PlainTextResponse)
+async def prometheus_metrics(api_key: str = Depends(get_api_key)):
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/v1/facets", summary="Live facet counts for the candidates matching a query and filters", response_model=FacetsResponse)
+@limiter.limit("60/minute")
+async def facets(request: Request, facets_request: FacetsRequest, api_key: str = Depends(get_api_key)):
+    with metrics.request_trace(api_key, "Lark's Database", "facets") as trace:
+        status = "error"
+        try:
+            counts = await core_logic.facet_counts_async(facets_request.query, _filters(facets_request.filters))
+            status = "success"
+            return FacetsResponse(**counts)
+        except Exception as e:
+            print(f"Error during API call: {e}")
+            raise HTTPException(status_code=500, detail="An internal server error occurred.")
+        finally:
+            trace.finish(status)
+
 @app.post("/v1/search_candidates", summary="Search for candidates", response_model=SearchResponseWrapper)
 @limiter.limit("20/minute")
-async def search_candidates(request: Request, search_request: SearchRequest, api_key: str = Depends(get_api_key)):
-    try:
-        result_data = core_logic.perform_claude_search_with_tool(
-            user_query=search_request.query,
-            num_profiles_to_retrieve=search_request.num_results,
-            source=search_request.source,
-            folder_ids=search_request.google_drive_folder_ids,
-            user_id=api_key,
-            token=search_request.google_auth_token
-        )
-        if result_data.get("status") == "success":
-            usage = result_data.get("usage", {})
-            print(f"COST_LOG: key='{api_key}' usage={usage}")
-            return SearchResponseWrapper(status="success", analysis_data=result_data["analysis_data"])
-        else:
-            raise HTTPException(status_code=500, detail=result_data.get("message", "Unknown LLM error"))
-    except Exception as e:
-        print(f"Error during API call: {e}")
-        raise HTTPException(status_code=500, detail="An internal server error occurred.")
\ No newline at end of file
+async def search_candidates(request: Request, response: Response, search_request: SearchRequest, api_key: str = Depends(get_api_key)):
+    with metrics.request_trace(api_key, search_request.source, "search") as trace:
+        status, cache = "error", "miss"
+        try:
+            result_data = await core_logic.perform_claude_search_with_tool_async(
+                user_query=search_request.query,
+                num_profiles_to_retrieve=search_request.num_results,
+                source=search_request.source,
+                folder_ids=search_request.google_drive_folder_ids,
+                user_id=api_key,
+                token=search_request.google_auth_token,
+                filters=_filters(search_request.filters)
+            )
+            cache = result_data.get("cache", "miss")
+            if result_data.get("status") == "success":
+                status = "success"
+                # Every Claude call and embedding of this request; cache hits and coalesced requests paid nothing.
+                print(f"COST_LOG: key='{api_key}' usage={trace.usage}")
+                if metrics.METRICS_TIMING_HEADER: response.headers["Server-Timing"] = trace.server_timing()
+                return SearchResponseWrapper(status="success", analysis_data=result_data["analysis_data"], source_status=result_data.get("source_status"))
+            else:
+                raise HTTPException(status_code=500, detail=result_data.get("message", "Unknown LLM error"))
+        except Exception as e:
+            print(f"Error during API call: {e}")
+            raise HTTPException(status_code=500, detail="An internal server error occurred.")
+        finally:
+            trace.finish(status, cache)
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/v1/search_candidates/stream", summary="Search for candidates, streaming results as Server-Sent Events")
+@limiter.limit("20/minute")
+async def search_candidates_stream(request: Request, search_request: SearchRequest, api_key: str = Depends(get_api_key)):
+    async def event_stream():
+        with metrics.request_trace(api_key, search_request.source, "stream") as trace:
+            status, cache = "error", "miss"
+            try:
+                async for event, data in core_logic.stream_claude_search(
+                    user_query=search_request.query,
+                    num_profiles_to_retrieve=search_request.num_results,
+                    source=search_request.source,
+                    folder_ids=search_request.google_drive_folder_ids,
+                    user_id=api_key,
+                    token=search_request.google_auth_token,
+                    filters=_filters(search_request.filters)
+                ):
+                    if event == "done":
+                        status, cache = "success", data.get("cache", "miss")
+                        print(f"COST_LOG: key='{api_key}' usage={trace.usage}")
+                    yield _sse_event(event, data)
+            finally:
+                trace.finish(status, cache)
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _batch_item_result(index: int, item: BatchItem, result: dict) -> BatchItemResult:
+    if result.get("status") == "success":
+        try:
+            return BatchItemResult(index=index, id=item.id, status="success", analysis_data=AnalysisResponse.model_validate(result["analysis_data"]),
+                                   source_status=result.get("source_status"), cache=result.get("cache", "miss"))
+        except ValidationError as e:
+            print(f"Batch item {index} returned an invalid analysis: {e}")
+            result = {"status": "error", "message": "The AI returned an analysis that does not match the response schema."}
+    return BatchItemResult(index=index, id=item.id, status="error", error=result.get("message", "Unknown LLM error"), source_status=result.get("source_status"))
+
+def _batch_status(results: list) -> str:
+    succeeded = sum(result.status == "success" for result in results)
+    return "success" if succeeded == len(results) else "partial" if succeeded else "error"
+
+def _validate_batch(batch_request: BatchSearchRequest, max_items: int):
+    if batch_request.source not in ("Lark's Database", "Google Drive", "Both"): raise HTTPException(status_code=400, detail=f"Invalid source specified: {batch_request.source}")
+    if len(batch_request.items) > max_items: raise HTTPException(status_code=413, detail=f"A batch holds at most {max_items} items; submit larger ones as a job.")
+
+def _search_batch(batch_request: BatchSearchRequest, api_key: str, on_result=None):
+    return core_logic.search_batch_async([{"query": item.query, "num_results": item.num_results} for item in batch_request.items], batch_request.source,
+                                         batch_request.google_drive_folder_ids, api_key, batch_request.google_auth_token, on_result, _filters(batch_request.filters))
+
+@app.post("/v1/search_candidates/batch", summary="Search for candidates for several job descriptions at once", response_model=BatchSearchResponse)
+@limiter.limit("20/minute")
+async def search_candidates_batch(request: Request, response: Response, batch_request: BatchSearchRequest, api_key: str = Depends(get_api_key)):
+    _validate_batch(batch_request, BATCH_MAX_ITEMS)
+    with metrics.request_trace(api_key, batch_request.source, "batch") as trace:
+        status = "error"
+        try:
+            results = [_batch_item_result(i, item, result) for i, (item, result) in enumerate(zip(batch_request.items, await _search_batch(batch_request, api_key)))]
+            status = _batch_status(results)
+            print(f"COST_LOG: key='{api_key}' items={len(results)} usage={trace.usage}")
+            if metrics.METRICS_TIMING_HEADER: response.headers["Server-Timing"] = trace.server_timing()
+            return BatchSearchResponse(status=status, results=results)
+        except Exception as e:
+            print(f"Error during API call: {e}")
+            raise HTTPException(status_code=500, detail="An internal server error occurred.")
+        finally:
+            trace.finish(status)
+
+async def _run_batch_job(job_id: str, batch_request: BatchSearchRequest, api_key: str):
+    with metrics.request_trace(api_key, batch_request.source, "batch_job") as trace:
+        status, writes = "error", []
+        try:
+            def record(i: int, result: dict):
+                writes.append(_batch_job_write(batch_jobs.record, job_id, i, _batch_item_result(i, batch_request.items[i], result).model_dump(mode="json")))
+            await _search_batch(batch_request, api_key, record)
+            status = "success"
+            print(f"COST_LOG: key='{api_key}' job={job_id} items={len(batch_request.items)} usage={trace.usage}")
+        except Exception as e:
+            print(f"Error during batch job {job_id}: {e}")
+        finally:
+            failed_writes = [e for e in await asyncio.gather(*writes, return_exceptions=True) if e is not None]
+            if failed_writes:
+                print(f"Error during batch job {job_id}: {len(failed_writes)} result writes failed: {failed_writes[0]}")
+                status = "error"
+            await _batch_job_write(batch_jobs.finish, job_id, "done" if status == "success" else "error")
+            trace.finish(status)
+
+@app.post("/v1/search_candidates/batch/jobs", summary="Submit a large batch search to run in the background", response_model=BatchJobResponse, status_code=202)
+@limiter.limit("20/minute")
+async def submit_batch_job(request: Request, batch_request: BatchSearchRequest, api_key: str = Depends(get_api_key)):
+    _validate_batch(batch_request, BATCH_JOB_MAX_ITEMS)
+    job_id = await _batch_job_write(batch_jobs.create, metrics.key_label(api_key), len(batch_request.items))
+    task = asyncio.create_task(_run_batch_job(job_id, batch_request, api_key))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return BatchJobResponse(job_id=job_id, status="running", total=len(batch_request.items), completed=0, failed=0)
+
+@app.get("/v1/search_candidates/batch/jobs/{job_id}", summary="Status and finished results of a batch search job", response_model=BatchJobResponse)
+async def get_batch_job(job_id: str, api_key: str = Depends(get_api_key)):
+    job = await asyncio.to_thread(batch_jobs.get, job_id, metrics.key_label(api_key))
+    if job is None: raise HTTPException(status_code=404, detail="Batch job not found.")
+    return BatchJobResponse(**{k: v for k, v in job.items() if k in ("job_id", "status", "total", "completed", "failed")}, results=list(job["results"].values()))
@@ -1,9 +1,11 @@
+import json
 import streamlit as st
 import requests
 from streamlit_oauth import OAuth2Component
 
 # --- CONFIGURATION ---
 API_URL = "https://web-production-97a15.up.railway.app/v1/search_candidates"
+STREAM_API_URL = f"{API_URL}/stream"
 try:
     GOOGLE_CLIENT_ID = st.secrets["GOOGLE_CLIENT_ID"]
     GOOGLE_CLIENT_SECRET = st.secrets["GOOGLE_CLIENT_SECRET"]
@@ -111,30 +113,54 @@ if st.button("Find Matching Profiles", type="primary", use_container_width=True)
                 }
                 
                 headers = {"Authorization": f"Bearer {user_api_key}"}
-                response = requests.post(API_URL, json=payload, headers=headers)
+                response = requests.post(STREAM_API_URL, json=payload, headers=headers, stream=True)
                 response.raise_for_status()
-                api_response_data = response.json()
 
                 st.markdown("---")
                 st.subheader("AI Analysis & Top Recommendations")
-                analysis = api_response_data.get("analysis_data", {})
-                
-                if analysis and analysis.get('candidates'):
-                    st.markdown(f"**Overall Summary:** {analysis.get('overall_summary', 'No summary available.')}")
-                    st.markdown("---")
-                    for i, candidate in enumerate(analysis.get('candidates', [])):
-                        st.markdown(f"**{i+1}. {candidate.get('name', 'N/A')}**")
-                        contact_info = candidate.get('contact_information', {})
-                        st.markdown(f"**Contact:** {contact_info.get('email', 'N/A')} | {contact_info.get('phone', 'N/A')}")
-                        st.markdown(f"**Resume:** [Link to PDF]({candidate.get('resume_pdf_url', '#')})")
-                        with st.expander("See AI Summary"):
-                            st.markdown(f"{candidate.get('summary', 'No summary provided.')}")
-                        st.markdown("---")
-                    st.markdown(f"**Overall Recommendation:** {analysis.get('overall_recommendation', 'N/A')}")
-                else:
-                    st.warning("No matching candidates were found for your query.")
-                    summary = analysis.get('overall_summary', 'The AI could not find any matching profiles that fit the criteria.')
-                    st.markdown(f"**AI Summary:** {summary}")
+                progress = st.empty()
+                summary_slot = st.empty()
+                st.markdown("---")
+                candidates_slot = st.empty()
+                candidates_box = candidates_slot.container()
+                num_candidates = 0
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                        continue
+                    if not line.startswith("data:"): continue
+                    data = json.loads(line[len("data:"):])
+                    if event == "plan":
+                        progress.caption(f"Searching for: {data.get('query', query)}")
+                    elif event == "candidates":
+                        progress.caption(f"Retrieved {len(data)} potential candidates, analyzing...")
+                    elif event in ("candidate", "replace"):
+                        # `replace` carries the corrected list after the server repaired the analysis.
+                        if event == "replace":
+                            candidates_box = candidates_slot.container()
+                            num_candidates = 0
+                        for candidate in (data if event == "replace" else [data]):
+                            num_candidates += 1
+                            candidates_box.markdown(f"**{num_candidates}. {candidate.get('name', 'N/A')}**")
+                            contact_info = candidate.get('contact_information', {})
+                            candidates_box.markdown(f"**Contact:** {contact_info.get('email', 'N/A')} | {contact_info.get('phone', 'N/A')}")
+                            candidates_box.markdown(f"**Resume:** [Link to PDF]({candidate.get('resume_pdf_url', '#')})")
+                            with candidates_box.expander("See AI Summary"):
+                                st.markdown(f"{candidate.get('summary', 'No summary provided.')}")
+                            candidates_box.markdown("---")
+                    elif event == "summary":
+                        progress.empty()
+                        if num_candidates:
+                            summary_slot.markdown(f"**Overall Summary:** {data.get('overall_summary', 'No summary available.')}")
+                            st.markdown(f"**Overall Recommendation:** {data.get('overall_recommendation', 'N/A')}")
+                        else:
+                            st.warning("No matching candidates were found for your query.")
+                            summary = data.get('overall_summary', 'The AI could not find any matching profiles that fit the criteria.')
+                            summary_slot.markdown(f"**AI Summary:** {summary}")
+                    elif event == "error":
+                        progress.empty()
+                        st.error(f"An error occurred: {data.get('message', 'Unknown error')}")
 
             except Exception as e:
                 st.error(f"An error occurred: {e}")
\ No newline at end of file
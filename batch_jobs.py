@@ -0,0 +1,66 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+BATCH_JOBS_PATH = os.getenv("BATCH_JOBS_PATH", "./lark_db/batch_jobs.sqlite3")
+BATCH_JOB_TTL_SECONDS = float(os.getenv("BATCH_JOB_TTL_SECONDS", "86400"))
+
+class BatchJobStore:
+    """Status and per-item results of asynchronous batch searches, kept in SQLite so a poll answered by any
+    gunicorn worker sees a job submitted to another. Finished jobs are dropped after `ttl_seconds`."""
+
+    def __init__(self, path: str = BATCH_JOBS_PATH, ttl_seconds: float = BATCH_JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS batch_jobs (job_id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL, "
+                         "completed INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS batch_job_results (job_id TEXT NOT NULL, item_index INTEGER NOT NULL, result TEXT NOT NULL, PRIMARY KEY (job_id, item_index))")
+            self._local.conn = conn
+        return conn
+
+    def create(self, owner: str, total: int) -> str:
+        self.prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("INSERT INTO batch_jobs (job_id, owner, status, total, created_at, updated_at) VALUES (?, ?, 'running', ?, ?, ?)", (job_id, owner, total, now, now))
+        return job_id
+
+    def record(self, job_id: str, index: int, result: dict):
+        failed = int(result.get("status") != "success")
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO batch_job_results (job_id, item_index, result) VALUES (?, ?, ?)", (job_id, index, json.dumps(result)))
+            conn.execute("UPDATE batch_jobs SET completed = completed + 1, failed = failed + ?, updated_at = ? WHERE job_id = ?", (failed, time.time(), job_id))
+
+    def finish(self, job_id: str, status: str):
+        with self._connection() as conn:
+            conn.execute("UPDATE batch_jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+
+    def get(self, job_id: str, owner: str):
+        """The job with its finished items ({index: result}), or None if it doesn't exist or belongs to another owner."""
+        conn = self._connection()
+        row = conn.execute("SELECT status, total, completed, failed, created_at, updated_at FROM batch_jobs WHERE job_id = ? AND owner = ?", (job_id, owner)).fetchone()
+        if row is None: return None
+        results = {index: json.loads(result) for index, result in conn.execute("SELECT item_index, result FROM batch_job_results WHERE job_id = ? ORDER BY item_index", (job_id,))}
+        return {"job_id": job_id, "status": row[0], "total": row[1], "completed": row[2], "failed": row[3], "created_at": row[4], "updated_at": row[5], "results": results}
+
+    def prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM batch_job_results WHERE job_id IN (SELECT job_id FROM batch_jobs WHERE updated_at < ?)", (cutoff,))
+                conn.execute("DELETE FROM batch_jobs WHERE updated_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"Batch job prune failed: {e}")
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Every external dependency is swapped for the offline stand-ins in fakes.py unless explicitly overridden.
+OFFLINE_BACKENDS = {"EMBEDDING_BACKEND": "fake", "LLM_BACKEND": "fake", "DRIVE_BACKEND": "fake"}
+SEARCH_QUERIES = ["Senior Software Engineer with Python and AWS", "Data Scientist with Machine Learning in Healthcare",
+                  "Product Manager with Agile and roadmap experience", "DevOps Engineer with Kubernetes and GCP",
+                  "Marketing Manager for E-commerce with SEO", "Director of Engineering in Finance",
+                  "Frontend Development and UI/UX Design", "Financial Analyst with Financial Modeling and SQL"]
+SEARCH_FILTERS = {"none": {}, "level": {"level": "Senior"}, "industry": {"industry": "Tech"}, "level+industry": {"level": "Senior", "industry": "Tech"},
+                  "must_have": {"must_have_skills": ["Python", "AWS"]}, "must_not_have": {"must_not_have_skills": ["Java"]},
+                  "levels+years": {"level": ["Senior", "Lead"], "min_years": 5}}
+
+def _configure_environment(workdir: str, embedding_dim: int, llm_latency: float, embedding_cache: bool):
+    # Read at import time by core_logic and its modules, so this has to run before the first import.
+    for name, value in OFFLINE_BACKENDS.items(): os.environ.setdefault(name, value)
+    # An empty path disables the SQLite tier; at 1M resumes it would otherwise hold tens of GB of vectors.
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3") if embedding_cache else ""
+    os.environ.setdefault("CORPUS_VERSIONS_PATH", os.path.join(workdir, "corpus_versions.sqlite3"))
+    os.environ["FAKE_EMBEDDING_DIM"] = str(embedding_dim)
+    os.environ["FAKE_LLM_LATENCY_SECONDS"] = str(llm_latency)
+
+def latency_summary(latencies: list, wall_seconds: float = None) -> dict:
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    summary = {"count": len(latencies)}
+    if len(values): summary.update({"p50_ms": round(float(np.percentile(values, 50)), 3), "p95_ms": round(float(np.percentile(values, 95)), 3),
+                                    "p99_ms": round(float(np.percentile(values, 99)), 3), "mean_ms": round(float(values.mean()), 3), "max_ms": round(float(values.max()), 3)})
+    if wall_seconds: summary["rps"] = round(len(latencies) / wall_seconds, 2)
+    return summary
+
+def corpus_path(corpus_dir: str, size: int, seed: int) -> str:
+    import synthetic_corpus
+    path = os.path.join(corpus_dir, f"synthetic_{size}_seed{seed}.jsonl")
+    if not os.path.exists(path):
+        started = time.time()
+        synthetic_corpus.write_corpus(path, size, seed)
+        print(f"Benchmark: generated {size} resumes in {time.time() - started:.1f}s -> {path}")
+    return path
+
+def bench_ingest(workdir: str, path: str, size: int, concurrency: int) -> dict:
+    import chromadb
+    import core_logic
+    import ingest
+    core_logic.chroma_client = chromadb.PersistentClient(path=os.path.join(workdir, f"chroma_{size}"))
+    stats = ingest.ingest_resumes(path, core_logic.COLLECTION_NAME, concurrency=concurrency, skip_existing=False)
+    chunks = core_logic.chroma_client.get_collection(core_logic.chunk_collection_name(core_logic.COLLECTION_NAME)).count()
+    return {"size": size, "seconds": stats["elapsed_seconds"], "records_per_second": round(stats["written"] / max(stats["elapsed_seconds"], 1e-9), 1),
+            "written": stats["written"], "chunks": chunks, "embedding_cache": core_logic.embedding_cache.stats()}
+
+def bench_search(size: int, iterations: int, num_results: int) -> list:
+    import core_logic
+    started = time.perf_counter()
+    core_logic.lexical_index.ensure_fresh()
+    core_logic.query_planner.ensure_fresh()
+    index_seconds = time.perf_counter() - started
+    results = []
+    for name, filters in SEARCH_FILTERS.items():
+        latencies = []
+        for i in range(iterations):
+            query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+            started = time.perf_counter()
+            core_logic.resume_search_tool(query, num_results, **filters)
+            latencies.append(time.perf_counter() - started)
+        results.append({"size": size, "filter": name, "index_build_seconds": round(index_seconds, 3), **latency_summary(latencies)})
+        print(f"Benchmark: resume_search_tool size={size} filter={name}: {results[-1]}")
+    return results
+
+async def _load_test(requests: int, concurrency: int, source: str, num_results: int) -> tuple:
+    import httpx
+    import api_server
+    api_server.limiter.enabled = False  # the per-IP limit would otherwise cap the test at 20 requests a minute
+    headers = {"Authorization": f"Bearer {next(iter(api_server.VALID_API_KEYS))}"}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(client, i):
+        # Distinct query text per request so the search cache doesn't turn the run into a cache benchmark.
+        payload = {"query": f"{SEARCH_QUERIES[i % len(SEARCH_QUERIES)]} #{i}", "source": source, "num_results": num_results,
+                   "google_drive_folder_ids": ["https://drive.google.com/drive/folders/bench-folder"], "google_auth_token": {"access_token": "bench"}}
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/v1/search_candidates", json=payload, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://benchmark", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        return latencies, statuses, time.perf_counter() - started
+
+def bench_endpoint(size: int, requests: int, concurrency: int, source: str, num_results: int) -> dict:
+    import core_logic
+    latencies, statuses, wall_seconds = asyncio.run(_load_test(requests, concurrency, source, num_results))
+    result = {"size": size, "source": source, "concurrency": concurrency, "statuses": {str(code): count for code, count in statuses.items()},
+              "llm_latency_seconds": core_logic.global_async_client_anthropic.latency_seconds, **latency_summary(latencies, wall_seconds)}
+    print(f"Benchmark: /v1/search_candidates size={size}: {result}")
+    return result
+
+def bench_drive(workdir: str, files: int, seed: int) -> dict:
+    import chromadb
+    import core_logic
+    import fakes
+    import synthetic_corpus
+    if core_logic.chroma_client is None: core_logic.chroma_client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_drive"))
+    for resume in synthetic_corpus.generate_resumes(files, seed=seed + 1):
+        core_logic.fake_drive_service.add_file("bench-folder", resume["id"], f"{resume['name']}.pdf", fakes.make_pdf(resume["raw_text"]))
+    collection = core_logic.chroma_client.get_or_create_collection(name=core_logic.GDRIVE_COLLECTION_NAME)
+    folders, token = ["https://drive.google.com/drive/folders/bench-folder"], {"access_token": "bench"}
+    cold = core_logic.drive_engine.sync(collection, folders, "bench-user", token)
+    warm = core_logic.drive_engine.sync(collection, folders, "bench-user", token)
+    result = {"files": files, "cold": cold, "warm": warm, "cold_files_per_second": round(cold["indexed"] / max(cold["elapsed_seconds"], 1e-9), 1)}
+    print(f"Benchmark: Drive sync: {result}")
+    return result
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ingestion, retrieval and the search endpoint, using the fakes in fakes.py.")
+    parser.add_argument("--sizes", default="10000", help="Comma-separated corpus sizes, e.g. 10000,100000,1000000.")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--workdir", default=None, help="Where corpora, Chroma databases and caches go (default: a new temp dir).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--search-iterations", type=int, default=50)
+    parser.add_argument("--num-results", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the scripted Claude sleeps per call.")
+    parser.add_argument("--source", default="Lark's Database", choices=["Lark's Database", "Google Drive", "Both"])
+    parser.add_argument("--drive-files", type=int, default=100, help="Generated PDFs served by the fake Drive (0 skips the Drive benchmark).")
+    parser.add_argument("--search-cache", action="store_true", help="Keep the whole-response search cache enabled during the load test.")
+    parser.add_argument("--embedding-cache", action="store_true", help="Keep the SQLite tier of the embedding cache enabled.")
+    args = parser.parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="lark-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    _configure_environment(workdir, args.embedding_dim, args.llm_latency, args.embedding_cache)
+    import core_logic
+    core_logic.initialize_api_clients()
+    if not args.search_cache: core_logic.search_cache.ttl_seconds = 0
+
+    report = {"meta": {"started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "commit": _git_commit(), "python": sys.version.split()[0],
+                       "platform": platform.platform(), "cpu_count": os.cpu_count(), "workdir": workdir, "args": vars(args)},
+              "ingest": [], "search": [], "endpoint": [], "drive": None}
+    try:
+        for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+            path = corpus_path(workdir, size, args.seed)
+            report["ingest"].append(bench_ingest(workdir, path, size, args.ingest_concurrency))
+            print(f"Benchmark: ingested {size} resumes: {report['ingest'][-1]}")
+            report["search"].extend(bench_search(size, args.search_iterations, args.num_results))
+            if args.drive_files and report["drive"] is None and args.source != "Lark's Database": report["drive"] = bench_drive(workdir, args.drive_files, args.seed)
+            report["endpoint"].append(bench_endpoint(size, args.requests, args.concurrency, args.source, args.num_results))
+        if args.drive_files and report["drive"] is None: report["drive"] = bench_drive(workdir, args.drive_files, args.seed)
+    finally:
+        report["meta"]["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+        print(f"Benchmark: results written to {args.output}")
+        core_logic.shutdown_executors()
+
+if __name__ == "__main__":
+    main()
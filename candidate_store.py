@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+
+# Single-valued facets are dictionary-encoded columns; skills is multi-valued (a resume sets one bit per listed skill).
+CATEGORY_FACETS = ("level", "industry", "job_title")
+FACETS = CATEGORY_FACETS + ("skills",)
+FACET_COUNTS_LIMIT = int(os.getenv("FACET_COUNTS_LIMIT", "25"))
+YEARS_THRESHOLDS = (1, 3, 5, 10, 15)
+
+def _words(rows: int) -> int:
+    return (rows + 63) // 64
+
+def _bit(slot: int) -> tuple:
+    return slot >> 6, np.uint64(1 << (slot & 63))
+
+def _facet_key(value: str) -> str:
+    return " ".join(str(value).split()).casefold()
+
+class CandidateStore:
+    """Columnar candidate attributes addressed by lexical index slot: dictionary-encoded level, industry and
+    job_title codes, years of experience, and a packed bitmap per facet value (every skill included). Multi-value
+    and range filters become a few vectorized AND/OR ops over 64-slot words instead of set intersections.
+    Values match case-insensitively; `skill_key` normalizes skills the way the lexical index does."""
+
+    def __init__(self, skill_key=_facet_key, capacity: int = 1024):
+        self.skill_key = skill_key
+        self.size = 0
+        self.capacity = _words(max(64, capacity)) * 64
+        self.years = np.zeros(self.capacity, dtype=np.float32)
+        self.codes = {facet: np.full(self.capacity, -1, dtype=np.int32) for facet in CATEGORY_FACETS}
+        self.live = np.zeros(_words(self.capacity), dtype=np.uint64)
+        self.values = {facet: [] for facet in FACETS}
+        self.code_of = {facet: {} for facet in FACETS}
+        self.bitmaps = {facet: [] for facet in FACETS}
+        self.slot_skill_codes = []
+
+    @classmethod
+    def from_arrays(cls, years: np.ndarray, bitmaps: dict, values: dict, skill_key=_facet_key):
+        """A read-only store over existing columns (an index snapshot's memory maps): every row of `years` is a live
+        slot and `bitmaps[facet]` is a (values, words) matrix. Only the value dictionaries are built in memory."""
+        store = cls(skill_key=skill_key, capacity=0)
+        store.size = len(years)
+        store.capacity = _words(len(years)) * 64
+        store.years, store.codes, store.bitmaps, store.slot_skill_codes = years, None, bitmaps, None
+        store.values = {facet: list(values[facet]) for facet in FACETS}
+        store.code_of = {facet: {(skill_key(value) if facet == "skills" else _facet_key(value)): code for code, value in enumerate(store.values[facet])} for facet in FACETS}
+        store.live = store.from_mask(np.ones(len(years), dtype=bool))
+        return store
+
+    def _grow(self, slots: int):
+        if slots <= self.capacity: return
+        capacity = self.capacity
+        while capacity < slots: capacity *= 2
+        extra, extra_words = capacity - self.capacity, _words(capacity) - _words(self.capacity)
+        self.years = np.concatenate([self.years, np.zeros(extra, dtype=np.float32)])
+        self.codes = {facet: np.concatenate([codes, np.full(extra, -1, dtype=np.int32)]) for facet, codes in self.codes.items()}
+        self.live = np.concatenate([self.live, np.zeros(extra_words, dtype=np.uint64)])
+        self.bitmaps = {facet: [np.concatenate([bitmap, np.zeros(extra_words, dtype=np.uint64)]) for bitmap in bitmaps] for facet, bitmaps in self.bitmaps.items()}
+        self.capacity = capacity
+
+    def _code(self, facet: str, key: str, value: str) -> int:
+        code = self.code_of[facet].get(key)
+        if code is None:
+            code = self.code_of[facet][key] = len(self.values[facet])
+            self.values[facet].append(value)
+            self.bitmaps[facet].append(np.zeros(_words(self.capacity), dtype=np.uint64))
+        return code
+
+    def add(self, slot: int, metadata: dict, years: float):
+        self._grow(slot + 1)
+        self.size = max(self.size, slot + 1)
+        word, bit = _bit(slot)
+        self.live[word] |= bit
+        self.years[slot] = years
+        for facet in CATEGORY_FACETS:
+            value = str(metadata.get(facet) or "").strip()
+            if not value: continue
+            code = self.codes[facet][slot] = self._code(facet, _facet_key(value), value)
+            self.bitmaps[facet][code][word] |= bit
+        skill_codes = []
+        for skill in str(metadata.get("skills") or "").split(","):
+            key = self.skill_key(skill) if skill.strip() else ""
+            if not key: continue
+            skill_codes.append(self._code("skills", key, skill.strip()))
+            self.bitmaps["skills"][skill_codes[-1]][word] |= bit
+        self.slot_skill_codes.extend([()] * (slot + 1 - len(self.slot_skill_codes)))
+        self.slot_skill_codes[slot] = tuple(skill_codes)
+
+    def remove(self, slot: int):
+        word, bit = _bit(slot)
+        self.live[word] &= ~bit
+        for facet in CATEGORY_FACETS:
+            code = self.codes[facet][slot]
+            if code >= 0: self.bitmaps[facet][code][word] &= ~bit
+        for code in self.slot_skill_codes[slot]: self.bitmaps["skills"][code][word] &= ~bit
+
+    def empty(self) -> np.ndarray:
+        return np.zeros(_words(self.capacity), dtype=np.uint64)
+
+    def bits(self, facet: str, value: str) -> np.ndarray:
+        """Bitmap of slots with `value` (all zeros for a value no resume has)."""
+        code = self.code_of[facet].get(self.skill_key(value) if facet == "skills" else _facet_key(value))
+        return self.bitmaps[facet][code] if code is not None else self.empty()
+
+    def has(self, facet: str, value: str) -> bool:
+        return (self.skill_key(value) if facet == "skills" else _facet_key(value)) in self.code_of[facet]
+
+    def any_of(self, facet: str, values) -> np.ndarray:
+        values = [values] if isinstance(values, str) else list(values)
+        return np.bitwise_or.reduce([self.bits(facet, value) for value in values]) if values else self.empty()
+
+    def canonical(self, facet: str, values) -> list:
+        """The stored spelling of each known value, for filters handed on to Chroma."""
+        values = [values] if isinstance(values, str) else list(values)
+        return [self.values[facet][self.code_of[facet][_facet_key(value)]] for value in values if _facet_key(value) in self.code_of[facet]]
+
+    def years_between(self, min_years: float = None, max_years: float = None) -> np.ndarray:
+        passing = np.ones(len(self.years), dtype=bool)
+        if min_years is not None: passing &= self.years >= min_years
+        if max_years is not None: passing &= self.years <= max_years
+        return self.from_mask(passing)
+
+    def from_mask(self, mask: np.ndarray) -> np.ndarray:
+        padded = np.zeros(self.capacity, dtype=bool)
+        padded[:len(mask)] = mask
+        return np.packbits(padded, bitorder="little").view(np.uint64)
+
+    def from_slots(self, slots) -> np.ndarray:
+        mask = np.zeros(self.capacity, dtype=bool)
+        mask[slots if isinstance(slots, np.ndarray) else np.fromiter(slots, dtype=np.int64)] = True
+        return self.from_mask(mask)
+
+    def select(self, required: list = (), excluded: list = ()) -> np.ndarray:
+        """Live slots set in every `required` bitmap and in no `excluded` one."""
+        selected = self.live.copy()
+        for bitmap in required: selected &= bitmap
+        for bitmap in excluded: selected &= ~bitmap
+        return self.slots(selected)
+
+    def slots(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bitmap.view(np.uint8), bitorder="little")[:self.size])
+
+    def counts(self, slots: np.ndarray = None, limit: int = FACET_COUNTS_LIMIT) -> dict:
+        """Per-facet value counts (largest first, at most `limit` each) and years-of-experience thresholds over
+        `slots`, or over every live candidate when None."""
+        selected = self.live if slots is None else self.from_slots(slots)
+        facets = {}
+        for facet in FACETS:
+            totals = np.asarray([int(np.bitwise_count(bitmap & selected).sum()) for bitmap in self.bitmaps[facet]], dtype=np.int64)
+            order = [code for code in np.argsort(-totals, kind="stable")[:limit] if totals[code]]
+            facets[facet] = {self.values[facet][code]: int(totals[code]) for code in order}
+        years = self.years[self.slots(selected)]
+        return {"total": int(np.bitwise_count(selected).sum()), "facets": facets,
+                "years_of_experience": {f"{threshold}+": int(np.count_nonzero(years >= threshold)) for threshold in YEARS_THRESHOLDS}}
+
+    def stats(self) -> dict:
+        return {"rows": self.size, "values": {facet: len(values) for facet, values in self.values.items()},
+                "bitmap_bytes": sum(bitmap.nbytes for bitmaps in self.bitmaps.values() for bitmap in bitmaps)}
@@ -0,0 +1,110 @@
+import json
+import os
+import re
+
+from lexical_index import tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_CHUNKS_PER_CANDIDATE = int(os.getenv("CONTEXT_CHUNKS_PER_CANDIDATE", "2"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+
+SECTION_TITLES = {"summary": "Summary", "profile": "Summary", "professional summary": "Summary", "objective": "Summary", "about me": "Summary",
+                  "experience": "Experience", "work experience": "Experience", "professional experience": "Experience", "employment history": "Experience",
+                  "work history": "Experience", "projects": "Experience", "skills": "Skills", "technical skills": "Skills", "core competencies": "Skills",
+                  "education": "Education", "certifications": "Education", "education and certifications": "Education"}
+# "**Summary:**", "**Skills**:", "## Experience", or a bare "EDUCATION" line.
+HEADING_PATTERN = re.compile(r"^[ \t]*(?:#{1,4}[ \t]*)?(?:\*\*)?[ \t]*(?P<title>" + "|".join(sorted(map(re.escape, SECTION_TITLES), key=len, reverse=True))
+                             + r")[ \t]*(?:(?:\*\*)?[ \t]*:[ \t]*(?:\*\*)?|(?:\*\*)?[ \t]*$)", re.IGNORECASE | re.MULTILINE)
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prose; close enough to budget without a tokenizer dependency.
+    return len(text) // 4 + 1
+
+def split_sections(raw_text: str) -> list:
+    """[(section, text)] in document order. Text before the first heading (name and contact lines) is "Header";
+    a resume without recognizable headings comes back as one "Body" section."""
+    matches = list(HEADING_PATTERN.finditer(raw_text))
+    if not matches: return [("Body", raw_text.strip())] if raw_text.strip() else []
+    sections = [("Header", raw_text[:matches[0].start()].strip())]
+    for match, following in zip(matches, matches[1:] + [None]):
+        sections.append((SECTION_TITLES[match.group("title").lower()], raw_text[match.end():following.start() if following else len(raw_text)].strip()))
+    return [(section, text) for section, text in sections if text]
+
+def _windows(text: str, max_tokens: int):
+    window = []
+    for line in text.splitlines():
+        while estimate_tokens(line) > max_tokens:
+            yield from (["\n".join(window)] if window else [])
+            window = []
+            yield line[:max_tokens * 4]
+            line = line[max_tokens * 4:]
+        if window and estimate_tokens("\n".join(window + [line])) > max_tokens:
+            yield "\n".join(window)
+            window = []
+        if line.strip(): window.append(line)
+    if window: yield "\n".join(window)
+
+def chunk_resume(raw_text: str, skills=None, max_tokens: int = CHUNK_MAX_TOKENS) -> list:
+    """Section-aware chunks [{"section", "position", "text"}]. The header is left out (name and contact details
+    travel as candidate fields) and long sections are split on line boundaries into `max_tokens` windows.
+    Skills from metadata become a Skills chunk when the text has no such section."""
+    sections = [(section, text) for section, text in split_sections(raw_text) if section != "Header"]
+    skills = ", ".join(skills) if isinstance(skills, list) else (skills or "")
+    if skills and not any(section == "Skills" for section, _ in sections): sections.append(("Skills", skills))
+    chunks = []
+    for section, text in sections:
+        for window in _windows(text, max_tokens):
+            chunks.append({"section": section, "position": len(chunks), "text": window})
+    return chunks
+
+def _overlap_scored(query: str, raw_text: str) -> list:
+    # For candidates indexed before chunking existed: rank on-the-fly chunks by query term overlap.
+    query_terms = set(tokenize(query))
+    return [(len(query_terms & set(tokenize(chunk["text"]))) / (len(query_terms) or 1), chunk["position"], chunk["section"], chunk["text"])
+            for chunk in chunk_resume(raw_text)]
+
+def _context_entry(candidate: dict, chunks: list) -> dict:
+    entry = {field: candidate[field] for field in ("name", "contact_information", "resume_pdf_url", "sources") if field in candidate}
+    entry["resume_excerpts"] = "\n".join(f"{section}: {text}" for _, section, text in sorted(chunks, key=lambda chunk: chunk[0]))
+    return entry
+
+def build_context(query: str, candidates: list, scored_chunks: dict, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  max_chunks: int = CONTEXT_CHUNKS_PER_CANDIDATE, key=lambda candidate: candidate.get("resume_id")) -> tuple:
+    """Picks the most query-relevant chunks per candidate under `token_budget`. `scored_chunks` maps resume_id
+    to [(score, position, section, text)]. Candidates are taken in rank order, each at most once: every one
+    first gets its best chunk while the budget allows, then further chunks are added round-robin up to
+    `max_chunks` each. Returns (context candidates for the prompt, stats)."""
+    ranked, seen = [], set()
+    for candidate in candidates:
+        candidate_key = key(candidate) or candidate.get("name")
+        if candidate_key in seen: continue
+        seen.add(candidate_key)
+        chunks = scored_chunks.get(candidate.get("resume_id")) or _overlap_scored(query, candidate.get("raw_resume_text", ""))
+        ranked.append((candidate, sorted(chunks, key=lambda chunk: (-chunk[0], chunk[1]))))
+    remaining = token_budget
+    selected = []
+    for candidate, chunks in ranked:
+        cost = estimate_tokens(json.dumps(_context_entry(candidate, [])))
+        best = chunks[:1]
+        if best and cost + estimate_tokens(best[0][3]) > remaining and not selected:
+            # The top candidate always makes it in, with its best chunk cut to whatever budget is left.
+            score, position, section, text = best[0]
+            best = [(score, position, section, text[:max(0, remaining - cost - 1) * 4])]
+        cost += sum(estimate_tokens(chunk[3]) for chunk in best)
+        if cost > remaining and selected: continue
+        remaining -= cost
+        selected.append((candidate, chunks, [(chunk[1], chunk[2], chunk[3]) for chunk in best]))
+    for round_index in range(1, max_chunks):
+        added = False
+        for candidate, chunks, picked in selected:
+            if round_index >= len(chunks): continue
+            cost = estimate_tokens(chunks[round_index][3])
+            if cost > remaining: continue
+            remaining -= cost
+            picked.append(chunks[round_index][1:])
+            added = True
+        if not added: break
+    context = [_context_entry(candidate, picked) for candidate, _, picked in selected]
+    stats = {"budget": token_budget, "tokens": token_budget - remaining, "raw_tokens": sum(estimate_tokens(json.dumps({k: v for k, v in candidate.items() if k != "resume_id"})) for candidate, _ in ranked),
+             "candidates": len(context), "dropped": len(ranked) - len(context), "chunks": sum(len(picked) for _, _, picked in selected)}
+    return context, stats
@@ -1,18 +1,55 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
 import json
+import jsonschema
+import multiprocessing
 import os
-import uuid
 import chromadb
-import io
-import fitz # PyMuPDF
-from openai import OpenAI
-from anthropic import Anthropic
-import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI
+from anthropic import AsyncAnthropic
+import re
+import weakref
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from embedding_cache import EmbeddingCache
+from fakes import FakeEmbedder, FakeDriveService, AsyncFakeClaude
+from drive_ingest import DriveIngestionEngine, DRIVE_SYNC_BUDGET_SECONDS
+from search_cache import SearchResponseCache, CorpusVersions
+from query_planner import QueryPlanner, PLANNER_MODE, PLANNER_CONFIDENCE_THRESHOLD
+from lexical_index import LexicalIndex, metadata_fingerprint, normalize_skill, skill_set, years_of_experience
+from reranker import Reranker, RERANK_POOL_SIZE
+from context_builder import build_context, chunk_resume, estimate_tokens
+from index_snapshot import SnapshotManager
+import metrics
+import pdf_text
 
 COLLECTION_NAME = "lark_static_resumes"
 GDRIVE_COLLECTION_NAME = "gdrive_resumes"
 DATABASE_DIR = "./lark_db"
+CLAUDE_MODEL = "claude-3-haiku-20240307"
+FEDERATED_SOURCE_TIMEOUT_SECONDS = float(os.getenv("FEDERATED_SOURCE_TIMEOUT_SECONDS", "30"))
+FEDERATED_OVERFETCH = 2  # each source contributes up to 2x num_results before fusion
+RRF_K = 60
+# Batch searches run at most this many per-requisition analyses at once (on top of the per-worker Anthropic limit).
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+# Texts per embeddings request and its approximate token budget (OpenAI allows 2048 inputs and 300k tokens).
+EMBED_REQUEST_MAX_INPUTS = int(os.getenv("EMBED_REQUEST_MAX_INPUTS", "512"))
+EMBED_REQUEST_MAX_TOKENS = int(os.getenv("EMBED_REQUEST_MAX_TOKENS", "250000"))
+
+# Per-upstream bounds for the async request path: at most `concurrency` calls in flight per worker,
+# each abandoned after `timeout` seconds so one slow dependency can't pin every request.
+UPSTREAM_LIMITS = {
+    "openai": {"concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")), "timeout": float(os.getenv("OPENAI_TIMEOUT_SECONDS", "20"))},
+    "anthropic": {"concurrency": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16")), "timeout": float(os.getenv("ANTHROPIC_TIMEOUT_SECONDS", "90"))},
+    "chroma": {"concurrency": int(os.getenv("CHROMA_MAX_CONCURRENCY", "8")), "timeout": float(os.getenv("CHROMA_TIMEOUT_SECONDS", "15"))},
+    "drive": {"concurrency": int(os.getenv("DRIVE_MAX_CONCURRENCY", "8")), "timeout": float(os.getenv("DRIVE_TIMEOUT_SECONDS", "60"))},
+    "pdf": {"concurrency": int(os.getenv("PDF_MAX_CONCURRENCY", str(os.cpu_count() or 2))), "timeout": float(os.getenv("PDF_TIMEOUT_SECONDS", "30"))},
+}
 
 STATIC_RESUME_DATA = [
     {"id": "dev-001", "name": "Alice Anderson", "email": "alice.a@example.com", "phone": "(123) 555-0101", "pdf_url": "https://example.com/resumes/dev-001.pdf", "job_title": "Senior Software Engineer", "industry": "Tech", "level": "Senior", "skills": ["Python", "AWS", "SQL", "DevOps", "FastAPI"], "raw_text": "Alice Anderson | Senior Software Engineer with 8 years of experience in the Tech industry. Expert in Python, AWS cloud services, and building scalable backend systems with FastAPI. Proven track record in leading DevOps practices and database management with SQL."},
@@ -21,173 +58,1034 @@ STATIC_RESUME_DATA = [
 ]
 
 global_client_openai = None
-global_client_anthropic = None
+global_async_client_openai = None
+global_async_client_anthropic = None
 chroma_client = None
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv("IO_THREAD_POOL_SIZE", "32")), thread_name_prefix="core-io")
+pdf_executor = None
+# Per event loop: asyncio semaphores bind to the loop that first waits on them, and the synchronous entry points
+# run searches on loops of their own.
+_upstream_semaphores = weakref.WeakKeyDictionary()
+embedding_cache = EmbeddingCache()
+fake_embedder = FakeEmbedder()
+fake_drive_service = FakeDriveService()
+search_cache = SearchResponseCache()
+corpus_versions = CorpusVersions()
+index_snapshots = SnapshotManager()
 
 def initialize_api_clients():
-    global global_client_openai, global_client_anthropic
+    global global_client_openai, global_async_client_openai, global_async_client_anthropic
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-    global_client_openai = OpenAI(api_key=OPENAI_API_KEY)
-    global_client_anthropic = Anthropic(api_key=ANTHROPIC_API_KEY)
+    # The "fake" backends (see fakes.py) let the whole service run offline, e.g. under benchmark.py.
+    if os.getenv("EMBEDDING_BACKEND") != "fake":
+        global_client_openai = OpenAI(api_key=OPENAI_API_KEY)
+        global_async_client_openai = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=UPSTREAM_LIMITS["openai"]["timeout"])
+    if os.getenv("LLM_BACKEND") == "fake":
+        global_async_client_anthropic = AsyncFakeClaude()
+    else:
+        global_async_client_anthropic = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, timeout=UPSTREAM_LIMITS["anthropic"]["timeout"])
     print("DEBUG: OpenAI and Anthropic clients initialized.")
 
+def get_pdf_executor():
+    # PyMuPDF holds the GIL while parsing, so extraction goes to a separate process pool. Spawned rather than
+    # forked: the API process already runs threads (and Chroma's native clients) that don't survive a fork.
+    global pdf_executor
+    if pdf_executor is None:
+        pdf_executor = ProcessPoolExecutor(max_workers=UPSTREAM_LIMITS["pdf"]["concurrency"], mp_context=multiprocessing.get_context("spawn"))
+    return pdf_executor
+
+def shutdown_executors():
+    global pdf_executor
+    if pdf_executor is not None:
+        pdf_executor.shutdown(wait=False, cancel_futures=True)
+        pdf_executor = None
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    drive_engine.shutdown()
+
+def _upstream_semaphore(upstream: str) -> asyncio.Semaphore:
+    semaphores = _upstream_semaphores.setdefault(asyncio.get_running_loop(), {})
+    semaphore = semaphores.get(upstream)
+    if semaphore is None: semaphore = semaphores[upstream] = asyncio.Semaphore(UPSTREAM_LIMITS[upstream]["concurrency"])
+    return semaphore
+
+async def _limited(upstream: str, awaitable_factory):
+    limits = UPSTREAM_LIMITS[upstream]
+    async with _upstream_semaphore(upstream):
+        try:
+            return await asyncio.wait_for(awaitable_factory(), timeout=limits["timeout"])
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{upstream} call timed out after {limits['timeout']}s") from None
+
+async def _run_in_thread(upstream: str, fn, *args, **kwargs):
+    """Runs `fn` on io_executor under the upstream's concurrency limit and timeout. A thread can't be cancelled, so a
+    caller that times out (or is cancelled) stops waiting while the permit stays taken until the thread finishes;
+    otherwise timed-out calls would keep piling threads onto the upstream past its limit."""
+    limits = UPSTREAM_LIMITS[upstream]
+    semaphore = _upstream_semaphore(upstream)
+    await semaphore.acquire()
+    try:
+        # run_in_executor doesn't carry contextvars over; copying them keeps the thread's spans in the caller's request trace.
+        future = asyncio.get_running_loop().run_in_executor(io_executor, functools.partial(contextvars.copy_context().run, fn, *args, **kwargs))
+    except BaseException:
+        semaphore.release()
+        raise
+    future.add_done_callback(functools.partial(_release_thread_permit, semaphore))
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout=limits["timeout"])
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{upstream} call timed out after {limits['timeout']}s") from None
+
+def _release_thread_permit(semaphore: asyncio.Semaphore, future: asyncio.Future):
+    semaphore.release()
+    if not future.cancelled(): future.exception()  # retrieved, so an abandoned call's error isn't logged as never retrieved
+
 def initialize_chroma_client():
     global chroma_client
     chroma_client = chromadb.PersistentClient(path=DATABASE_DIR)
     print(f"DEBUG: Persistent ChromaDB client initialized at path: {DATABASE_DIR}")
 
-def get_embedding(text, model="text-embedding-3-small"):
+def _embedding_requests(texts: list):
+    """Consecutive slices of `texts` that each fit in one embeddings request (EMBED_REQUEST_MAX_INPUTS inputs and
+    about EMBED_REQUEST_MAX_TOKENS tokens; OpenAI rejects requests over 2048 inputs or 300k tokens)."""
+    start, tokens = 0, 0
+    for end, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if end > start and (end - start >= EMBED_REQUEST_MAX_INPUTS or tokens + cost > EMBED_REQUEST_MAX_TOKENS):
+            yield texts[start:end]
+            start, tokens = end, 0
+        tokens += cost
+    if start < len(texts): yield texts[start:]
+
+def _embed_request(texts: list, model: str) -> list:
+    if os.getenv("EMBEDDING_BACKEND") == "fake": return fake_embedder.embed(texts, model)
     if global_client_openai is None: raise RuntimeError("OpenAI client not initialized.")
-    text = text.replace("\n", " ")
-    return global_client_openai.embeddings.create(input=[text], model=model).data[0].embedding
+    response = global_client_openai.embeddings.create(input=texts, model=model)
+    metrics.record_embedding_tokens(response.usage.total_tokens)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def _embed_uncached(texts: list, model: str) -> list:
+    return [embedding for request in _embedding_requests(texts) for embedding in _embed_request(request, model)]
+
+def _cache_model(model: str) -> str:
+    # Fake vectors are keyed apart from the real model's, so a shared cache never serves them as real embeddings.
+    return f"fake:{fake_embedder.dim}" if os.getenv("EMBEDDING_BACKEND") == "fake" else model
+
+def get_embeddings(texts: list, model="text-embedding-3-small") -> list:
+    return embedding_cache.get_many(texts, _cache_model(model), _embed_uncached)
+
+def get_embedding(text, model="text-embedding-3-small"):
+    with metrics.span("embedding"):
+        return embedding_cache.get(text, _cache_model(model), _embed_uncached)
+
+async def _embed_request_async(texts: list, model: str) -> list:
+    if os.getenv("EMBEDDING_BACKEND") == "fake": return fake_embedder.embed(texts, model)
+    if global_async_client_openai is None: raise RuntimeError("OpenAI client not initialized.")
+    response = await _limited("openai", lambda: global_async_client_openai.embeddings.create(input=texts, model=model))
+    metrics.record_embedding_tokens(response.usage.total_tokens)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+async def _embed_uncached_async(texts: list, model: str) -> list:
+    responses = await asyncio.gather(*(_embed_request_async(request, model) for request in _embedding_requests(texts)))
+    return [embedding for embeddings in responses for embedding in embeddings]
+
+async def get_embeddings_async(texts: list, model="text-embedding-3-small") -> list:
+    return await embedding_cache.aget_many(texts, _cache_model(model), _embed_uncached_async)
+
+async def get_embedding_async(text, model="text-embedding-3-small"):
+    with metrics.span("embedding"):
+        return (await get_embeddings_async([text], model))[0]
+
+def resume_to_metadata(resume: dict) -> dict:
+    raw_text = resume.get("raw_text", "")
+    email_match = re.search(r"Email:\s*([^\s|]+)", raw_text)
+    phone_match = re.search(r"Phone:\s*([^\n|]+)", raw_text)
+    skills = resume.get("skills", [])
+    return {"resume_id": resume["id"], "name": resume.get("name", ""),
+            "email": resume.get("email") or (email_match.group(1) if email_match else ""),
+            "phone": resume.get("phone") or (phone_match.group(1).strip() if phone_match else ""),
+            "pdf_url": resume.get("pdf_url", ""), "job_title": resume.get("job_title", ""), "level": resume.get("level", ""),
+            "industry": resume.get("industry", ""), "skills": ", ".join(skills) if isinstance(skills, list) else skills,
+            "content_hash": hashlib.sha256(raw_text.encode("utf-8")).hexdigest()[:16]}
+
+def chunk_collection_name(collection_name: str) -> str:
+    return f"{collection_name}_chunks"
+
+def embed_resume_chunks(ids: list, documents: list, metadatas: list) -> dict:
+    """The section chunks of these resumes as upsert columns, embedded (in API-sized requests) like any resume.
+    Chunks keep the parent's id in `parent_id` (and `user_id` for Drive partitions)."""
+    chunks = {"ids": [], "documents": [], "metadatas": []}
+    for record_id, document, metadata in zip(ids, documents, metadatas):
+        for chunk in chunk_resume(document, metadata.get("skills")):
+            chunks["ids"].append(f"{record_id}#{chunk['position']}")
+            chunks["documents"].append(chunk["text"])
+            chunks["metadatas"].append({"parent_id": record_id, "section": chunk["section"], "position": chunk["position"],
+                                        **({"user_id": metadata["user_id"]} if metadata.get("user_id") else {})})
+    chunks["embeddings"] = get_embeddings(chunks["documents"])
+    return chunks
+
+def write_resume_chunks(collection_name: str, parent_ids: list, chunks: dict):
+    """Replaces the chunks of `parent_ids` in the collection's `_chunks` child collection with `chunks`."""
+    chunk_collection = chroma_client.get_or_create_collection(name=chunk_collection_name(collection_name))
+    delete_resume_chunks(collection_name, parent_ids)
+    # A few chunks per resume can push one write batch past Chroma's own limit, so upsert in slices of that size.
+    step = getattr(chroma_client, "get_max_batch_size", lambda: len(chunks["ids"]))() or len(chunks["ids"]) or 1
+    for start in range(0, len(chunks["ids"]), step):
+        chunk_collection.upsert(**{column: values[start:start + step] for column, values in chunks.items()})
+
+def index_resume_chunks(collection_name: str, ids: list, documents: list, metadatas: list):
+    """Embeds and replaces the section chunks of these resumes. Writers call this before upserting the resumes
+    themselves, so a failure leaves the resumes unwritten and a rerun (which skips existing resumes) indexes both.
+    Everything is embedded before the old chunks are touched."""
+    write_resume_chunks(collection_name, ids, embed_resume_chunks(ids, documents, metadatas))
+
+def delete_resume_chunks(collection_name: str, ids: list):
+    chroma_client.get_or_create_collection(name=chunk_collection_name(collection_name)).delete(where={"parent_id": {"$in": list(ids)}})
 
 def initialize_database():
     if chroma_client is None: raise RuntimeError("Chroma client not initialized.")
+    if index_snapshots.current() is not None:
+        # Lark's Database is served from the prebuilt snapshot: no seeding, no embedding calls at boot.
+        print(f"Serving Lark's Database from index snapshot {index_snapshots.version()}.")
+        # Maps the snapshot's lexical index (or builds it, for a snapshot without one) before the first request.
+        lexical_index.ensure_fresh()
+        query_planner.ensure_fresh()
+        return
     collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
     if collection.count() == 0:
         print(f"Database collection '{COLLECTION_NAME}' is empty. Populating with static data...")
         resumes_data = STATIC_RESUME_DATA
-        for resume in resumes_data:
-            collection.add(
-                embeddings=[get_embedding(resume["raw_text"])],
-                documents=[resume["raw_text"]],
-                metadatas=[{"resume_id": resume["id"], "name": resume["name"], "email": resume["email"], "phone": resume["phone"], "pdf_url": resume["pdf_url"], "job_title": resume["job_title"], "level": resume["level"], "industry": resume["industry"], "skills": ", ".join(resume["skills"])}],
-                ids=[resume["id"]]
-            )
+        index_resume_chunks(COLLECTION_NAME, [resume["id"] for resume in resumes_data], [resume["raw_text"] for resume in resumes_data], [resume_to_metadata(resume) for resume in resumes_data])
+        collection.add(
+            embeddings=get_embeddings([resume["raw_text"] for resume in resumes_data]),
+            documents=[resume["raw_text"] for resume in resumes_data],
+            metadatas=[resume_to_metadata(resume) for resume in resumes_data],
+            ids=[resume["id"] for resume in resumes_data]
+        )
+        corpus_versions.bump(COLLECTION_NAME)
         print(f"Successfully added {len(resumes_data)} static resumes to ChromaDB.")
     else:
         print(f"Static database already initialized with {collection.count()} resumes.")
 
-def resume_search_tool(query: str, num_results: int = 5, level: str = None, industry: str = None) -> list[dict]:
-    if chroma_client is None: raise RuntimeError("Chroma client not initialized.")
-    collection = chroma_client.get_collection(name=COLLECTION_NAME)
-    embedding = get_embedding(query)
+def _facet_values(value) -> tuple:
+    # level/industry/job_title filters take one value or a list of accepted values.
+    return tuple(sorted({value} if isinstance(value, str) else set(value))) if value else ()
+
+def _build_where_filter(level=None, industry=None, job_title=None, canonical=lambda facet, values: list(values)):
     filter_conditions = []
-    if level: filter_conditions.append({"level": {"$eq": level}})
-    if industry: filter_conditions.append({"industry": {"$eq": industry}})
-    where_filter = None
-    if len(filter_conditions) > 1: where_filter = {"$and": filter_conditions}
-    elif len(filter_conditions) == 1: where_filter = filter_conditions[0]
-    results = collection.query(query_embeddings=[embedding], n_results=num_results, where=where_filter, include=['metadatas', 'documents'])
+    for facet, value in (("level", level), ("industry", industry), ("job_title", job_title)):
+        values = canonical(facet, _facet_values(value))
+        if len(values) == 1: filter_conditions.append({facet: {"$eq": values[0]}})
+        elif values: filter_conditions.append({facet: {"$in": values}})
+    if len(filter_conditions) > 1: return {"$and": filter_conditions}
+    elif len(filter_conditions) == 1: return filter_conditions[0]
+    return None
+
+def _format_candidates(results: dict) -> list[dict]:
     candidates_data = []
     if results and results['ids'] and results['ids'][0]:
         print(f"Tool: Found {len(results['ids'][0])} potential candidates matching filters.")
         for i, metadata in enumerate(results['metadatas'][0]):
-            candidates_data.append({"name": metadata.get("name"), "contact_information": {"email": metadata.get("email"), "phone": metadata.get("phone")}, "resume_pdf_url": metadata.get("pdf_url"), "raw_resume_text": results['documents'][0][i]})
+            candidates_data.append({"resume_id": results['ids'][0][i], "name": metadata.get("name"), "contact_information": {"email": metadata.get("email"), "phone": metadata.get("phone")}, "resume_pdf_url": metadata.get("pdf_url"), "raw_resume_text": results['documents'][0][i]})
     else:
         print("Tool: No candidates found for the query with the specified filters.")
         return [{"message": "No candidates found matching the search criteria and filters."}]
     return candidates_data
 
+def _collection_pages(collection_name: str, include: list, page_size: int = 5000):
+    collection = chroma_client.get_collection(name=collection_name)
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=page_size, offset=offset)
+        yield page
+        if len(page["ids"]) < page_size: return
+        offset += page_size
+
+def _collection_metadatas(collection_name: str):
+    for page in _collection_pages(collection_name, ["metadatas"]): yield from page["metadatas"]
+
+def _collection_fingerprints(collection_name: str):
+    for page in _collection_pages(collection_name, ["metadatas"]): yield from zip(page["ids"], map(metadata_fingerprint, page["metadatas"]))
+
+def _collection_records(collection_name: str, ids: list = None, page_size: int = 2000):
+    if ids is None:
+        pages = _collection_pages(collection_name, ["documents", "metadatas"], page_size)
+    else:
+        collection = chroma_client.get_collection(name=collection_name)
+        pages = (collection.get(ids=ids[start:start + page_size], include=["documents", "metadatas"]) for start in range(0, len(ids), page_size))
+    for page in pages: yield from zip(page["ids"], page["documents"], page["metadatas"])
+
+# Lark's Database reads go to the mapped snapshot when one is published (INDEX_SNAPSHOT_DIR), otherwise to Chroma.
+def _lark_fingerprints():
+    snapshot = index_snapshots.current()
+    return zip(snapshot.ids, (metadata_fingerprint(snapshot.metadata(row)) for row in range(snapshot.count))) if snapshot else _collection_fingerprints(COLLECTION_NAME)
+
+def _lark_records(ids: list = None):
+    snapshot = index_snapshots.current()
+    return snapshot.iter_records(ids) if snapshot else _collection_records(COLLECTION_NAME, ids)
+
+def _lark_metadatas():
+    snapshot = index_snapshots.current()
+    if snapshot and snapshot.lexical:
+        # The planner only needs the distinct values, which the snapshot already lists per facet.
+        return ({facet: value} for facet, values in snapshot.facet_values.items() for value in values)
+    return (snapshot.metadata(row) for row in range(snapshot.count)) if snapshot else _collection_metadatas(COLLECTION_NAME)
+
+def _lark_version():
+    snapshot = index_snapshots.current()
+    return f"snapshot:{snapshot.version}" if snapshot else corpus_versions.get(COLLECTION_NAME)
+
+async def _lark_version_async():
+    snapshot = index_snapshots.current()
+    return f"snapshot:{snapshot.version}" if snapshot else await corpus_versions.aget(COLLECTION_NAME)
+
+lexical_index = LexicalIndex(fingerprint_loader=_lark_fingerprints, document_loader=_lark_records, version_fn=_lark_version, snapshot_loader=index_snapshots.current)
+
+reranker = Reranker()
+
+def _snapshot_records(snapshot, rows) -> dict:
+    return {record_id: (metadata, document, vector_embedding) for record_id, metadata, document, vector_embedding in snapshot.records(rows)}
+
+_slot_rows = None  # (key, slot -> snapshot row map)
+
+def _snapshot_rows(snapshot, slots: np.ndarray) -> np.ndarray:
+    """Sorted snapshot rows of lexical index slots, via a slot -> row map rebuilt when the snapshot or the index changes."""
+    global _slot_rows
+    if lexical_index.mapped == snapshot.version: return slots  # the index was mapped from this snapshot: slot == row
+    key = (snapshot.version, lexical_index.store, len(lexical_index.ids))
+    cached = _slot_rows
+    if cached is None or cached[0] != key:
+        cached = _slot_rows = (key, np.fromiter((-1 if row is None else row for row in map(snapshot.row_of, lexical_index.ids[:key[2]])), dtype=np.int64, count=key[2]))
+    rows = cached[1][slots]
+    return np.sort(rows[rows >= 0])
+
+def _vector_pools(snapshot, embeddings: list, pool: int, allowed, where: dict = None) -> list:
+    """[{id: (metadata, document, embedding)}] with the `pool` nearest resumes per query embedding, from the mapped
+    snapshot or from Chroma. All queries go through one multi-vector pass, since they share the same constraints.
+    Chroma gets `where` when the constraints are plain metadata filters and the allowed ids otherwise."""
+    if snapshot is not None:
+        with metrics.span("snapshot_query", version=snapshot.version, queries=len(embeddings)):
+            rows = None if allowed is None else _snapshot_rows(snapshot, allowed)
+            return [_snapshot_records(snapshot, nearest) for nearest in snapshot.nearest_many(embeddings, pool, rows)]
+    include = ["metadatas", "documents", "embeddings"]
+    collection = chroma_client.get_collection(name=COLLECTION_NAME)
+    with metrics.span("chroma_query", collection=COLLECTION_NAME, queries=len(embeddings)):
+        if allowed is not None and where is None:
+            vector = collection.query(query_embeddings=embeddings, n_results=pool, ids=[lexical_index.ids[slot] for slot in allowed], include=include)
+        else:
+            vector = collection.query(query_embeddings=embeddings, n_results=pool, where=where, include=include)
+    return [{record_id: (metadata, document, vector_embedding) for record_id, metadata, document, vector_embedding in zip(*columns)}
+            for columns in zip(vector["ids"], vector["metadatas"], vector["documents"], vector["embeddings"])]
+
+def _fetch_records(snapshot, ids: list) -> dict:
+    if snapshot is not None: return _snapshot_records(snapshot, snapshot.rows(ids))
+    with metrics.span("chroma_get", collection=COLLECTION_NAME):
+        fetched = chroma_client.get_collection(name=COLLECTION_NAME).get(ids=ids, include=["metadatas", "documents", "embeddings"])
+    return {record_id: (metadata, document, vector_embedding) for record_id, metadata, document, vector_embedding
+            in zip(fetched["ids"], fetched["metadatas"], fetched["documents"], fetched["embeddings"])}
+
+def _empty_query_result() -> dict:
+    return {"ids": [[]], "metadatas": [[]], "documents": [[]]}
+
+def _rerank_pool(snapshot, query: str, embedding: list, num_results: int, records: dict, allowed, pool: int, level=None, industry=None,
+                 must_have_skills: list = None, min_years: float = None) -> dict:
+    with metrics.span("bm25"):
+        lexical_scores = lexical_index.bm25_scores(query, allowed)
+        missing = [record_id for record_id, _ in lexical_index.top(lexical_scores, pool) if record_id not in records]
+    if missing: records.update(_fetch_records(snapshot, missing))
+    if not records: return _empty_query_result()
+    ids = list(records)
+    metadatas = [records[record_id][0] for record_id in ids]
+    slots = [lexical_index.slot_of.get(record_id) for record_id in ids]
+    plan = query_planner.plan(query)
+    # Records the index hasn't caught up with yet get their skills and years parsed on the spot.
+    with metrics.span("rerank", candidates=len(ids)):
+        scores = reranker.score(np.asarray(embedding, dtype=np.float32), np.asarray([records[record_id][2] for record_id in ids], dtype=np.float32),
+                                lexical=np.asarray([lexical_scores.get(slot, 0.0) for slot in slots], dtype=np.float32),
+                                candidate_skills=[lexical_index.slot_skills[slot] if slot is not None else skill_set(metadata.get("skills")) for slot, metadata in zip(slots, metadatas)],
+                                levels=[metadata.get("level") for metadata in metadatas], industries=[metadata.get("industry") for metadata in metadatas],
+                                years=np.asarray([lexical_index.store.years[slot] if slot is not None else years_of_experience(records[record_id][1]) for slot, record_id in zip(slots, ids)], dtype=np.float32),
+                                query_skills={normalize_skill(skill) for skill in plan.skills + list(must_have_skills or [])}, level=level or plan.rank_level,
+                                industry=industry or plan.rank_industry, min_years=max(years_of_experience(query), min_years or 0.0))
+    ranked = [ids[i] for i in np.argsort(-scores, kind="stable")[:num_results]]
+    print(f"Tool: Reranked a pool of {len(ids)} candidates down to {len(ranked)}.")
+    return {"ids": [ranked], "metadatas": [[records[record_id][0] for record_id in ranked]], "documents": [[records[record_id][1] for record_id in ranked]]}
+
+FILTER_FIELDS = ("level", "industry", "job_title", "must_have_skills", "must_not_have_skills", "min_years", "max_years")
+
+def _filter_key(request: dict) -> tuple:
+    return tuple(request.get(field) if field.endswith("_years") else _facet_values(request.get(field)) for field in FILTER_FIELDS)
+
+def clean_filters(filters: dict) -> dict:
+    """resume_search_tool filters with empty fields dropped and lists sorted, so equal filters share cache keys."""
+    return {field: sorted(set(value)) if isinstance(value, (list, tuple, set)) else value for field, value in (filters or {}).items()
+            if field in FILTER_FIELDS and value not in (None, "", [], ())}
+
+def _apply_filters(tool_input: dict, filters: dict) -> dict:
+    # Explicit request filters replace the planner's (or Claude's) value for the same field; skill lists are merged.
+    merged = dict(tool_input)
+    for field, value in clean_filters(filters).items(): merged[field] = sorted(set(merged.get(field) or []) | set(value)) if field.endswith("_skills") else value
+    return merged
+
+def _allowed_and_where(filters: dict) -> tuple:
+    """(allowed slots or None, Chroma where filter or None) for resume_search_tool filters, evaluated on the
+    candidate store's bitmaps before any vector search."""
+    allowed = lexical_index.allowed_slots(**{field: list(value) if isinstance(value, tuple) else value for field, value in filters.items()})
+    metadata_only = not (filters["must_have_skills"] or filters["must_not_have_skills"]) and filters["min_years"] is None and filters["max_years"] is None
+    return allowed, (_build_where_filter(filters["level"], filters["industry"], filters["job_title"], lexical_index.store.canonical) if metadata_only else None)
+
+def _hybrid_query_many(requests: list, embeddings: list) -> list:
+    """Stage one pools up to RERANK_POOL_SIZE vector matches (restricted up front to the ids passing the facet,
+    skill and years constraints) with the top BM25 matches, fetching lexical-only hits by id. Stage two reranks
+    the whole pool and only the top `num_results` go on to the LLM. `requests` are resume_search_tool
+    arguments; requests with the same constraints share one multi-vector query."""
+    with metrics.span("index_refresh"):
+        lexical_index.ensure_fresh(background=True)
+        query_planner.ensure_fresh()
+    snapshot = index_snapshots.current()
+    groups = {}
+    for i, request in enumerate(requests): groups.setdefault(_filter_key(request), []).append(i)
+    results = [None] * len(requests)
+    # Slots handed from the filter to the pools and the reranker are only stable while no refresh can apply.
+    with lexical_index.reading():
+        _query_groups(snapshot, requests, embeddings, groups, results)
+    return results
+
+def _query_groups(snapshot, requests: list, embeddings: list, groups: dict, results: list):
+    for key, indexes in groups.items():
+        filters = dict(zip(FILTER_FIELDS, key))
+        with metrics.span("filter"): allowed, where = _allowed_and_where(filters)
+        if allowed is not None and not len(allowed):
+            for i in indexes: results[i] = _empty_query_result()
+            continue
+        pool = max(RERANK_POOL_SIZE, max(requests[i].get("num_results", 5) for i in indexes))
+        pools = _vector_pools(snapshot, [embeddings[i] for i in indexes], pool, allowed, where)
+        for i, records in zip(indexes, pools):
+            results[i] = _rerank_pool(snapshot, requests[i]["query"], embeddings[i], requests[i].get("num_results", 5), records, allowed, pool,
+                                      filters["level"], filters["industry"], list(filters["must_have_skills"]), filters["min_years"])
+
+def _hybrid_query(query: str, embedding: list, num_results: int, level=None, industry=None, must_have_skills: list = None, must_not_have_skills: list = None, **filters) -> dict:
+    return _hybrid_query_many([{"query": query, "num_results": num_results, "level": level, "industry": industry, "must_have_skills": must_have_skills,
+                                "must_not_have_skills": must_not_have_skills, **filters}], [embedding])[0]
+
+def resume_search_tool(query: str, num_results: int = 5, level=None, industry=None, must_have_skills: list = None, must_not_have_skills: list = None,
+                       job_title=None, min_years: float = None, max_years: float = None) -> list[dict]:
+    if chroma_client is None: raise RuntimeError("Chroma client not initialized.")
+    results = _hybrid_query(query, get_embedding(query), num_results, level, industry, must_have_skills, must_not_have_skills, job_title=job_title, min_years=min_years, max_years=max_years)
+    return _format_candidates(results)
+
+async def resume_search_tool_async(query: str, num_results: int = 5, level=None, industry=None, must_have_skills: list = None, must_not_have_skills: list = None,
+                                   job_title=None, min_years: float = None, max_years: float = None) -> list[dict]:
+    if chroma_client is None: raise RuntimeError("Chroma client not initialized.")
+    embedding = await get_embedding_async(query)
+    results = await _run_in_thread("chroma", _hybrid_query, query, embedding, num_results, level, industry, must_have_skills, must_not_have_skills,
+                                   job_title=job_title, min_years=min_years, max_years=max_years)
+    return _format_candidates(results)
+
+_ONE_OR_MANY = {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]}
+
 resume_search_tool_schema = {
-    "name": "resume_search_tool", "description": "Searches a resume database to find profiles matching a job query.",
-    "input_schema": {"type": "object", "properties": {"query": {"type": "string"}, "num_results": {"type": "integer"}, "level": {"type": "string"}, "industry": {"type": "string"}},"required": ["query"]}
+    "name": "resume_search_tool", "description": "Searches a resume database to find profiles matching a job query. level, industry and job_title accept one value or a list of accepted values. Skills in must_have_skills / must_not_have_skills and min_years / max_years (of experience) are hard filters; only use them for explicit requirements or exclusions.",
+    "input_schema": {"type": "object", "properties": {"query": {"type": "string"}, "num_results": {"type": "integer"}, "level": _ONE_OR_MANY, "industry": _ONE_OR_MANY, "job_title": _ONE_OR_MANY,
+                                                      "must_have_skills": {"type": "array", "items": {"type": "string"}}, "must_not_have_skills": {"type": "array", "items": {"type": "string"}},
+                                                      "min_years": {"type": "number"}, "max_years": {"type": "number"}},"required": ["query"]}
 }
 
-def search_lark_database(user_query: str, num_profiles_to_retrieve: int) -> dict:
-    print("--- Firing search against Lark's Database ---")
-    system_message = """You are an expert HR recruitment assistant. Use the `resume_search_tool` to find candidates. After using the tool, analyze the results and provide a summary. If the tool returns no candidates, inform the user clearly. YOUR FINAL OUTPUT MUST BE VALID JSON. Structure your response as follows:
-```json
-{
-  "overall_summary": "Overall summary of the search results and candidate quality.",
-  "candidates": [
-    {
-      "name": "Candidate Name",
-      "contact_information": {
-        "email": "candidate@example.com",
-        "phone": "(123) 555-1234"
-      },
-      "summary": "A concise summary of why this candidate is a good fit, referencing their skills and experience against the job query.",
-      "resume_pdf_url": "[https://example.com/resumes/candidate_id.pdf](https://example.com/resumes/candidate_id.pdf)"
-    }
-  ],
-  "overall_recommendation": "Final thoughts on the candidate pool."
+ANALYSIS_TOOL_NAME = "record_candidate_analysis"
+# Mirrors api_server.AnalysisResponse. The analysis calls force this tool, so the answer arrives as tool input instead of JSON in free text.
+ANALYSIS_TOOL = {
+    "name": ANALYSIS_TOOL_NAME, "description": "Records the final analysis of the retrieved candidates against the job query.",
+    "input_schema": {"type": "object", "required": ["overall_summary", "candidates", "overall_recommendation"], "properties": {
+        "overall_summary": {"type": "string", "description": "Overall summary of the search results and candidate quality."},
+        "candidates": {"type": "array", "items": {"type": "object", "required": ["name", "contact_information", "summary", "resume_pdf_url"], "properties": {
+            "name": {"type": "string"},
+            "contact_information": {"type": "object", "required": ["email", "phone"], "properties": {"email": {"type": "string"}, "phone": {"type": "string"}}},
+            "summary": {"type": "string", "description": "A concise summary of why this candidate is a good fit, referencing their skills and experience against the job query."},
+            "resume_pdf_url": {"type": "string", "description": "The candidate's resume_pdf_url, unchanged."}}}},
+        "overall_recommendation": {"type": "string", "description": "Final thoughts on the candidate pool."}}}
 }
-```"""
+analysis_validator = jsonschema.Draft202012Validator(ANALYSIS_TOOL["input_schema"])
+candidate_validator = jsonschema.Draft202012Validator(ANALYSIS_TOOL["input_schema"]["properties"]["candidates"]["items"])
+ANALYSIS_REPAIR_RETRIES = int(os.getenv("ANALYSIS_REPAIR_RETRIES", "1"))
+# Marks the static system prompt and tool definitions as a cacheable prefix (Anthropic prompt caching). Off by
+# default: that prefix is ~650 tokens, below the 2048-token minimum claude-3-haiku will cache, so the marker buys nothing
+# until the prompts grow or CLAUDE_MODEL moves to a model with a lower minimum (1024 for Sonnet/Opus).
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+ANALYSIS_INSTRUCTIONS = f"Record your analysis with the `{ANALYSIS_TOOL_NAME}` tool: an overall summary, one entry per candidate worth presenting with their contact information, a concise summary of their fit and their resume_pdf_url, and an overall recommendation."
+
+LARK_SYSTEM_MESSAGE = "You are an expert HR recruitment assistant. Use the `resume_search_tool` to find candidates. After using the tool, analyze the results and provide a summary. If the tool returns no candidates, inform the user clearly. " + ANALYSIS_INSTRUCTIONS
+
+FEDERATED_SYSTEM_MESSAGE = "You are an expert HR recruitment assistant. The user's job query is followed by candidate profiles retrieved from Lark's Database and from the user's own Google Drive, best matches first. Analyze them against the query and provide a summary. " + ANALYSIS_INSTRUCTIONS
+
+GDRIVE_SYSTEM_MESSAGE = "Analyze the following resume texts based on the user's query and provide a summary. " + ANALYSIS_INSTRUCTIONS
+
+def _cached_system(text: str):
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}] if PROMPT_CACHE_ENABLED else text
+
+def _cached_tools(tools: list) -> list:
+    # A cache breakpoint on the last tool covers every tool definition before it.
+    return tools[:-1] + [{**tools[-1], "cache_control": {"type": "ephemeral"}}] if PROMPT_CACHE_ENABLED else tools
+
+def _analysis_request(system: str, messages: list, tools: list = ()) -> dict:
+    return {"model": CLAUDE_MODEL, "max_tokens": 2000, "temperature": 0.5, "system": _cached_system(system), "messages": messages,
+            "tools": _cached_tools(list(tools) + [ANALYSIS_TOOL]), "tool_choice": {"type": "tool", "name": ANALYSIS_TOOL_NAME}}
+
+def _usage(response) -> dict:
+    # Cache counters are absent (or None) when the request had no cacheable prefix.
+    return {"input_tokens": response.usage.input_tokens, "output_tokens": response.usage.output_tokens,
+            "cache_read_input_tokens": getattr(response.usage, "cache_read_input_tokens", None) or 0,
+            "cache_creation_input_tokens": getattr(response.usage, "cache_creation_input_tokens", None) or 0}
+
+def _add_usage(usage: dict, more: dict) -> dict:
+    return {name: usage.get(name, 0) + more.get(name, 0) for name in {**usage, **more}}
+
+def _record_claude_call(call: str, response, attributes: dict):
+    usage = _usage(response)
+    attributes.update(usage)
+    metrics.record_llm_usage(call, **usage)
+
+async def _claude_async(call: str, request: dict):
+    with metrics.span("claude", call=call) as attributes:
+        response = await _limited("anthropic", lambda: global_async_client_anthropic.messages.create(**request))
+        _record_claude_call(call, response, attributes)
+    return response
+
+def _parse_analysis(response) -> tuple:
+    """(analysis, problem): the input of the forced analysis tool call, or a description of why it is unusable."""
+    with metrics.span("json_parse"):
+        block = next((block for block in response.content if block.type == "tool_use" and block.name == ANALYSIS_TOOL_NAME), None)
+        if block is None: return None, f"no `{ANALYSIS_TOOL_NAME}` call in the response (stop reason {response.stop_reason})"
+        errors = sorted(analysis_validator.iter_errors(block.input), key=lambda error: list(error.absolute_path))
+        if errors: return None, "; ".join(f"{'/'.join(map(str, error.absolute_path)) or '(root)'}: {error.message}" for error in errors[:5])
+        return block.input, None
+
+def _repair_request(request: dict, response, problem: str) -> dict:
+    # The rejected call is answered with an error tool_result, so the retry sees exactly what to fix.
+    block = next((block for block in response.content if block.type == "tool_use"), None)
+    feedback = f"The analysis was rejected: {problem}. Call `{ANALYSIS_TOOL_NAME}` again with input that matches its schema."
+    content = [{"type": "tool_result", "tool_use_id": block.id, "content": feedback, "is_error": True}] if block else feedback
+    return {**request, "messages": request["messages"] + [{"role": "assistant", "content": response.content}, {"role": "user", "content": content}]}
+
+def _analysis_outcome(analysis, problem: str, usage: dict, attempts: int) -> dict:
+    metrics.record_analysis_outcome("ok" if attempts == 1 and analysis is not None else "repaired" if analysis is not None else "failed")
+    if analysis is None: return {"status": "error", "message": f"The AI failed to produce a valid analysis for the found candidates: {problem}"}
+    return {"status": "success", "analysis_data": analysis, "usage": usage}
+
+async def _analyze_async(request: dict, response=None) -> dict:
+    response = response or await _claude_async("analysis", request)
+    usage, attempts = _usage(response), 1
+    analysis, problem = _parse_analysis(response)
+    while analysis is None and attempts <= ANALYSIS_REPAIR_RETRIES:
+        metrics.record_analysis_failure(retrying=True)
+        request = _repair_request(request, response, problem)
+        response = await _claude_async("analysis_repair", request)
+        usage, attempts = _add_usage(usage, _usage(response)), attempts + 1
+        analysis, problem = _parse_analysis(response)
+    if analysis is None: metrics.record_analysis_failure(retrying=False)
+    return _analysis_outcome(analysis, problem, usage, attempts)
+
+def _is_no_candidates(tool_output) -> bool:
+    return isinstance(tool_output, list) and len(tool_output) > 0 and tool_output[0].get("message", "").startswith("No candidates found")
+
+def _lark_empty_result() -> dict:
+    return {"status": "success", "analysis_data": {"overall_summary": "The initial search did not find any relevant candidates in the database for this query.", "candidates": [], "overall_recommendation": "Try broadening your search terms."}, "usage": {"input_tokens": 0, "output_tokens": 0}}
+
+def _lark_direct_result(response) -> dict:
+    return {"status": "success", "analysis_data": {"overall_summary": f"The AI provided a direct response: {response.content[0].text}", "candidates": [], "overall_recommendation": "No candidates were searched."}, "usage": _usage(response)}
+
+def _candidate_chunks(collection_names: list, candidates: list, query_embedding: list) -> dict:
+    ids = [candidate["resume_id"] for candidate in candidates if candidate.get("resume_id")]
+    scored = {}
+    if not ids: return scored
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    snapshot = index_snapshots.current()
+    for collection_name in collection_names:
+        if collection_name == COLLECTION_NAME and snapshot is not None:
+            scored.update(snapshot.scored_chunks(ids, query_vector))
+            continue
+        with metrics.span("chroma_get", collection=chunk_collection_name(collection_name)):
+            chunks = chroma_client.get_or_create_collection(name=chunk_collection_name(collection_name)).get(where={"parent_id": {"$in": ids}}, include=["documents", "metadatas", "embeddings"])
+        if not chunks["ids"]: continue
+        matrix = np.asarray(chunks["embeddings"], dtype=np.float32)
+        similarities = matrix @ query_vector / (np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0) + 1e-12)
+        for metadata, document, similarity in zip(chunks["metadatas"], chunks["documents"], similarities):
+            scored.setdefault(metadata["parent_id"], []).append((float(similarity), metadata["position"], metadata["section"], document))
+    return scored
+
+async def _analysis_context_async(query: str, candidates: list, collection_names: list) -> list:
+    if not candidates or _is_no_candidates(candidates): return candidates
+    scored = await _run_in_thread("chroma", _candidate_chunks, collection_names, candidates, await get_embedding_async(query))
+    with metrics.span("context_build") as attributes:
+        context, stats = build_context(query, candidates, scored, key=_candidate_fingerprint)
+        attributes.update(stats)
+    metrics.record_context_tokens(stats["tokens"], stats["raw_tokens"], stats["dropped"])
+    return context
+
+def _append_tool_round_trip(messages: list, response, tool_use, tool_output):
+    messages.append({"role": "assistant", "content": response.content})
+    messages.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": tool_use.id, "content": json.dumps(tool_output)}]})
+
+query_planner = QueryPlanner(metadata_loader=_lark_metadatas, version_fn=_lark_version)
+
+def _plan_is_confident(plan) -> bool:
+    return PLANNER_MODE != "llm" and plan.confidence >= PLANNER_CONFIDENCE_THRESHOLD
+
+def _use_local_plan(plan) -> bool:
+    use_local = _plan_is_confident(plan)
+    query_planner.counters["local" if use_local else "llm_fallback"] += 1
+    return use_local
+
+def _planned_analysis_messages(user_query: str, tool_input: dict, tool_output: list) -> list:
+    # Without a model-issued tool_use block to answer, the retrieved profiles go in as plain context.
+    return [{"role": "user", "content": f"{user_query}\n\n`resume_search_tool` was called with {json.dumps(tool_input)} and returned:\n{json.dumps(tool_output)}"}]
+
+def _llm_planning_request(messages: list) -> dict:
+    return {"model": CLAUDE_MODEL, "max_tokens": 2000, "temperature": 0.0, "tools": _cached_tools([resume_search_tool_schema]), "messages": messages, "system": _cached_system(LARK_SYSTEM_MESSAGE)}
+
+def _lark_analysis_request(messages: list) -> dict:
+    # resume_search_tool stays defined: the Claude-planned path has its tool_use block in the history.
+    return _analysis_request(LARK_SYSTEM_MESSAGE, messages, [resume_search_tool_schema])
+
+def _tool_use_block(response):
+    return next((block for block in response.content if block.type == "tool_use"), None)
+
+async def _plan_and_retrieve_async(user_query: str, num_profiles_to_retrieve: int, filters: dict = None) -> tuple:
+    await _run_in_thread("chroma", query_planner.ensure_fresh)
+    plan = query_planner.plan(user_query)
     messages = [{"role": "user", "content": user_query}]
+    if _use_local_plan(plan):
+        tool_input = _apply_filters(plan.tool_input(num_profiles_to_retrieve), filters)
+        if PLANNER_MODE == "compare":
+            response = await _claude_async("planning_compare", _llm_planning_request(messages))
+            tool_use = _tool_use_block(response)
+            query_planner.record_comparison(plan, tool_use.input if tool_use else {})
+        tool_output = await resume_search_tool_async(**tool_input)
+        return None, tool_input, tool_output, _planned_analysis_messages(user_query, tool_input, await _analysis_context_async(user_query, tool_output, [COLLECTION_NAME]))
+    response = await _claude_async("planning", _llm_planning_request(messages))
+    if response.stop_reason == "end_turn": return _lark_direct_result(response), None, None, None
+    tool_use = _tool_use_block(response)
+    if response.stop_reason != "tool_use": return {"status": "error", "message": f"Unexpected response from Claude with stop reason: {response.stop_reason}"}, None, None, None
+    if not tool_use: return {"status": "error", "message": "Claude indicated tool use, but no tool was specified."}, None, None, None
+    tool_input = _apply_filters(tool_use.input, filters)
+    tool_output = await resume_search_tool_async(**tool_input)
+    _append_tool_round_trip(messages, response, tool_use, await _analysis_context_async(tool_use.input.get("query", user_query), tool_output, [COLLECTION_NAME]))
+    return None, tool_input, tool_output, messages
+
+def search_lark_database(user_query: str, num_profiles_to_retrieve: int, filters: dict = None) -> dict:
+    # The synchronous entry points (scripts, notebooks, benchmarks) run the async search path to completion.
+    return asyncio.run(search_lark_database_async(user_query, num_profiles_to_retrieve, filters))
+
+async def search_lark_database_async(user_query: str, num_profiles_to_retrieve: int, filters: dict = None) -> dict:
+    print("--- Firing async search against Lark's Database ---")
     try:
-        response = global_client_anthropic.messages.create(model="claude-3-haiku-20240307", max_tokens=2000, temperature=0.0, tools=[resume_search_tool_schema], messages=messages, system=system_message)
-        if response.stop_reason == "tool_use":
-            tool_use = next((block for block in response.content if block.type == "tool_use"), None)
-            if not tool_use: return {"status": "error", "message": "Claude indicated tool use, but no tool was specified."}
-            tool_output = resume_search_tool(**tool_use.input)
-            if (isinstance(tool_output, list) and len(tool_output) > 0 and tool_output[0].get("message", "").startswith("No candidates found")):
-                return {"status": "success", "analysis_data": {"overall_summary": "The initial search did not find any relevant candidates in the database for this query.", "candidates": [], "overall_recommendation": "Try broadening your search terms."}, "usage": {"input_tokens": 0, "output_tokens": 0}}
-            messages.append({"role": "assistant", "content": response.content})
-            messages.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": tool_use.id, "content": json.dumps(tool_output)}]})
-            final_response = global_client_anthropic.messages.create(model="claude-3-haiku-20240307", max_tokens=2000, temperature=0.5, messages=messages, system=system_message)
-            json_string = final_response.content[0].text.strip().lstrip("```json").rstrip("```").strip()
-            if not json_string: return {"status": "error", "message": "The AI failed to produce an analysis for the found candidates."}
-            parsed_json = json.loads(json_string)
-            usage_data = {"input_tokens": final_response.usage.input_tokens, "output_tokens": final_response.usage.output_tokens}
-            return {"status": "success", "analysis_data": parsed_json, "usage": usage_data}
-        elif response.stop_reason == "end_turn":
-            return {"status": "success", "analysis_data": {"overall_summary": f"The AI provided a direct response: {response.content[0].text}", "candidates": [], "overall_recommendation": "No candidates were searched."}, "usage": {"input_tokens": response.usage.input_tokens, "output_tokens": response.usage.output_tokens}}
+        early_result, _, tool_output, messages = await _plan_and_retrieve_async(user_query, num_profiles_to_retrieve, filters)
+        if early_result: return early_result
+        if _is_no_candidates(tool_output): return _lark_empty_result()
+        return await _analyze_async(_lark_analysis_request(messages))
     except Exception as e:
         return {"status": "error", "message": f"LLM analysis failed: {e}"}
-    return {"status": "error", "message": f"Unexpected response from Claude with stop reason: {response.stop_reason}"}
+
+class _CandidateStreamParser:
+    """Pulls each complete object out of the "candidates" array of the analysis tool input while Claude is
+    still generating it, so it can be sent to the client before the rest of the document exists."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.object_start = None
+        self.done = False
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        found = []
+        if self.position is None:
+            match = re.search(r'"candidates"\s*:\s*\[', self.buffer)
+            if not match: return found
+            self.position = match.end()
+        while not self.done and self.position < len(self.buffer):
+            ch = self.buffer[self.position]
+            if self.in_string:
+                if self.escape: self.escape = False
+                elif ch == "\\": self.escape = True
+                elif ch == '"': self.in_string = False
+            elif ch == '"': self.in_string = True
+            elif ch == "{":
+                if self.depth == 0: self.object_start = self.position
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        found.append(json.loads(self.buffer[self.object_start:self.position + 1]))
+                    except json.JSONDecodeError:
+                        pass
+            elif ch == "]" and self.depth == 0:
+                self.done = True
+            self.position += 1
+        return found
+
+async def stream_lark_database_search(user_query: str, num_profiles_to_retrieve: int, filters: dict = None, on_result=None):
+    """Async generator of (event, data) pairs: `plan` with the resume_search_tool arguments (from the local
+    planner or Claude), `candidates` with the raw tool results as soon as Chroma returns,
+    one `candidate` per analysis as Claude finishes writing it (only those matching the candidate schema), a
+    `replace` with the full validated list if the final analysis differs from what was streamed (after a repair),
+    then `summary` and finally `done` with usage (or a single `error`). `on_result(result)` receives the
+    validated result before `done`."""
+    print("--- Streaming search against Lark's Database ---")
+    try:
+        early_result, tool_input, tool_output, messages = await _plan_and_retrieve_async(user_query, num_profiles_to_retrieve, filters)
+        if early_result and early_result["status"] != "success":
+            yield "error", {"message": early_result["message"]}
+            return
+        if early_result:
+            if on_result: on_result(early_result)
+            yield "summary", {k: v for k, v in early_result["analysis_data"].items() if k != "candidates"}
+            yield "done", {"usage": early_result["usage"]}
+            return
+        yield "plan", tool_input
+        if _is_no_candidates(tool_output):
+            result = _lark_empty_result()
+            if on_result: on_result(result)
+            yield "candidates", []
+            yield "summary", {k: v for k, v in result["analysis_data"].items() if k != "candidates"}
+            yield "done", {"usage": result["usage"]}
+            return
+        yield "candidates", tool_output
+        parser, streamed = _CandidateStreamParser(), []
+        request = _lark_analysis_request(messages)
+        with metrics.span("claude", call="analysis", streamed=True) as attributes:
+            async with _upstream_semaphore("anthropic"):
+                async with global_async_client_anthropic.messages.stream(**request) as stream:
+                    # The forced analysis tool's input arrives as partial JSON deltas.
+                    async for event in stream:
+                        if event.type != "content_block_delta" or event.delta.type != "input_json_delta": continue
+                        for candidate in parser.feed(event.delta.partial_json):
+                            if not candidate_validator.is_valid(candidate): continue
+                            streamed.append(candidate)
+                            yield "candidate", candidate
+                    final_response = await stream.get_final_message()
+            _record_claude_call("analysis", final_response, attributes)
+        result = await _analyze_async(request, final_response)
+        if result["status"] != "success":
+            yield "error", {"message": result["message"]}
+            return
+        if result["analysis_data"]["candidates"] != streamed: yield "replace", result["analysis_data"]["candidates"]
+        if on_result: on_result(result)
+        yield "summary", {k: v for k, v in result["analysis_data"].items() if k != "candidates"}
+        yield "done", {"usage": result["usage"]}
+    except Exception as e:
+        yield "error", {"message": f"LLM analysis failed: {e}"}
 
 def _get_google_drive_service(token_data: dict):
+    if os.getenv("DRIVE_BACKEND") == "fake": return fake_drive_service
     GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
     info = {**token_data, "client_id": GOOGLE_CLIENT_ID, "client_secret": GOOGLE_CLIENT_SECRET, "token_uri": "https://oauth2.googleapis.com/token"}
     creds = Credentials.from_authorized_user_info(info)
-    return build('drive', 'v3', credentials=creds)
+    return build('drive', 'v3', credentials=creds, cache_discovery=False)
 
-def _extract_folder_id_from_url(url: str) -> str:
-    if "folders/" in url: return url.split("folders/")[1].split("?")[0]
-    return None
+def gdrive_partition(user_id: str) -> str:
+    # Partition names are persisted with the corpus versions, so they hold the key's fingerprint, not the key.
+    return f"{GDRIVE_COLLECTION_NAME}:{metrics.key_label(user_id)}"
+
+drive_engine = DriveIngestionEngine(service_factory=_get_google_drive_service, embed_texts=get_embeddings,
+                                    extract_text=pdf_text.extract_text, pdf_executor_factory=get_pdf_executor,
+                                    on_write=lambda user_id: corpus_versions.bump(gdrive_partition(user_id)),
+                                    index_chunks=lambda ids, documents, metadatas: index_resume_chunks(GDRIVE_COLLECTION_NAME, ids, documents, metadatas),
+                                    delete_chunks=lambda ids: delete_resume_chunks(GDRIVE_COLLECTION_NAME, ids))
+
+def _log_drive_sync(future):
+    if future.done() and not future.cancelled() and future.exception() is None:
+        print(f"Drive sync finished: {future.result()}")
+    elif not future.done():
+        print(f"Drive sync still running after {DRIVE_SYNC_BUDGET_SECONDS}s, searching the files indexed so far.")
 
-def _extract_text_from_pdf(pdf_content: bytes) -> str:
+def _gdrive_empty_result() -> dict:
+    return {"status": "success", "analysis_data": {"overall_summary": "No relevant resumes were found in your Google Drive for this query.", "candidates": [], "overall_recommendation": "Try a different query or add more resumes to the selected folders."},"usage": {"input_tokens": 0, "output_tokens": 0}}
+
+def _gdrive_analysis_request(user_query: str, candidates: list) -> dict:
+    return _analysis_request(GDRIVE_SYSTEM_MESSAGE, [{"role": "user", "content": f"Query: {user_query}\n\nResumes:\n{json.dumps(candidates)}"}])
+
+# The (user, folders) whose sync this request already waited for before its cache lookup; the search itself then
+# doesn't wait a second budget for the same job.
+_drive_synced = contextvars.ContextVar("drive_synced", default=None)
+
+async def _wait_for_drive_sync_async(gdrive_collection, folder_ids: list, user_id: str, token: dict):
+    if _drive_synced.get() == (user_id, tuple(sorted(folder_ids))): return
+    sync_job = drive_engine.start_sync(gdrive_collection, folder_ids, user_id, token)
     try:
-        with fitz.open(stream=pdf_content, filetype="pdf") as doc: text = "".join(page.get_text() for page in doc)
-        return text
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return ""
+        # Shielded: giving up on the wait must not cancel a sync that other requests may share.
+        with metrics.span("drive_sync_wait"): await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(sync_job)), timeout=DRIVE_SYNC_BUDGET_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    _log_drive_sync(sync_job)
 
 def search_google_drive(user_query: str, num_profiles_to_retrieve: int, folder_ids: list, user_id: str, token: dict) -> dict:
+    return asyncio.run(search_google_drive_async(user_query, num_profiles_to_retrieve, folder_ids, user_id, token))
+
+async def search_google_drive_async(user_query: str, num_profiles_to_retrieve: int, folder_ids: list, user_id: str, token: dict) -> dict:
     if not token: return {"status": "error", "message": "Google Drive token not provided."}
     try:
-        service = _get_google_drive_service(token)
-        gdrive_collection = chroma_client.get_or_create_collection(name=GDRIVE_COLLECTION_NAME)
-        for folder_url in folder_ids:
-            folder_id = _extract_folder_id_from_url(folder_url)
-            if not folder_id: continue
-            q = f"'{folder_id}' in parents and mimeType='application/pdf'"
-            results = service.files().list(q=q, fields="files(id, name)").execute()
-            for item in results.get('files', []):
-                if not gdrive_collection.get(ids=[item['id']]).get('ids'):
-                    print(f"Processing new file: {item['name']}")
-                    request = service.files().get_media(fileId=item['id'])
-                    file_bytes = request.execute()
-                    text = _extract_text_from_pdf(file_bytes)
-                    if text:
-                        gdrive_collection.add(ids=[item['id']], embeddings=[get_embedding(text)], documents=[text], metadatas=[{"user_id": user_id, "file_name": item['name']}])
-        search_results = gdrive_collection.query(query_embeddings=[get_embedding(user_query)], n_results=num_profiles_to_retrieve, where={"user_id": user_id}, include=['documents'])
-        if not search_results['documents'] or not search_results['documents'][0]:
-            return {"status": "success", "analysis_data": {"overall_summary": "No relevant resumes were found in your Google Drive for this query.", "candidates": [], "overall_recommendation": "Try a different query or add more resumes to the selected folders."},"usage": {"input_tokens": 0, "output_tokens": 0}}
-        context_for_llm = "\n\n---\n\n".join(search_results['documents'][0])
-        final_response = global_client_anthropic.messages.create(
-            model="claude-3-haiku-20240307", max_tokens=2000, temperature=0.5,
-            system="Analyze the following resume texts based on the user's query and provide a summary in the standard JSON format.",
-            messages=[{"role": "user", "content": f"Query: {user_query}\n\nResumes:\n{context_for_llm}"}]
-        )
-        json_string = final_response.content[0].text.strip().lstrip("```json").rstrip("```")
-        parsed_json = json.loads(json_string)
-        usage_data = {"input_tokens": final_response.usage.input_tokens, "output_tokens": final_response.usage.output_tokens}
-        return {"status": "success", "analysis_data": parsed_json, "usage": usage_data}
+        gdrive_collection = await _run_in_thread("chroma", chroma_client.get_or_create_collection, name=GDRIVE_COLLECTION_NAME)
+        await _wait_for_drive_sync_async(gdrive_collection, folder_ids, user_id, token)
+        query_embedding = await get_embedding_async(user_query)
+        with metrics.span("chroma_query", collection=GDRIVE_COLLECTION_NAME):
+            search_results = await _run_in_thread("chroma", gdrive_collection.query, query_embeddings=[query_embedding], n_results=num_profiles_to_retrieve, where={"user_id": user_id}, include=['documents', 'metadatas'])
+        candidates = _format_drive_candidates(search_results)
+        if not candidates: return _gdrive_empty_result()
+        return await _analyze_async(_gdrive_analysis_request(user_query, await _analysis_context_async(user_query, candidates, [GDRIVE_COLLECTION_NAME])))
     except Exception as e:
         return {"status": "error", "message": f"An error occurred during Google Drive search: {e}"}
 
-def perform_claude_search_with_tool(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, token: dict) -> dict:
+def _format_drive_candidates(results: dict) -> list[dict]:
+    candidates_data = []
+    if results and results['ids'] and results['ids'][0]:
+        for record_id, document, metadata in zip(results['ids'][0], results['documents'][0], results['metadatas'][0]):
+            email_match = re.search(r"[\w.+-]+@[\w-]+\.[\w.-]+", document)
+            phone_match = re.search(r"\(?\+?\d[\d\s().-]{7,}\d", document)
+            first_line = next((line.strip() for line in document.splitlines() if line.strip()), "")
+            candidates_data.append({"resume_id": record_id, "name": first_line[:80] or metadata.get("file_name", ""), "contact_information": {"email": email_match.group(0) if email_match else "", "phone": phone_match.group(0) if phone_match else ""},
+                                    "resume_pdf_url": f"https://drive.google.com/file/d/{metadata.get('file_id', '')}/view", "raw_resume_text": document})
+    return candidates_data
+
+async def _lark_candidates_async(user_query: str, num_results: int, filters: dict = None) -> list[dict]:
+    candidates = await resume_search_tool_async(user_query, num_results, **clean_filters(filters))
+    return [] if _is_no_candidates(candidates) else candidates
+
+async def _drive_candidates_async(user_query: str, num_results: int, folder_ids: list, user_id: str, token: dict) -> list[dict]:
+    if not token: raise ValueError("Google Drive token not provided.")
+    gdrive_collection = await _run_in_thread("chroma", chroma_client.get_or_create_collection, name=GDRIVE_COLLECTION_NAME)
+    await _wait_for_drive_sync_async(gdrive_collection, folder_ids, user_id, token)
+    query_embedding = await get_embedding_async(user_query)
+    with metrics.span("chroma_query", collection=GDRIVE_COLLECTION_NAME):
+        results = await _run_in_thread("chroma", gdrive_collection.query, query_embeddings=[query_embedding], n_results=num_results, where={"user_id": user_id}, include=['documents', 'metadatas'])
+    return _format_drive_candidates(results)
+
+def _candidate_fingerprint(candidate: dict) -> str:
+    email = (candidate.get("contact_information") or {}).get("email", "").strip().lower()
+    if email: return f"email:{email}"
+    text = " ".join(candidate.get("raw_resume_text", "").lower().split())[:2000]
+    return "text:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def fuse_ranked_candidates(ranked_lists: dict, num_results: int, k: int = RRF_K) -> list[dict]:
+    """Reciprocal-rank fusion of {source: [candidate, ...]} lists; duplicates (same email, or same text when
+    there is no email) are merged and their scores summed, so a profile found in both sources ranks higher."""
+    fused = {}
+    for source, candidates in ranked_lists.items():
+        for rank, candidate in enumerate(candidates):
+            entry = fused.setdefault(_candidate_fingerprint(candidate), {"candidate": {**candidate, "sources": []}, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank + 1)
+            entry["candidate"]["sources"].append(source)
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    return [entry["candidate"] for entry in ranked[:num_results]]
+
+def _federated_analysis_request(user_query: str, candidates: list) -> dict:
+    return _analysis_request(FEDERATED_SYSTEM_MESSAGE, [{"role": "user", "content": f"Query: {user_query}\n\nCandidates:\n{json.dumps(candidates)}"}])
+
+def _federated_no_candidates(source_status: dict) -> dict:
+    if all(status != "ok" for status in source_status.values()):
+        return {"status": "error", "message": f"All sources failed: {source_status}"}
+    return {**_lark_empty_result(), "source_status": source_status}
+
+def _source_error(e: BaseException) -> str:
+    return "timeout" if isinstance(e, (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError)) else f"error: {e}"
+
+def search_both(user_query: str, num_profiles_to_retrieve: int, folder_ids: list, user_id: str, token: dict, filters: dict = None) -> dict:
+    return asyncio.run(search_both_async(user_query, num_profiles_to_retrieve, folder_ids, user_id, token, filters))
+
+async def search_both_async(user_query: str, num_profiles_to_retrieve: int, folder_ids: list, user_id: str, token: dict, filters: dict = None) -> dict:
+    """Queries Lark's Database and the user's Drive partition concurrently, fuses the rankings and analyzes
+    the fused top-N in one Claude call. Latency is bounded by the slower source (capped at
+    FEDERATED_SOURCE_TIMEOUT_SECONDS); a source that fails or times out is reported in `source_status`."""
+    print("--- Firing async federated search against Lark's Database and Google Drive ---")
+    pool_size = num_profiles_to_retrieve * FEDERATED_OVERFETCH
+    tasks = {"lark": asyncio.ensure_future(_lark_candidates_async(user_query, pool_size, filters)),
+             "gdrive": asyncio.ensure_future(_drive_candidates_async(user_query, pool_size, folder_ids, user_id, token))}
+    await asyncio.wait(tasks.values(), timeout=FEDERATED_SOURCE_TIMEOUT_SECONDS)
+    ranked_lists, source_status = {}, {}
+    for source, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            source_status[source] = "timeout"
+        elif task.exception() is not None:
+            source_status[source] = _source_error(task.exception())
+        else:
+            ranked_lists[source] = task.result()
+            source_status[source] = "ok"
+    fused = fuse_ranked_candidates(ranked_lists, num_profiles_to_retrieve)
+    if not fused: return _federated_no_candidates(source_status)
+    try:
+        request = _federated_analysis_request(user_query, await _analysis_context_async(user_query, fused, [COLLECTION_NAME, GDRIVE_COLLECTION_NAME]))
+        return {**await _analyze_async(request), "source_status": source_status}
+    except Exception as e:
+        return {"status": "error", "message": f"LLM analysis failed: {e}"}
+
+def _search_partitions(source: str, user_id: str) -> list:
+    return ([COLLECTION_NAME] if source in ("Lark's Database", "Both") else []) + ([gdrive_partition(user_id)] if source in ("Google Drive", "Both") else [])
+
+def _search_scope_key(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, filters: dict, versions: dict) -> tuple:
+    uses_drive = source in ("Google Drive", "Both")
+    scope = {"source": source, "num_results": num_profiles_to_retrieve, "folders": sorted(folder_ids) if uses_drive else [],
+             "user": user_id if uses_drive else None, "versions": versions}
+    # Filters only narrow Lark's Database, and unfiltered keys stay as they were.
+    if COLLECTION_NAME in versions and clean_filters(filters): scope["filters"] = clean_filters(filters)
+    return SearchResponseCache.make_key(user_query, scope)
+
+async def _search_cache_key_async(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, filters: dict = None) -> tuple:
+    # Same key; a corpus version that isn't cached in memory is read from SQLite off the event loop.
+    versions = {partition: await (_lark_version_async() if partition == COLLECTION_NAME else corpus_versions.aget(partition)) for partition in _search_partitions(source, user_id)}
+    return _search_scope_key(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, filters, versions)
+
+async def _sync_drive_before_lookup(source: str, folder_ids: list, user_id: str, token: dict):
+    """Drive and "Both" cache keys hold the Drive partition's version, so the folders are synced (within the usual
+    budget, and at most every DRIVE_SYNC_MIN_INTERVAL_SECONDS) before the key is computed; otherwise a cache hit
+    would keep answering from files that were changed or added since."""
+    if source not in ("Google Drive", "Both") or not token: return
+    gdrive_collection = await _run_in_thread("chroma", chroma_client.get_or_create_collection, name=GDRIVE_COLLECTION_NAME)
+    await _wait_for_drive_sync_async(gdrive_collection, folder_ids, user_id, token)
+    _drive_synced.set((user_id, tuple(sorted(folder_ids))))
+
+def _from_cache(result: dict, outcome: str) -> dict:
+    # The tokens were paid for by the request that filled the cache; report zero so COST_LOG isn't double counted.
+    return {**result, "usage": {"input_tokens": 0, "output_tokens": 0}, "cache": outcome}
+
+def _is_cacheable(result: dict) -> bool:
+    return result.get("status") == "success"
+
+def perform_claude_search_with_tool(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, token: dict, filters: dict = None) -> dict:
+    return asyncio.run(perform_claude_search_with_tool_async(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, token, filters))
+
+async def _perform_search_uncached_async(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, token: dict, filters: dict = None) -> dict:
     if source == "Lark's Database":
-        return search_lark_database(user_query, num_profiles_to_retrieve)
+        return await search_lark_database_async(user_query, num_profiles_to_retrieve, filters)
     elif source == "Google Drive":
-        return search_google_drive(user_query, num_profiles_to_retrieve, folder_ids, user_id, token)
+        return await search_google_drive_async(user_query, num_profiles_to_retrieve, folder_ids, user_id, token)
     elif source == "Both":
-        print("--- Source 'Both' selected, defaulting to Lark's Database for MVP ---")
-        return search_lark_database(user_query, num_profiles_to_retrieve)
+        return await search_both_async(user_query, num_profiles_to_retrieve, folder_ids, user_id, token, filters)
     else:
-        return {"status": "error", "message": f"Invalid source specified: {source}"}
\ No newline at end of file
+        return {"status": "error", "message": f"Invalid source specified: {source}"}
+
+async def _semantic_cache_embedding(user_query: str):
+    return await get_embedding_async(user_query) if search_cache.semantic_threshold > 0 else None
+
+async def perform_claude_search_with_tool_async(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, token: dict, filters: dict = None) -> dict:
+    await _sync_drive_before_lookup(source, folder_ids, user_id, token)
+    cache_key = await _search_cache_key_async(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, filters)
+    result, outcome = await search_cache.get_or_compute(
+        cache_key, lambda: _perform_search_uncached_async(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, token, filters),
+        query_embedding=await _semantic_cache_embedding(user_query), cacheable=_is_cacheable)
+    return result if outcome == "miss" else _from_cache(result, outcome)
+
+def _result_events(result: dict):
+    for candidate in result["analysis_data"].get("candidates", []): yield "candidate", candidate
+    yield "summary", {k: v for k, v in result["analysis_data"].items() if k != "candidates"}
+    yield "done", {"usage": result.get("usage", {}), **({"cache": result["cache"]} if "cache" in result else {})}
+
+async def stream_claude_search(user_query: str, num_profiles_to_retrieve: int, source: str, folder_ids: list, user_id: str, token: dict, filters: dict = None):
+    await _sync_drive_before_lookup(source, folder_ids, user_id, token)
+    cache_key = await _search_cache_key_async(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, filters)
+    query_embedding = await _semantic_cache_embedding(user_query)
+    cached, outcome = search_cache.get(cache_key, query_embedding)
+    if cached is not None:
+        for event in _result_events(_from_cache(cached, outcome)): yield event
+        return
+    if source == "Lark's Database":
+        # Only the validated analysis is cached, never the candidates as they were streamed.
+        async for event in stream_lark_database_search(user_query, num_profiles_to_retrieve, filters, on_result=lambda result: search_cache.put(cache_key, result, query_embedding)):
+            yield event
+        return
+    # The Drive and federated paths have no tool round trip to stream, so they are replayed as events once the analysis is done.
+    result = await perform_claude_search_with_tool_async(user_query, num_profiles_to_retrieve, source, folder_ids, user_id, token, filters)
+    if result.get("status") != "success":
+        yield "error", {"message": result.get("message", "Unknown LLM error")}
+        return
+    for event in _result_events(result): yield event
+
+async def _batch_lark_analysis(user_query: str, tool_input: dict, tool_output: list, semaphore: asyncio.Semaphore) -> dict:
+    if _is_no_candidates(tool_output): return _lark_empty_result()
+    async with semaphore:
+        messages = _planned_analysis_messages(user_query, tool_input, await _analysis_context_async(user_query, tool_output, [COLLECTION_NAME]))
+        return await _analyze_async(_lark_analysis_request(messages))
+
+async def search_batch_async(items: list, source: str, folder_ids: list, user_id: str, token: dict, on_result=None, filters: dict = None) -> list:
+    """One result dict per item ({"query", "num_results"}), in order; a failing item gets a status "error" result
+    and doesn't fail the others. Every query goes into one embedding request. For Lark's Database items the local
+    planner is confident about share one multi-vector query per constraint group; the others (and every item
+    under PLANNER_MODE=llm or compare) take the single-search path, Claude fallback included, as do Drive and
+    federated items, on the warmed embedding cache. `on_result(index, result)`
+    is called as each item finishes. `filters` apply to every item."""
+    results = [None] * len(items)
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    def finish(i: int, result: dict):
+        results[i] = result
+        if on_result: on_result(i, result)
+
+    async def run(i: int, cache_key: tuple, query_embedding: list, compute):
+        try:
+            result = await compute()
+        except Exception as e:
+            result = {"status": "error", "message": f"LLM analysis failed: {e}"}
+        if _is_cacheable(result): search_cache.put(cache_key, result, query_embedding)
+        finish(i, result)
+
+    if source == "Lark's Database":
+        await _run_in_thread("chroma", query_planner.ensure_fresh)
+        plans = [query_planner.plan(item["query"]) for item in items]
+        tool_inputs = [_apply_filters(plan.tool_input(item["num_results"]), filters) for plan, item in zip(plans, items)]
+    else:
+        plans, tool_inputs = [None] * len(items), [{"query": item["query"]} for item in items]
+    try:
+        texts = list(dict.fromkeys([item["query"] for item in items] + [tool_input["query"] for tool_input in tool_inputs]))
+        with metrics.span("embedding", texts=len(texts)): embeddings = dict(zip(texts, await get_embeddings_async(texts)))
+    except Exception as e:
+        for i in range(len(items)): finish(i, {"status": "error", "message": f"Embedding failed: {e}"})
+        return results
+    pending = []
+    await _sync_drive_before_lookup(source, folder_ids, user_id, token)
+    for i, item in enumerate(items):
+        cache_key = await _search_cache_key_async(item["query"], item["num_results"], source, folder_ids, user_id, filters)
+        query_embedding = embeddings[item["query"]] if search_cache.semantic_threshold > 0 else None
+        cached, outcome = search_cache.get(cache_key, query_embedding)
+        if cached is not None: finish(i, _from_cache(cached, outcome))
+        else: pending.append((i, cache_key, query_embedding))
+    if not pending: return results
+    print(f"--- Firing batch search against {source}: {len(pending)} of {len(items)} queries not cached ---")
+    async def search_item(i: int) -> dict:
+        async with semaphore: return await _perform_search_uncached_async(items[i]["query"], items[i]["num_results"], source, folder_ids, user_id, token, filters)
+
+    async def search_grouped(grouped: list):
+        try:
+            retrieved = await _run_in_thread("chroma", _hybrid_query_many, [tool_inputs[i] for i, _, _ in grouped], [embeddings[tool_inputs[i]["query"]] for i, _, _ in grouped])
+        except Exception as e:
+            for i, _, _ in grouped: finish(i, {"status": "error", "message": f"Candidate retrieval failed: {e}"})
+            return
+        query_planner.counters["local"] += len(grouped)
+        await asyncio.gather(*(run(i, cache_key, query_embedding, functools.partial(_batch_lark_analysis, items[i]["query"], tool_inputs[i], _format_candidates(candidates), semaphore))
+                               for (i, cache_key, query_embedding), candidates in zip(grouped, retrieved)))
+
+    # Compare mode runs its shadow Claude plan per item, so only plain local mode groups retrieval.
+    grouped_ids = {i for i, _, _ in pending if source == "Lark's Database" and PLANNER_MODE == "local" and _plan_is_confident(plans[i])}
+    grouped, single = [entry for entry in pending if entry[0] in grouped_ids], [entry for entry in pending if entry[0] not in grouped_ids]
+    await asyncio.gather(*([search_grouped(grouped)] if grouped else []),
+                         *(run(i, cache_key, query_embedding, functools.partial(search_item, i)) for i, cache_key, query_embedding in single))
+    return results
+
+def facet_counts(user_query: str = None, filters: dict = None) -> dict:
+    """Live facet counts over Lark's Database for the candidates passing the filters a search would apply:
+    the local planner's constraints for `user_query` (if any) overridden by explicit `filters`."""
+    with metrics.span("index_refresh"):
+        lexical_index.ensure_fresh(background=True)
+        query_planner.ensure_fresh()
+    tool_input = _apply_filters(query_planner.plan(user_query).tool_input(0) if user_query else {}, filters)
+    applied = {field: tool_input[field] for field in FILTER_FIELDS if field in tool_input}
+    with metrics.span("facets"), lexical_index.reading():
+        allowed, _ = _allowed_and_where(dict(zip(FILTER_FIELDS, _filter_key(applied))))
+        return {"filters": applied, **lexical_index.store.counts(allowed), "version": str(_lark_version())}
+
+async def facet_counts_async(user_query: str = None, filters: dict = None) -> dict:
+    return await _run_in_thread("chroma", facet_counts, user_query, filters)
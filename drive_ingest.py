@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+
+DRIVE_LIST_FIELDS = "nextPageToken, files(id, name, modifiedTime, md5Checksum)"
+DRIVE_PAGE_SIZE = 1000
+DRIVE_DOWNLOAD_CONCURRENCY = int(os.getenv("DRIVE_DOWNLOAD_CONCURRENCY", "8"))
+DRIVE_EMBED_BATCH_SIZE = int(os.getenv("DRIVE_EMBED_BATCH_SIZE", "64"))
+DRIVE_MAX_CACHED_SERVICES = int(os.getenv("DRIVE_MAX_CACHED_SERVICES", "64"))
+DRIVE_SYNC_BUDGET_SECONDS = float(os.getenv("DRIVE_SYNC_BUDGET_SECONDS", "20"))
+DRIVE_SYNC_MIN_INTERVAL_SECONDS = float(os.getenv("DRIVE_SYNC_MIN_INTERVAL_SECONDS", "30"))
+
+def extract_folder_id(url: str) -> str:
+    if "folders/" in url: return url.split("folders/")[1].split("?")[0]
+    return None
+
+def credential_key(token: dict) -> str:
+    # Refresh tokens are stable across access-token refreshes, so prefer them as the cache identity.
+    identity = token.get("refresh_token") or token.get("access_token") or json.dumps(token, sort_keys=True)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+def _sync_labels(user_id: str) -> dict:
+    # Syncs run on the engine's own threads, outside any request trace, and may be shared by several requests.
+    return {"api_key": metrics.key_label(user_id), "source": "Google Drive"}
+
+def gdrive_record_id(user_id: str, file_id: str) -> str:
+    # Scoped per user so two users indexing the same shared file each get a copy in their own partition. The
+    # user id is an API key, so ids carry its fingerprint rather than the key itself.
+    return f"{metrics.key_label(user_id)}:{file_id}"
+
+class DriveIngestionEngine:
+    """Keeps each user's `gdrive_resumes` partition in sync with their Drive folders.
+
+    Listing is fully paginated, already-indexed files are looked up in one bulk Chroma read and skipped
+    unless their md5Checksum/modifiedTime changed, downloads run concurrently, PDF extraction runs in the
+    shared process pool and embeddings/upserts happen in batches. Sync jobs run in the background and are
+    shared by concurrent requests for the same user and folders, so a search can wait a bounded time and
+    then query whatever is already indexed."""
+
+    def __init__(self, service_factory, embed_texts, extract_text, pdf_executor_factory, download_concurrency: int = DRIVE_DOWNLOAD_CONCURRENCY,
+                 embed_batch_size: int = DRIVE_EMBED_BATCH_SIZE, max_cached_services: int = DRIVE_MAX_CACHED_SERVICES, on_write=None, index_chunks=None,
+                 delete_chunks=None):
+        self.service_factory = service_factory
+        self.embed_texts = embed_texts
+        self.extract_text = extract_text
+        self.pdf_executor_factory = pdf_executor_factory
+        self.on_write = on_write
+        self.index_chunks = index_chunks
+        self.delete_chunks = delete_chunks
+        self._migrated_users = set()
+        self.download_concurrency = max(1, download_concurrency)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.max_cached_services = max_cached_services
+        self._local = threading.local()
+        self._download_executor = ThreadPoolExecutor(max_workers=self.download_concurrency, thread_name_prefix="drive-download")
+        self._job_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="drive-sync")
+        self._jobs = {}  # (user_id, folders) -> (Future, finished_at)
+        self._jobs_lock = threading.Lock()
+
+    def get_service(self, token: dict):
+        # googleapiclient services wrap an httplib2 connection that is not thread-safe, so the cache is per thread.
+        services = getattr(self._local, "services", None)
+        if services is None: services = self._local.services = OrderedDict()
+        key = credential_key(token)
+        service = services.get(key)
+        if service is None:
+            service = services[key] = self.service_factory(token)
+            while len(services) > self.max_cached_services: services.popitem(last=False)
+        else:
+            services.move_to_end(key)
+        return service
+
+    def list_folder_files(self, service, folder_id: str) -> list:
+        q = f"'{folder_id}' in parents and mimeType='application/pdf' and trashed=false"
+        files, page_token = [], None
+        while True:
+            response = service.files().list(q=q, fields=DRIVE_LIST_FIELDS, pageSize=DRIVE_PAGE_SIZE, pageToken=page_token,
+                                            supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
+            files.extend(response.get("files", []))
+            page_token = response.get("nextPageToken")
+            if not page_token: return files
+
+    def find_changed_files(self, collection, user_id: str, files: list) -> list:
+        ids = [gdrive_record_id(user_id, item["id"]) for item in files]
+        indexed = {}
+        for start in range(0, len(ids), 1000):
+            existing = collection.get(ids=ids[start:start + 1000], include=["metadatas"])
+            indexed.update(zip(existing.get("ids", []), existing.get("metadatas", [])))
+        changed = []
+        for record_id, item in zip(ids, files):
+            metadata = indexed.get(record_id)
+            if metadata is None: changed.append(item)
+            elif item.get("md5Checksum") and metadata.get("md5Checksum") != item["md5Checksum"]: changed.append(item)
+            elif not item.get("md5Checksum") and metadata.get("modifiedTime") != item.get("modifiedTime", ""): changed.append(item)
+        return changed
+
+    def remove_legacy_records(self, collection, user_id: str) -> int:
+        """Deletes the user's records stored under an older id scheme (the bare file id, or the raw key prefix) once
+        per process. Their files then read as new and are re-indexed under the current id, instead of showing up
+        twice, the bare-id copies without a file_id."""
+        if user_id in self._migrated_users: return 0
+        prefix = gdrive_record_id(user_id, "")
+        stale = [record_id for record_id in collection.get(where={"user_id": user_id}, include=[])["ids"] if not record_id.startswith(prefix)]
+        if stale:
+            with metrics.span("drive_index", _sync_labels(user_id)):
+                if self.delete_chunks: self.delete_chunks(stale)
+                for start in range(0, len(stale), 1000): collection.delete(ids=stale[start:start + 1000])
+            if self.on_write: self.on_write(user_id)
+        self._migrated_users.add(user_id)
+        return len(stale)
+
+    def _download_and_extract(self, token: dict, file_id: str, pdf_executor, labels: dict = None) -> str:
+        # Runs on a download thread; the CPU-bound extraction is handed to the process pool so downloads,
+        # extraction and embedding of earlier files overlap.
+        with metrics.span("drive_download", labels): file_bytes = self.get_service(token).files().get_media(fileId=file_id).execute()
+        with metrics.span("pdf_extract", labels): return pdf_executor.submit(self.extract_text, file_bytes).result()
+
+    def _write_batch(self, collection, user_id: str, batch: list):
+        ids, documents = [gdrive_record_id(user_id, item["id"]) for item, _ in batch], [text for _, text in batch]
+        metadatas = [{"user_id": user_id, "file_id": item["id"], "file_name": item.get("name", ""), "md5Checksum": item.get("md5Checksum", ""),
+                      "modifiedTime": item.get("modifiedTime", "")} for item, _ in batch]
+        with metrics.span("drive_index", _sync_labels(user_id)):
+            # Chunks first, so a failed batch leaves the files looking unchanged and the next sync retries both.
+            if self.index_chunks: self.index_chunks(ids, documents, metadatas)
+            collection.upsert(ids=ids, embeddings=self.embed_texts(documents), documents=documents, metadatas=metadatas)
+        if self.on_write: self.on_write(user_id)
+
+    def sync(self, collection, folder_urls: list, user_id: str, token: dict) -> dict:
+        started = time.time()
+        labels = _sync_labels(user_id)
+        service = self.get_service(token)
+        files = {}
+        for folder_url in folder_urls:
+            folder_id = extract_folder_id(folder_url)
+            if not folder_id: continue
+            with metrics.span("drive_list", labels): folder_files = self.list_folder_files(service, folder_id)
+            for item in folder_files: files[item["id"]] = item
+        removed = self.remove_legacy_records(collection, user_id)
+        changed = self.find_changed_files(collection, user_id, list(files.values()))
+        stats = {"listed": len(files), "changed": len(changed), "indexed": 0, "failed": 0, "removed_legacy": removed}
+        if changed: print(f"Drive sync: {len(changed)} of {len(files)} files are new or modified for user {labels['api_key']}...")
+        pdf_executor = self.pdf_executor_factory()
+        pending = {self._download_executor.submit(self._download_and_extract, token, item["id"], pdf_executor, labels): item for item in changed}
+        batch = []
+        for future in as_completed(pending):
+            item = pending[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                print(f"Drive sync: failed to fetch {item.get('name')}: {e}")
+                text = ""
+            if not text:
+                stats["failed"] += 1
+                continue
+            batch.append((item, text))
+            if len(batch) >= self.embed_batch_size:
+                self._write_batch(collection, user_id, batch)
+                stats["indexed"] += len(batch)
+                batch = []
+        if batch:
+            self._write_batch(collection, user_id, batch)
+            stats["indexed"] += len(batch)
+        stats["elapsed_seconds"] = round(time.time() - started, 3)
+        return stats
+
+    def start_sync(self, collection, folder_urls: list, user_id: str, token: dict):
+        """Returns a Future for the sync of these folders, reusing one that is still running or that succeeded less
+        than DRIVE_SYNC_MIN_INTERVAL_SECONDS ago, so back-to-back searches (cache hits included) list the folders once."""
+        key, now = (user_id, tuple(sorted(folder_urls))), time.monotonic()
+        with self._jobs_lock:
+            for stale in [job for job, (_, finished_at) in self._jobs.items() if finished_at is not None and now - finished_at >= DRIVE_SYNC_MIN_INTERVAL_SECONDS]:
+                del self._jobs[stale]
+            future, _ = self._jobs.get(key, (None, None))
+            started = future is None or future.done() and (future.cancelled() or future.exception() is not None)
+            if started:
+                future = self._job_executor.submit(self.sync, collection, folder_urls, user_id, token)
+                self._jobs[key] = (future, None)
+        # Outside the lock: a job that already finished runs the callback right here.
+        if started: future.add_done_callback(lambda done, key=key: self._finish_job(key, done))
+        return future
+
+    def _finish_job(self, key, future):
+        with self._jobs_lock:
+            if self._jobs.get(key, (None,))[0] is future: self._jobs[key] = (future, time.monotonic())
+
+    def shutdown(self):
+        self._download_executor.shutdown(wait=False, cancel_futures=True)
+        self._job_executor.shutdown(wait=False, cancel_futures=True)
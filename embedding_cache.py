@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./lark_db/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+def normalize_text(text: str) -> str:
+    # Collapses all whitespace runs (including the newlines get_embedding used to strip) so trivially
+    # different copies of the same job description share one cache entry and one embedding.
+    return " ".join(text.split())
+
+def cache_key(model: str, normalized_text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalized_text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Two-tier embedding cache: a per-process LRU bounded by entry count and bytes, backed by a
+    SQLite file that every gunicorn worker on the host reads and writes. The LRU holds float32 arrays
+    (4 bytes per dimension instead of ~32 for a list of Python floats) and hands out lists."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_errors": 0}
+
+    def _connection(self):
+        if not self.path: return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _size(key: str, vector: array) -> int:
+        # What the entry really occupies: the array object with its buffer plus the key string.
+        return sys.getsizeof(vector) + sys.getsizeof(key)
+
+    def _remember(self, key: str, vector: array):
+        size = self._size(key, vector)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = vector
+            self._memory_bytes += size
+            while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+                old_key, old_vector = self._memory.popitem(last=False)
+                self._memory_bytes -= self._size(old_key, old_vector)
+                self.counters["evictions"] += 1
+
+    def _lookup_memory(self, key: str):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None: self._memory.move_to_end(key)
+            return vector
+
+    def _lookup_disk(self, keys: list) -> dict:
+        if not keys: return {}
+        try:
+            conn = self._connection()
+            if conn is None: return {}
+            found = {}
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for key, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                    found[key] = array("f", blob)
+            return found
+        except sqlite3.Error as e:
+            print(f"Embedding cache disk read failed: {e}")
+            self.counters["disk_errors"] += 1
+            return {}
+
+    def _store_disk(self, rows: list):
+        if not rows: return
+        try:
+            conn = self._connection()
+            if conn is None: return
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                                 [(key, model, len(vector), vector.tobytes()) for key, model, vector in rows])
+        except sqlite3.Error as e:
+            print(f"Embedding cache disk write failed: {e}")
+            self.counters["disk_errors"] += 1
+
+    def _resolve_memory(self, texts: list, model: str) -> tuple:
+        """(keys, normalized texts, memory hits, distinct keys left for the disk tier)."""
+        normalized = [normalize_text(text) for text in texts]
+        keys = [cache_key(model, text) for text in normalized]
+        resolved = {}
+        for key in keys:
+            if key in resolved: continue
+            vector = self._lookup_memory(key)
+            if vector is not None:
+                resolved[key] = vector
+                self.counters["memory_hits"] += 1
+        return keys, normalized, resolved, [key for key in dict.fromkeys(keys) if key not in resolved]
+
+    def _resolve_disk(self, keys: list, normalized: list, resolved: dict, found: dict) -> dict:
+        """Merges the disk hits into `resolved` and returns {key: normalized text} for what neither tier holds."""
+        for key, vector in found.items():
+            resolved[key] = vector
+            self._remember(key, vector)
+            self.counters["disk_hits"] += 1
+        missing = {}
+        for key, text in zip(keys, normalized):
+            if key not in resolved and key not in missing: missing[key] = text
+        if missing: self.counters["misses"] += len(missing)
+        return missing
+
+    def _fill(self, model: str, resolved: dict, missing: dict, vectors: list) -> list:
+        """Remembers the computed vectors and returns the rows for the disk tier."""
+        rows = []
+        for key, vector in zip(missing.keys(), vectors):
+            vector = array("f", vector)  # same float32 precision the disk tier returns
+            resolved[key] = vector
+            self._remember(key, vector)
+            rows.append((key, model, vector))
+        return rows
+
+    def get_many(self, texts: list, model: str, compute) -> list:
+        """Returns one embedding per text. `compute(normalized_texts, model)` is only called once, for the
+        de-duplicated texts that neither tier holds."""
+        keys, normalized, resolved, disk_keys = self._resolve_memory(texts, model)
+        missing = self._resolve_disk(keys, normalized, resolved, self._lookup_disk(disk_keys))
+        if missing: self._store_disk(self._fill(model, resolved, missing, compute(list(missing.values()), model)))
+        return [resolved[key].tolist() for key in keys]
+
+    async def aget_many(self, texts: list, model: str, compute) -> list:
+        """Same as get_many, but awaits an async `compute`. Memory hits are answered on the event loop; the
+        SQLite read and write run in a worker thread."""
+        keys, normalized, resolved, disk_keys = self._resolve_memory(texts, model)
+        found = await asyncio.to_thread(self._lookup_disk, disk_keys) if disk_keys and self.path else {}
+        missing = self._resolve_disk(keys, normalized, resolved, found)
+        if missing: await asyncio.to_thread(self._store_disk, self._fill(model, resolved, missing, await compute(list(missing.values()), model)))
+        return [resolved[key].tolist() for key in keys]
+
+    def get(self, text: str, model: str, compute) -> list:
+        return self.get_many([text], model, compute)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = len(self._memory), self._memory_bytes
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {**self.counters, "memory_entries": entries, "memory_bytes": size, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
@@ -0,0 +1,226 @@
+import asyncio
+import functools
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+FAKE_EMBEDDING_DIM = int(os.getenv("FAKE_EMBEDDING_DIM", "1536"))
+FAKE_EMBEDDING_MAX_INPUTS = 2048
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0"))
+# Fraction of analysis calls answered with a required field missing, to exercise the repair retry.
+FAKE_LLM_MALFORMED_RATE = float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+
+class FakeEmbedder:
+    """Deterministic, offline stand-in for the OpenAI embeddings endpoint. Each token is hashed into a
+    few signed buckets, so texts that share words land near each other and identical texts always
+    produce identical vectors."""
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM):
+        self.dim = dim
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def embed_one(self, text: str) -> list:
+        buckets, signs = [], []
+        for token in re.findall(r"[a-z0-9+#.]+", text.lower()):
+            digest = self._token_digest(token)
+            for i in range(0, 12, 4):
+                buckets.append(int.from_bytes(digest[i:i + 3], "little") % self.dim)
+                signs.append(1.0 if digest[i + 3] & 1 else -1.0)
+        vector = np.bincount(buckets, weights=signs, minlength=self.dim) if buckets else np.zeros(self.dim)
+        norm = math.sqrt(float(vector @ vector)) or 1.0
+        return (vector / norm).tolist()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def _token_digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=12).digest()
+
+    def embed(self, texts: list, model: str = "fake") -> list:
+        # Same per-request input cap as the OpenAI embeddings endpoint, so oversized requests fail offline too.
+        if len(texts) > FAKE_EMBEDDING_MAX_INPUTS: raise ValueError(f"{len(texts)} inputs in one embeddings request; the limit is {FAKE_EMBEDDING_MAX_INPUTS}")
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        return [self.embed_one(text) for text in texts]
+
+def make_pdf(text: str) -> bytes:
+    import fitz  # PyMuPDF, only needed when generating fixture PDFs
+    with fitz.open() as doc:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=9)
+        return doc.tobytes()
+
+class _FakeExecutable:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, **kwargs):
+        return self.result
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q: str = "", fields: str = "", pageSize: int = 100, pageToken: str = None, **kwargs):
+        self.drive.list_calls += 1
+        folder_match = re.match(r"'([^']+)' in parents", q)
+        files = self.drive.folders.get(folder_match.group(1) if folder_match else "", [])
+        start = int(pageToken or 0)
+        page = [{k: v for k, v in item.items() if k != "content"} for item in files[start:start + pageSize]]
+        response = {"files": page}
+        if start + pageSize < len(files): response["nextPageToken"] = str(start + pageSize)
+        return _FakeExecutable(response)
+
+    def get_media(self, fileId: str, **kwargs):
+        self.drive.download_calls += 1
+        return _FakeExecutable(self.drive.files_by_id[fileId]["content"])
+
+class FakeDriveService:
+    """In-memory stand-in for a `build('drive', 'v3')` service: paginated `files().list` over
+    `'<folder>' in parents` queries and `files().get_media`, serving the PDF bytes it was given."""
+
+    def __init__(self):
+        self.folders = {}
+        self.files_by_id = {}
+        self.list_calls = 0
+        self.download_calls = 0
+
+    def add_file(self, folder_id: str, file_id: str, name: str, content: bytes, modified_time: str = "2024-01-01T00:00:00.000Z"):
+        item = {"id": file_id, "name": name, "modifiedTime": modified_time, "md5Checksum": hashlib.md5(content).hexdigest(), "content": content}
+        files = self.folders.setdefault(folder_id, [])
+        files[:] = [f for f in files if f["id"] != file_id] + [item]
+        self.files_by_id[file_id] = item
+        return item
+
+    def files(self):
+        return _FakeFiles(self)
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str): parts.append(content)
+        else: parts.extend(block.get("content", "") if isinstance(block, dict) else getattr(block, "text", "") or "" for block in content)
+    return "\n".join(part for part in parts if isinstance(part, str))
+
+def _prompt_candidates(messages: list) -> list:
+    # The retrieved profiles are the last JSON list of objects in the conversation.
+    text = _prompt_text(messages)
+    start = text.rfind("[{")
+    while start != -1:
+        try:
+            candidates, _ = json.JSONDecoder().raw_decode(text[start:])
+            if isinstance(candidates, list): return candidates
+        except json.JSONDecodeError:
+            pass
+        start = text.rfind("[{", 0, start)
+    return []
+
+class _FakeStream:
+    def __init__(self, response, chunk_size: int = 16):
+        self.response = response
+        self.chunk_size = chunk_size
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        # Raw stream events: text blocks arrive as text_delta, tool_use input as input_json_delta chunks.
+        async def events():
+            for index, block in enumerate(self.response.content):
+                text, kind = (block.text, "text_delta") if block.type == "text" else (json.dumps(block.input), "input_json_delta")
+                for start in range(0, len(text), self.chunk_size):
+                    await asyncio.sleep(0)
+                    chunk = text[start:start + self.chunk_size]
+                    delta = SimpleNamespace(type=kind, text=chunk) if kind == "text_delta" else SimpleNamespace(type=kind, partial_json=chunk)
+                    yield SimpleNamespace(type="content_block_delta", index=index, delta=delta)
+        return events()
+
+    @property
+    def text_stream(self):
+        async def chunks():
+            async for event in self:
+                if event.delta.type == "text_delta": yield event.delta.text
+        return chunks()
+
+    async def get_final_message(self):
+        return self.response
+
+def _is_repair(messages: list) -> bool:
+    return any(isinstance(block, dict) and block.get("is_error") for message in messages if isinstance(message["content"], list) for block in message["content"])
+
+class FakeClaude:
+    """Scripted stand-in for the Anthropic Messages API. With tools, no forced tool_choice and no tool result
+    yet it asks for the first tool with the user's query; otherwise it answers with the analysis of the
+    candidates found in the prompt, as input to the forced tool (or as JSON text without one). Every call sleeps
+    `latency_seconds` and reports token usage at ~4 characters per token. A system prompt and tools carrying
+    cache_control are treated as a cached prefix: written on first sight, read on every later call."""
+
+    def __init__(self, latency_seconds: float = FAKE_LLM_LATENCY_SECONDS, num_results: int = 5, malformed_rate: float = FAKE_LLM_MALFORMED_RATE):
+        self.latency_seconds = latency_seconds
+        self.num_results = num_results
+        self.malformed_rate = malformed_rate
+        self.messages = self
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(0)
+        self._cached_prefixes = set()
+
+    def _usage(self, kwargs: dict, output_tokens: int) -> SimpleNamespace:
+        prefix = json.dumps([kwargs.get("tools", []), kwargs.get("system", "")], sort_keys=True, default=str)
+        input_tokens, prefix_tokens = len(_prompt_text(kwargs["messages"])) // 4, len(prefix) // 4
+        if "cache_control" not in prefix: return SimpleNamespace(input_tokens=input_tokens + prefix_tokens, output_tokens=output_tokens)
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        cached = digest in self._cached_prefixes
+        self._cached_prefixes.add(digest)
+        return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens, cache_read_input_tokens=prefix_tokens if cached else 0,
+                               cache_creation_input_tokens=0 if cached else prefix_tokens)
+
+    def respond(self, kwargs: dict):
+        self.calls += 1
+        messages = kwargs["messages"]
+        forced = (kwargs.get("tool_choice") or {}).get("name")
+        if kwargs.get("tools") and not forced and not any(isinstance(message["content"], list) for message in messages):
+            query = messages[0]["content"] if isinstance(messages[0]["content"], str) else _prompt_text(messages[:1])
+            block = SimpleNamespace(type="tool_use", id=f"toolu_fake_{next(self._ids)}", name=kwargs["tools"][0]["name"], input={"query": query, "num_results": self.num_results})
+            return SimpleNamespace(stop_reason="tool_use", content=[block], usage=self._usage(kwargs, 20))
+        candidates = [candidate for candidate in _prompt_candidates(messages) if candidate.get("name")]
+        analysis = {"overall_summary": f"Reviewed {len(candidates)} candidate profiles against the query.",
+                    "candidates": [{"name": candidate["name"], "contact_information": {"email": (candidate.get("contact_information") or {}).get("email") or "",
+                                                                                      "phone": (candidate.get("contact_information") or {}).get("phone") or ""},
+                                    "summary": f"{candidate['name']} matches the query.", "resume_pdf_url": candidate.get("resume_pdf_url") or ""} for candidate in candidates],
+                    "overall_recommendation": "Interview the top candidates first." if candidates else "Try broadening your search terms."}
+        if self.malformed_rate and not _is_repair(messages) and self._random.random() < self.malformed_rate:
+            # The first candidate loses its phone (a streamed candidate must be held back); without candidates a top-level field goes.
+            if analysis["candidates"]: del analysis["candidates"][0]["contact_information"]["phone"]
+            else: del analysis["overall_recommendation"]
+        text = json.dumps(analysis)
+        if forced:
+            block = SimpleNamespace(type="tool_use", id=f"toolu_fake_{next(self._ids)}", name=forced, input=analysis)
+            return SimpleNamespace(stop_reason="tool_use", content=[block], usage=self._usage(kwargs, len(text) // 4))
+        return SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text="```json\n" + text + "\n```")], usage=self._usage(kwargs, len(text) // 4))
+
+    def create(self, **kwargs):
+        if self.latency_seconds: time.sleep(self.latency_seconds)
+        return self.respond(kwargs)
+
+class AsyncFakeClaude(FakeClaude):
+    """Async variant of FakeClaude, including `messages.stream(...)`."""
+
+    async def create(self, **kwargs):
+        if self.latency_seconds: await asyncio.sleep(self.latency_seconds)
+        return self.respond(kwargs)
+
+    def stream(self, **kwargs):
+        return _FakeStream(self.respond(kwargs))
@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from candidate_store import FACETS
+from lexical_index import LexicalIndex
+
+# Root of the versioned snapshots; unset keeps Lark's Database on the live Chroma collection.
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "")
+INDEX_SNAPSHOT_REFRESH_SECONDS = float(os.getenv("INDEX_SNAPSHOT_REFRESH_SECONDS", "5"))
+SNAPSHOT_SCAN_BLOCK = int(os.getenv("SNAPSHOT_SCAN_BLOCK", "65536"))
+SNAPSHOT_FORMAT_VERSION = 2
+# Version 1 snapshots have no lexical index; workers still map them and build the index from the documents.
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+CURRENT_FILE = "CURRENT"
+
+class _BlobWriter:
+    """Appends UTF-8 strings to `<name>.bin` and their end offsets to `<name>.offsets.i64`."""
+
+    def __init__(self, directory: str, name: str):
+        self.data = open(os.path.join(directory, f"{name}.bin"), "wb")
+        self.offsets = open(os.path.join(directory, f"{name}.offsets.i64"), "wb")
+        self.offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+        self.position = 0
+
+    def extend(self, values: list):
+        encoded = [value.encode("utf-8") for value in values]
+        for item in encoded: self.data.write(item)
+        self.offsets.write((self.position + np.cumsum([len(item) for item in encoded], dtype=np.int64)).tobytes())
+        self.position += sum(len(item) for item in encoded)
+
+    def close(self):
+        self.data.close()
+        self.offsets.close()
+
+class _Blob:
+    def __init__(self, directory: str, name: str, count: int):
+        self.offsets = np.memmap(os.path.join(directory, f"{name}.offsets.i64"), dtype=np.int64, mode="r", shape=(count + 1,))
+        path = os.path.join(directory, f"{name}.bin")
+        # np.memmap refuses empty files; a blob of empty strings is still valid.
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, row: int) -> str:
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+def _map_array(directory: str, name: str, dtype, shape: tuple) -> np.ndarray:
+    # np.memmap refuses empty files (a facet no resume sets, a corpus without skills).
+    return np.memmap(os.path.join(directory, name), dtype=dtype, mode="r", shape=shape) if np.prod(shape) else np.zeros(shape, dtype=dtype)
+
+class _Postings:
+    """The lexical index's postings as CSR arrays: terms sorted in a blob, and each term's slots (snapshot rows)
+    and term frequencies as one slice of `posting_slots` / `posting_tfs`. A lookup is a binary search."""
+
+    def __init__(self, directory: str, terms: int, postings: int):
+        self.count = terms
+        self.terms = _Blob(directory, "terms", terms)
+        self.starts = _map_array(directory, "term_starts.i64", np.int64, (terms + 1,))
+        self.slots = _map_array(directory, "posting_slots.i32", np.int32, (postings,))
+        self.tfs = _map_array(directory, "posting_tfs.u16", np.uint16, (postings,))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, term: str, default=None):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.terms[middle] < term: low = middle + 1
+            else: high = middle
+        if low == self.count or self.terms[low] != term: return default
+        start, stop = int(self.starts[low]), int(self.starts[low + 1])
+        return self.slots[start:stop], self.tfs[start:stop]
+
+def _write_lexical(lexical: LexicalIndex, directory: str, rows: int) -> dict:
+    """Writes the BM25 postings, document lengths, years column, per-facet bitmaps and per-row skill codes of an
+    index built in row order, so workers map them instead of re-tokenizing every document."""
+    store, words = lexical.store, (rows + 63) // 64
+    terms = sorted(lexical.postings)
+    term_writer = _BlobWriter(directory, "terms")
+    term_writer.extend(terms)
+    term_writer.close()
+    postings = 0
+    with open(os.path.join(directory, "term_starts.i64"), "wb") as starts, open(os.path.join(directory, "posting_slots.i32"), "wb") as slots, \
+            open(os.path.join(directory, "posting_tfs.u16"), "wb") as tfs:
+        starts.write(np.zeros(1, dtype=np.int64).tobytes())
+        max_tf = np.iinfo(np.uint16).max
+        for term in terms:
+            term_postings = lexical.postings[term]
+            slots.write(np.fromiter(term_postings.keys(), dtype=np.int32, count=len(term_postings)).tobytes())
+            tfs.write(np.minimum(np.fromiter(term_postings.values(), dtype=np.int64, count=len(term_postings)), max_tf).astype(np.uint16).tobytes())
+            postings += len(term_postings)
+            starts.write(np.int64(postings).tobytes())
+    np.asarray(lexical.doc_lengths, dtype=np.int32).tofile(os.path.join(directory, "doc_lengths.i32"))
+    np.asarray(store.years[:rows], dtype=np.float32).tofile(os.path.join(directory, "years.f32"))
+    for facet in FACETS:
+        with open(os.path.join(directory, f"bitmaps_{facet}.u64"), "wb") as f:
+            for bitmap in store.bitmaps[facet]: f.write(bitmap[:words].tobytes())
+    skill_codes = [store.slot_skill_codes[slot] if slot < len(store.slot_skill_codes) else () for slot in range(rows)]
+    np.concatenate([[0], np.cumsum([len(codes) for codes in skill_codes])]).astype(np.int64).tofile(os.path.join(directory, "skill_starts.i64"))
+    np.asarray([code for codes in skill_codes for code in codes], dtype=np.int32).tofile(os.path.join(directory, "skill_codes.i32"))
+    with open(os.path.join(directory, "facet_values.json"), "w", encoding="utf-8") as f: json.dump(store.values, f)
+    return {"terms": len(terms), "postings": postings, "total_length": lexical.total_length, "skill_codes": sum(len(codes) for codes in skill_codes)}
+
+def build_snapshot(chroma_client, collection_name: str, root_dir: str, chunk_collection_name: str = None, keep: int = 3, page_size: int = 5000) -> dict:
+    """Writes every record of the collection (and its section chunks) as a new read-only snapshot version
+    under `root_dir`, then points CURRENT at it. Older versions beyond `keep` are deleted; a worker that
+    still maps one keeps reading it until it swaps. Returns the manifest."""
+    collection = chroma_client.get_collection(name=collection_name)
+    count = collection.count()
+    if not count: raise ValueError(f"Collection '{collection_name}' is empty; nothing to snapshot.")
+    chunks = chroma_client.get_or_create_collection(name=chunk_collection_name) if chunk_collection_name else None
+    started = time.time()
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(root_dir, exist_ok=True)
+    directory = os.path.join(root_dir, f".{version}.tmp")
+    os.makedirs(directory)
+    ids, documents, metadatas = _BlobWriter(directory, "ids"), _BlobWriter(directory, "documents"), _BlobWriter(directory, "metadata")
+    chunk_texts = _BlobWriter(directory, "chunk_texts")
+    files = {name: open(os.path.join(directory, name), "wb") for name in ("vectors.f32", "norms.f32", "chunk_vectors.f32", "chunk_norms.f32", "chunk_sections.u8", "chunk_positions.i32", "chunk_starts.i64")}
+    files["chunk_starts.i64"].write(np.zeros(1, dtype=np.int64).tobytes())
+    # Indexed in row order, so a lexical index slot is the snapshot row.
+    lexical = LexicalIndex(fingerprint_loader=None, document_loader=None)
+    sections, rows, chunk_count, dim = {}, 0, 0, None
+    try:
+        for offset in range(0, count, page_size):
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]: break
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            dim = dim or vectors.shape[1]
+            files["vectors.f32"].write(vectors.tobytes())
+            files["norms.f32"].write(np.linalg.norm(vectors, axis=1).astype(np.float32).tobytes())
+            ids.extend(page["ids"])
+            documents.extend([document or "" for document in page["documents"]])
+            metadatas.extend([json.dumps(metadata or {}, separators=(",", ":")) for metadata in page["metadatas"]])
+            for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]): lexical._add(record_id, document or "", metadata or {})
+            if len(lexical.ids) != rows + len(page["ids"]): raise ValueError(f"Collection '{collection_name}' changed while it was being snapshotted; rebuild it.")
+            # Chunks are stored grouped by parent row, so a resume's chunks are one contiguous range.
+            grouped = {record_id: [] for record_id in page["ids"]}
+            if chunks is not None:
+                fetched = chunks.get(where={"parent_id": {"$in": page["ids"]}}, include=["embeddings", "documents", "metadatas"])
+                for document, metadata, embedding in zip(fetched["documents"], fetched["metadatas"], fetched["embeddings"]):
+                    if metadata.get("parent_id") in grouped: grouped[metadata["parent_id"]].append((metadata.get("position", 0), metadata.get("section", ""), document or "", embedding))
+            ordered = [chunk for record_id in page["ids"] for chunk in sorted(grouped[record_id], key=lambda chunk: chunk[0])]
+            if ordered:
+                chunk_vectors = np.asarray([chunk[3] for chunk in ordered], dtype=np.float32)
+                files["chunk_vectors.f32"].write(chunk_vectors.tobytes())
+                files["chunk_norms.f32"].write(np.linalg.norm(chunk_vectors, axis=1).astype(np.float32).tobytes())
+                files["chunk_sections.u8"].write(np.asarray([sections.setdefault(chunk[1], len(sections)) for chunk in ordered], dtype=np.uint8).tobytes())
+                files["chunk_positions.i32"].write(np.asarray([chunk[0] for chunk in ordered], dtype=np.int32).tobytes())
+                chunk_texts.extend([chunk[2] for chunk in ordered])
+            files["chunk_starts.i64"].write((chunk_count + np.cumsum([len(grouped[record_id]) for record_id in page["ids"]], dtype=np.int64)).tobytes())
+            chunk_count += len(ordered)
+            rows += len(page["ids"])
+            print(f"Snapshot: wrote {rows}/{count} records, {chunk_count} chunks...")
+        lexical_manifest = _write_lexical(lexical, directory, rows)
+    finally:
+        for writer in (ids, documents, metadatas, chunk_texts): writer.close()
+        for f in files.values(): f.close()
+    manifest = {"format_version": SNAPSHOT_FORMAT_VERSION, "version": version, "collection": collection_name, "count": rows, "dim": dim,
+                "chunk_count": chunk_count, "sections": sorted(sections, key=sections.get), "lexical": lexical_manifest, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "build_seconds": round(time.time() - started, 3)}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f: json.dump(manifest, f, indent=2)
+    os.rename(directory, os.path.join(root_dir, version))
+    _write_current(root_dir, version)
+    _prune(root_dir, keep)
+    print(f"Snapshot: published version {version} ({rows} records, {chunk_count} chunks) in {manifest['build_seconds']}s.")
+    return manifest
+
+def _write_current(root_dir: str, version: str):
+    tmp_path = os.path.join(root_dir, f".{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f: f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(root_dir, CURRENT_FILE))
+
+def _prune(root_dir: str, keep: int):
+    versions = sorted(name for name in os.listdir(root_dir) if os.path.isfile(os.path.join(root_dir, name, "manifest.json")))
+    for name in versions[:-max(1, keep)]: shutil.rmtree(os.path.join(root_dir, name), ignore_errors=True)
+
+class IndexSnapshot:
+    """One read-only snapshot version, memory-mapped: vectors and norms are float32 arrays, ids, documents,
+    metadata and chunk texts are UTF-8 blobs with int64 offset tables, and the lexical index is CSR postings plus
+    facet bitmaps. Pages are shared through the OS page cache, so every worker mapping the same version costs one
+    copy of the data."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f: self.manifest = json.load(f)
+        if self.manifest.get("format_version") not in SUPPORTED_FORMAT_VERSIONS: raise ValueError(f"Unsupported snapshot format in {path}.")
+        self.path, self.version, self.count, self.dim = path, self.manifest["version"], self.manifest["count"], self.manifest["dim"]
+        self.vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        self.norms = np.memmap(os.path.join(path, "norms.f32"), dtype=np.float32, mode="r", shape=(self.count,))
+        self._ids, self._documents, self._metadata = _Blob(path, "ids", self.count), _Blob(path, "documents", self.count), _Blob(path, "metadata", self.count)
+        self.chunk_starts = np.memmap(os.path.join(path, "chunk_starts.i64"), dtype=np.int64, mode="r", shape=(self.count + 1,))
+        chunk_count = self.manifest["chunk_count"]
+        if chunk_count:
+            self.chunk_vectors = np.memmap(os.path.join(path, "chunk_vectors.f32"), dtype=np.float32, mode="r", shape=(chunk_count, self.dim))
+            self.chunk_norms = np.memmap(os.path.join(path, "chunk_norms.f32"), dtype=np.float32, mode="r", shape=(chunk_count,))
+            self.chunk_sections = np.memmap(os.path.join(path, "chunk_sections.u8"), dtype=np.uint8, mode="r", shape=(chunk_count,))
+            self.chunk_positions = np.memmap(os.path.join(path, "chunk_positions.i32"), dtype=np.int32, mode="r", shape=(chunk_count,))
+            self._chunk_texts = _Blob(path, "chunk_texts", chunk_count)
+        self.lexical = self.manifest.get("lexical")
+        if self.lexical:
+            self.postings = _Postings(path, self.lexical["terms"], self.lexical["postings"])
+            self.doc_lengths = _map_array(path, "doc_lengths.i32", np.int32, (self.count,))
+            self.years = _map_array(path, "years.f32", np.float32, (self.count,))
+            with open(os.path.join(path, "facet_values.json"), encoding="utf-8") as f: self.facet_values = json.load(f)
+            words = (self.count + 63) // 64
+            self.bitmaps = {facet: _map_array(path, f"bitmaps_{facet}.u64", np.uint64, (len(self.facet_values[facet]), words)) for facet in FACETS}
+            self.skill_starts = _map_array(path, "skill_starts.i64", np.int64, (self.count + 1,))
+            self.skill_codes = _map_array(path, "skill_codes.i32", np.int32, (self.lexical["skill_codes"],))
+        self._ids_list, self._row_of = None, None
+        self._lock = threading.Lock()
+
+    @property
+    def ids(self) -> list:
+        if self._ids_list is None:
+            with self._lock:
+                if self._ids_list is None: self._ids_list = [self._ids[row] for row in range(self.count)]
+        return self._ids_list
+
+    @property
+    def row_index(self) -> dict:
+        if self._row_of is None:
+            ids = self.ids  # takes the lock itself
+            with self._lock:
+                if self._row_of is None: self._row_of = {record_id: row for row, record_id in enumerate(ids)}
+        return self._row_of
+
+    def row_of(self, record_id: str):
+        return self.row_index.get(record_id)
+
+    def rows(self, record_ids) -> np.ndarray:
+        return np.asarray(sorted(row for row in map(self.row_of, record_ids) if row is not None), dtype=np.int64)
+
+    def metadata(self, row: int) -> dict:
+        return json.loads(self._metadata[row])
+
+    def records(self, rows) -> list:
+        """[(id, metadata, document, embedding)] for the given rows."""
+        return [(self._ids[row], self.metadata(row), self._documents[row], self.vectors[row]) for row in rows]
+
+    def iter_records(self, record_ids: list = None):
+        rows = range(self.count) if record_ids is None else self.rows(record_ids)
+        for row in rows: yield self._ids[row], self._documents[row], self.metadata(row)
+
+    def nearest(self, query_embedding, k: int, rows: np.ndarray = None) -> np.ndarray:
+        return self.nearest_many([query_embedding], k, rows)[0]
+
+    def nearest_many(self, query_embeddings: list, k: int, rows: np.ndarray = None) -> list:
+        """For each query, the rows of the `k` highest-cosine vectors, best first, optionally restricted to
+        `rows`. Exact search: restricted sets score only their own rows, the full set is scanned in
+        SNAPSHOT_SCAN_BLOCK blocks, and several queries share each pass as one matrix product."""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if rows is not None:
+            if not len(rows): return [rows for _ in queries]
+            scores = (self.vectors[rows] @ queries.T) / (self.norms[rows] + 1e-12)[:, None]
+            return [rows[_top(scores[:, j], k)] for j in range(len(queries))]
+        best = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        for start in range(0, self.count, SNAPSHOT_SCAN_BLOCK):
+            stop = min(start + SNAPSHOT_SCAN_BLOCK, self.count)
+            scores = (self.vectors[start:stop] @ queries.T) / (self.norms[start:stop] + 1e-12)[:, None]
+            for j, (best_rows, best_scores) in enumerate(best):
+                top = _top(scores[:, j], k)
+                best_rows, best_scores = np.concatenate([best_rows, top + start]), np.concatenate([best_scores, scores[top, j]])
+                keep = _top(best_scores, k)
+                best[j] = (best_rows[keep], best_scores[keep])
+        return [best_rows for best_rows, _ in best]
+
+    def scored_chunks(self, record_ids: list, query_embedding) -> dict:
+        """{resume id: [(cosine, position, section, text)]}, the same shape the context builder takes from Chroma."""
+        scored = {}
+        if not self.manifest["chunk_count"]: return scored
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        sections = self.manifest["sections"]
+        for record_id in record_ids:
+            row = self.row_of(record_id)
+            if row is None: continue
+            start, stop = int(self.chunk_starts[row]), int(self.chunk_starts[row + 1])
+            if start == stop: continue
+            similarities = self.chunk_vectors[start:stop] @ query / (self.chunk_norms[start:stop] + 1e-12)
+            scored[record_id] = [(float(similarity), int(self.chunk_positions[i]), sections[self.chunk_sections[i]], self._chunk_texts[i])
+                                 for i, similarity in zip(range(start, stop), similarities)]
+        return scored
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) > k: candidates = np.argpartition(-scores, k - 1)[:k]
+    else: candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+class SnapshotManager:
+    """Tracks `root_dir/CURRENT` and keeps the snapshot it names mapped. The pointer is re-read at most every
+    `refresh_seconds`; when it changes the new version is opened and swapped in, while requests already
+    holding the old IndexSnapshot finish on it. No restart is needed to pick up a rebuilt index."""
+
+    def __init__(self, root_dir: str = INDEX_SNAPSHOT_DIR, refresh_seconds: float = INDEX_SNAPSHOT_REFRESH_SECONDS):
+        self.root_dir = root_dir
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"swaps": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root_dir)
+
+    def current(self):
+        if not self.enabled: return None
+        now = time.time()
+        if now - self._checked_at < self.refresh_seconds: return self._snapshot
+        with self._lock:
+            if now - self._checked_at < self.refresh_seconds: return self._snapshot
+            self._checked_at = now
+            try:
+                with open(os.path.join(self.root_dir, CURRENT_FILE), encoding="utf-8") as f: version = f.read().strip()
+                if self._snapshot is None or version != self._snapshot.version:
+                    started = time.perf_counter()
+                    self._snapshot = IndexSnapshot(os.path.join(self.root_dir, version))
+                    self.counters["swaps"] += 1
+                    print(f"Index snapshot: mapped version {version} ({self._snapshot.count} records) in {(time.perf_counter() - started) * 1000:.1f} ms.")
+            except FileNotFoundError:
+                pass  # nothing published yet; callers fall back to Chroma
+            except (OSError, ValueError, KeyError) as e:
+                self.counters["errors"] += 1
+                print(f"Index snapshot: keeping {self.version()} after failing to open the new version: {e}")
+        return self._snapshot
+
+    def version(self):
+        return self._snapshot.version if self._snapshot else None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {**self.counters, "enabled": self.enabled, "version": snapshot.version if snapshot else None, "records": snapshot.count if snapshot else 0,
+                "chunks": snapshot.manifest["chunk_count"] if snapshot else 0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a read-only, memory-mapped snapshot of a resume collection for the API workers.")
+    parser.add_argument("--output", default=INDEX_SNAPSHOT_DIR or "./lark_db/snapshots", help="Snapshot root directory (INDEX_SNAPSHOT_DIR for the API).")
+    parser.add_argument("--collection", default=None, help="Collection to snapshot (default: Lark's Database).")
+    parser.add_argument("--keep", type=int, default=3, help="Number of versions to keep on disk.")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+    import core_logic
+    core_logic.initialize_chroma_client()
+    collection_name = args.collection or core_logic.COLLECTION_NAME
+    manifest = build_snapshot(core_logic.chroma_client, collection_name, args.output, core_logic.chunk_collection_name(collection_name), args.keep, args.page_size)
+    print(json.dumps(manifest, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import core_logic
+
+DEFAULT_EMBED_BATCH_SIZE = 256
+DEFAULT_WRITE_BATCH_SIZE = 2048
+DEFAULT_CONCURRENCY = 4
+
+def iter_resume_files(path: str):
+    """Yields resume dicts one at a time from a directory of .json/.jsonl files, a single .json file
+    (one resume or a list of them) or a .jsonl file. Order is deterministic so checkpoints line up."""
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if file_name.endswith((".json", ".jsonl")):
+                yield from iter_resume_files(os.path.join(path, file_name))
+        return
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line: continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Ingest: skipping malformed line {line_number} in {path}: {e}")
+        return
+    try:
+        with open(path, encoding="utf-8") as f: data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ingest: skipping unreadable file {path}: {e}")
+        return
+    yield from (data if isinstance(data, list) else [data])
+
+def _batched(records, size: int):
+    # Yields (batch, consumed) where consumed also counts malformed records, so checkpoints stay aligned with the raw stream.
+    batch, consumed = {}, 0
+    for record in records:
+        consumed += 1
+        if not isinstance(record, dict) or not record.get("id") or not record.get("raw_text"):
+            print(f"Ingest: skipping record without id/raw_text: {str(record)[:80]}")
+            continue
+        batch[str(record["id"])] = record  # last copy of a duplicated id wins, Chroma rejects duplicates within one call
+        if len(batch) >= size:
+            yield list(batch.values()), consumed
+            batch, consumed = {}, 0
+    if batch or consumed: yield list(batch.values()), consumed
+
+def _load_checkpoint(checkpoint_path: str, source: str) -> int:
+    if not checkpoint_path or not os.path.exists(checkpoint_path): return 0
+    with open(checkpoint_path, encoding="utf-8") as f: state = json.load(f)
+    if state.get("source") != os.path.abspath(source):
+        print(f"Ingest: checkpoint {checkpoint_path} belongs to {state.get('source')}, starting from scratch.")
+        return 0
+    return state.get("records_committed", 0)
+
+def _save_checkpoint(checkpoint_path: str, source: str, records_committed: int):
+    if not checkpoint_path: return
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(source), "records_committed": records_committed, "updated_at": time.time()}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def _embed_batch(batch: list, consumed: int, collection, skip_existing: bool) -> tuple:
+    if skip_existing and batch:
+        existing = set(collection.get(ids=[str(r["id"]) for r in batch], include=[]).get("ids", []))
+        todo = [r for r in batch if str(r["id"]) not in existing]
+    else:
+        todo = batch
+    if not todo: return consumed, len(batch) - len(todo), todo, [], [], None
+    ids, texts, metadatas = [str(r["id"]) for r in todo], [r["raw_text"] for r in todo], [core_logic.resume_to_metadata(r) for r in todo]
+    # The section chunks are embedded here too, on the pool thread; flush() only writes them.
+    return consumed, len(batch) - len(todo), todo, core_logic.get_embeddings(texts), metadatas, core_logic.embed_resume_chunks(ids, texts, metadatas)
+
+def ingest_resumes(source: str, collection_name: str = core_logic.COLLECTION_NAME, embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+                   write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE, concurrency: int = DEFAULT_CONCURRENCY,
+                   checkpoint_path: str = None, skip_existing: bool = True) -> dict:
+    """Streams resumes from `source` into Chroma. Embedding requests run `concurrency` batches at a time;
+    results are consumed in submission order so the checkpoint is always a contiguous prefix of the stream,
+    and writes are upserts keyed on resume id so replaying a partially committed batch is harmless."""
+    if core_logic.chroma_client is None: raise RuntimeError("Chroma client not initialized.")
+    collection = core_logic.chroma_client.get_or_create_collection(name=collection_name)
+    max_batch = getattr(core_logic.chroma_client, "get_max_batch_size", lambda: write_batch_size)()
+    write_batch_size = max(1, min(write_batch_size, max_batch))
+    concurrency = max(1, concurrency)
+    already_committed = _load_checkpoint(checkpoint_path, source)
+    if already_committed: print(f"Ingest: resuming after {already_committed} records from checkpoint.")
+
+    stats = {"seen": 0, "skipped_existing": 0, "written": 0, "resumed_from": already_committed}
+    committed = already_committed
+    pending_records = 0
+    buffer = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+    chunk_buffer = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+    started = time.time()
+
+    def flush():
+        nonlocal committed, pending_records
+        if buffer["ids"]:
+            # Chunks first: if they fail, the resumes aren't written either and a rerun redoes both.
+            core_logic.write_resume_chunks(collection_name, buffer["ids"], chunk_buffer)
+            collection.upsert(**buffer)
+            core_logic.corpus_versions.bump(collection_name)
+            stats["written"] += len(buffer["ids"])
+            for values in (*buffer.values(), *chunk_buffer.values()): values.clear()
+        committed += pending_records
+        pending_records = 0
+        _save_checkpoint(checkpoint_path, source, committed)
+        rate = (committed - already_committed) / max(time.time() - started, 1e-9)
+        print(f"Ingest: {committed} records committed ({stats['written']} written, {rate:.0f} records/s).")
+
+    def consume(future):
+        nonlocal pending_records
+        consumed, skipped, todo, embeddings, metadatas, chunks = future.result()
+        stats["skipped_existing"] += skipped
+        for record, embedding, metadata in zip(todo, embeddings, metadatas):
+            buffer["ids"].append(str(record["id"]))
+            buffer["embeddings"].append(embedding)
+            buffer["documents"].append(record["raw_text"])
+            buffer["metadatas"].append(metadata)
+        for column, values in (chunks or {}).items(): chunk_buffer[column].extend(values)
+        pending_records += consumed
+        if len(buffer["ids"]) >= write_batch_size: flush()
+
+    records = iter_resume_files(source)
+    for _ in range(already_committed):
+        if next(records, None) is None: break
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch, consumed in _batched(records, embed_batch_size):
+            stats["seen"] += consumed
+            in_flight.append(pool.submit(_embed_batch, batch, consumed, collection, skip_existing))
+            while len(in_flight) >= concurrency: consume(in_flight.popleft())
+        while in_flight: consume(in_flight.popleft())
+    flush()
+    stats["elapsed_seconds"] = round(time.time() - started, 3)
+    stats["collection_count"] = collection.count()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load resume JSON/JSONL files into the Chroma resume collection.")
+    parser.add_argument("source", nargs="?", default="mock_resume_database/raw_resumes", help="Directory, .json or .jsonl file to ingest.")
+    parser.add_argument("--collection", default=core_logic.COLLECTION_NAME)
+    parser.add_argument("--embed-batch-size", type=int, default=DEFAULT_EMBED_BATCH_SIZE)
+    parser.add_argument("--write-batch-size", type=int, default=DEFAULT_WRITE_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--checkpoint", default=None, help="Path of a checkpoint file used to resume an interrupted run.")
+    parser.add_argument("--no-skip-existing", action="store_true", help="Re-embed and overwrite ids that are already in the collection.")
+    args = parser.parse_args()
+    core_logic.initialize_api_clients()
+    core_logic.initialize_chroma_client()
+    stats = ingest_resumes(args.source, args.collection, args.embed_batch_size, args.write_batch_size, args.concurrency,
+                           args.checkpoint, not args.no_skip_existing)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
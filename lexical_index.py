@@ -0,0 +1,280 @@
+import contextlib
+import functools
+import heapq
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from candidate_store import CandidateStore
+from query_planner import SKILL_ALIASES
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[./-][a-z0-9+#]+)*")
+STOPWORDS = frozenset("a an and are as at be by for from has have in is it of on or our the their to with who we you your years year experience".split())
+# Tombstoned slots are only skipped at query time; past this fraction the index is rebuilt from scratch.
+LEXICAL_COMPACT_RATIO = float(os.getenv("LEXICAL_COMPACT_RATIO", "0.25"))
+YEARS_PATTERN = re.compile(r"(\d{1,2})\s*\+?\s*(?:years?|yrs?)\b")
+
+def tokenize(text: str) -> list:
+    # Keeps tech tokens such as "c++", "c#", "node.js" and "ci/cd" whole.
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+_SKILL_ALIASES = {" ".join(TOKEN_PATTERN.findall(alias)): target for alias, target in SKILL_ALIASES.items()}
+
+def normalize_skill(skill: str) -> str:
+    key = " ".join(TOKEN_PATTERN.findall(skill.lower()))
+    return " ".join(TOKEN_PATTERN.findall(_SKILL_ALIASES.get(key, key).lower()))
+
+def years_of_experience(text: str) -> float:
+    # Largest "N years"/"N+ yrs" figure in the text; resumes state totals far more often than per-role durations.
+    return float(max((int(years) for years in YEARS_PATTERN.findall(text.lower())), default=0))
+
+def metadata_fingerprint(metadata: dict) -> int:
+    # Stable within a process only, which is all the index needs; ingest puts a content_hash of the document in the metadata.
+    return hash(tuple(sorted((metadata or {}).items())))
+
+def skill_set(skills: str) -> frozenset:
+    return frozenset(normalize_skill(skill) for skill in (skills or "").split(",") if skill.strip())
+
+class ReadWriteLock:
+    """Any number of readers or one writer. A waiting writer holds back new readers so refreshes aren't starved;
+    a thread that already reads may read again (nested index calls) without waiting."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def read(self):
+        depth = getattr(self._local, "depth", 0)
+        if not depth:
+            with self._condition:
+                while self._writing or self._writers_waiting: self._condition.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                with self._condition:
+                    self._readers -= 1
+                    if not self._readers: self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers: self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+# Everything a refresh replaces; a full rebuild builds these on a fresh index and swaps them in at once.
+INDEX_STATE = ("ids", "slot_of", "fingerprints", "doc_lengths", "live", "slot_skills", "postings", "store", "total_length", "live_count", "mapped")
+
+class _SlotSkills:
+    """Per-slot normalized skill sets read from a snapshot's slot -> skill code CSR arrays."""
+
+    def __init__(self, starts: np.ndarray, codes: np.ndarray, keys: list):
+        self.starts, self.codes, self.keys = starts, codes, keys
+
+    def __getitem__(self, slot: int) -> frozenset:
+        return frozenset(self.keys[code] for code in self.codes[self.starts[slot]:self.starts[slot + 1]])
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over resume text plus a CandidateStore of facet bitmaps (level, industry,
+    job title, skills, years of experience), used to pre-filter and re-score vector search. Per-document skill
+    sets are kept for the reranker. `document_loader(ids)` yields (id, document,
+    metadata) for the given ids (all ids when None) and `fingerprint_loader()` yields (id, metadata_fingerprint)
+    for every record; when `version_fn()` changes only added, removed and changed (re-fingerprinted) ids are applied.
+    When `snapshot_loader()` returns an index snapshot that carries the lexical index, its postings and facet
+    bitmaps are used in place (slot == snapshot row) instead of being rebuilt from the documents.
+    Queries run concurrently on worker threads: they hold `reading()` (a whole retrieval should hold it across
+    calls, since slots are only stable within it), refreshes apply their changes under the write lock, and full
+    rebuilds are built off to the side and swapped in. `ensure_fresh(background=True)` leaves the fingerprint scan
+    and the update to a refresh thread and keeps serving the previous index meanwhile."""
+
+    def __init__(self, fingerprint_loader, document_loader, version_fn=lambda: 0, snapshot_loader=lambda: None):
+        self.fingerprint_loader = fingerprint_loader
+        self.document_loader = document_loader
+        self.version_fn = version_fn
+        self.snapshot_loader = snapshot_loader
+        self._version = None
+        self._lock = threading.Lock()  # one refresh at a time
+        self._refresher = None
+        self._refresher_lock = threading.Lock()
+        self._rw = ReadWriteLock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.slot_of = {}
+        self.fingerprints = {}
+        self.doc_lengths = array("i")
+        self.live = []
+        self.slot_skills = []
+        self.postings = {}
+        self.store = CandidateStore(skill_key=normalize_skill)
+        self.total_length = 0
+        self.live_count = 0
+        self.mapped = None  # version of the snapshot whose lexical arrays are in use
+
+    def _map(self, snapshot):
+        store = CandidateStore.from_arrays(snapshot.years, snapshot.bitmaps, snapshot.facet_values, skill_key=normalize_skill)
+        with self._rw.write():
+            self.ids, self.slot_of, self.fingerprints = snapshot.ids, snapshot.row_index, {}
+            self.doc_lengths, self.live, self.postings, self.store = snapshot.doc_lengths, np.ones(snapshot.count, dtype=bool), snapshot.postings, store
+            self.slot_skills = _SlotSkills(snapshot.skill_starts, snapshot.skill_codes, [normalize_skill(skill) for skill in store.values["skills"]])
+            self.total_length, self.live_count, self.mapped = snapshot.manifest["lexical"]["total_length"], snapshot.count, snapshot.version
+
+    def reading(self):
+        return self._rw.read()
+
+    def ensure_fresh(self, background: bool = False):
+        version = self.version_fn()
+        if version == self._version: return
+        snapshot = self.snapshot_loader()
+        # Mapping a snapshot is cheap and must happen before its rows are queried, and a first build (or the switch
+        # away from a mapped index) has nothing valid to serve meanwhile, so only a Chroma-built index refreshes in the background.
+        if background and self._version is not None and not self.mapped and not (snapshot is not None and snapshot.lexical):
+            self._refresh_in_background()
+            return
+        self._refresh(version)
+
+    def _refresh_in_background(self):
+        with self._refresher_lock:
+            if self._refresher is not None and self._refresher.is_alive(): return
+            self._refresher = threading.Thread(target=self._background_refresh, name="lexical-refresh", daemon=True)
+            self._refresher.start()
+
+    def _background_refresh(self):
+        try:
+            self._refresh(self.version_fn())
+        except Exception as e:
+            print(f"Lexical index: background refresh failed, serving the previous index: {e}")
+
+    def refreshing(self) -> bool:
+        return self._refresher is not None and self._refresher.is_alive()
+
+    def _refresh(self, version):
+        with self._lock:
+            if version == self._version: return
+            snapshot = self.snapshot_loader()
+            if snapshot is not None and snapshot.lexical:
+                if snapshot.version != self.mapped: self._map(snapshot)
+                self._version = version
+                return
+            current = dict(self.fingerprint_loader())
+            # An upsert under an existing id changes its fingerprint; it is removed and indexed again like a new record.
+            removed = {record_id for record_id, fingerprint in self.fingerprints.items() if current.get(record_id) != fingerprint}
+            added = [record_id for record_id in current if record_id not in self.slot_of or record_id in removed]
+            if not self.slot_of or self.mapped or len(removed) > LEXICAL_COMPACT_RATIO * max(1, self.live_count) or len(added) > max(1, self.live_count):
+                print(f"Lexical index: building {len(current)} documents...")
+                fresh = LexicalIndex(self.fingerprint_loader, self.document_loader)
+                for record_id, document, metadata in self.document_loader(None): fresh._add(record_id, document or "", metadata or {})
+                with self._rw.write():
+                    for name in INDEX_STATE: setattr(self, name, getattr(fresh, name))
+            elif added or removed:
+                print(f"Lexical index: adding {len(added)} documents ({len(removed)} removed or changed)...")
+                documents = list(self.document_loader(added)) if added else []
+                with self._rw.write():
+                    for record_id in removed: self._remove(record_id)
+                    for record_id, document, metadata in documents: self._add(record_id, document or "", metadata or {})
+            self._version = version
+
+    def _add(self, record_id: str, document: str, metadata: dict):
+        if record_id in self.slot_of: return
+        slot = len(self.ids)
+        terms = Counter(tokenize(document))
+        self.ids.append(record_id)
+        self.slot_of[record_id] = slot
+        self.fingerprints[record_id] = metadata_fingerprint(metadata)
+        self.doc_lengths.append(sum(terms.values()))
+        self.live.append(True)
+        self.slot_skills.append(skill_set(metadata.get("skills")))
+        self.store.add(slot, metadata, years_of_experience(document))
+        self.total_length += self.doc_lengths[slot]
+        self.live_count += 1
+        for term, tf in terms.items(): self.postings.setdefault(term, {})[slot] = tf
+
+    def _remove(self, record_id: str):
+        slot = self.slot_of.pop(record_id)
+        del self.fingerprints[record_id]
+        self.live[slot] = False
+        self.total_length -= self.doc_lengths[slot]
+        self.live_count -= 1
+        self.store.remove(slot)
+
+    def skill_bits(self, skill: str) -> np.ndarray:
+        # Skills missing from the metadata skill lists ("SOC 2", "Kubernetes") fall back to documents containing all their terms.
+        with self.reading():
+            if self.store.has("skills", skill): return self.store.bits("skills", skill)
+            postings = [self._term_postings(term) for term in tokenize(skill)]
+            if not postings or None in postings: return self.store.empty()
+            return self.store.from_slots(functools.reduce(np.intersect1d, sorted((slots for slots, _ in postings), key=len)))
+
+    def allowed_slots(self, level=None, industry=None, must_have_skills: list = None, must_not_have_skills: list = None, job_title=None,
+                      min_years: float = None, max_years: float = None):
+        """Sorted slots passing every constraint, or None when there are no constraints. level, industry and
+        job_title take one value or a list of accepted values; min_years/max_years bound the years of experience."""
+        with self.reading():
+            required = [self.store.any_of(facet, values) for facet, values in (("level", level), ("industry", industry), ("job_title", job_title)) if values]
+            required += [self.skill_bits(skill) for skill in must_have_skills or [] if normalize_skill(skill)]
+            if min_years is not None or max_years is not None: required.append(self.store.years_between(min_years, max_years))
+            excluded = [self.skill_bits(skill) for skill in must_not_have_skills or [] if normalize_skill(skill)]
+            if not required and not excluded: return None
+            return self.store.select(required, excluded)
+
+    def _term_postings(self, term: str):
+        """(slots, tfs) arrays for `term`, or None. Mapped postings are already array slices; dict postings may
+        still hold removed slots."""
+        postings = self.postings.get(term)
+        if postings is None or isinstance(postings, tuple): return postings
+        return np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)), np.fromiter(postings.values(), dtype=np.int64, count=len(postings))
+
+    def bm25_scores(self, query: str, allowed: np.ndarray = None) -> dict:
+        with self.reading():
+            if not self.live_count: return {}
+            average_length = self.total_length / self.live_count
+            if allowed is None: keep = np.unpackbits(self.store.live.view(np.uint8), bitorder="little")[:len(self.ids)].astype(bool)
+            else:
+                keep = np.zeros(len(self.ids), dtype=bool)
+                keep[allowed] = True  # allowed slots are live
+            doc_lengths = np.asarray(self.doc_lengths)
+            matched, contributions = [], []
+            for term in set(tokenize(query)):
+                postings = self._term_postings(term)
+                if postings is None: continue
+                slots, tfs = postings
+                idf = math.log(1 + (self.live_count - len(slots) + 0.5) / (len(slots) + 0.5))
+                passing = keep[slots]
+                slots, tfs = slots[passing], tfs[passing].astype(np.float64)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[slots] / average_length)
+                matched.append(slots)
+                contributions.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+            if not matched: return {}
+            slots, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            return dict(zip(slots.tolist(), np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(slots)).tolist()))
+
+    def top(self, scores: dict, k: int) -> list:
+        with self.reading(): return [(self.ids[slot], score) for slot, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+
+    def stats(self) -> dict:
+        with self.reading():
+            return {"documents": self.live_count, "terms": len(self.postings), "skills": len(self.store.values["skills"]), "version": self._version,
+                    "refreshing": self.refreshing(), "store": self.store.stats()}
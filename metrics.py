@@ -0,0 +1,189 @@
+import contextlib
+import contextvars
+import hashlib
+import os
+import threading
+import time
+
+# Seconds; stage latencies range from sub-millisecond cache hits to multi-second Claude calls.
+METRICS_LATENCY_BUCKETS = tuple(sorted(float(bucket) for bucket in os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30").split(",") if bucket.strip()))
+# Adds a Server-Timing header with the per-stage breakdown to /v1/search_candidates responses.
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+UNLABELED = "none"
+
+METRIC_HELP = {
+    "lark_stage_duration_seconds": ("histogram", "Duration of one pipeline stage (embedding, chroma_query, claude, drive_list, drive_download, pdf_extract, json_parse, ...)."),
+    "lark_request_duration_seconds": ("histogram", "End-to-end duration of a search request."),
+    "lark_requests_total": ("counter", "Search requests by outcome and search cache result."),
+    "lark_llm_tokens_total": ("counter", "Claude tokens by call type and direction (input, output, cache_read, cache_write)."),
+    "lark_analysis_outcomes_total": ("counter", "Structured analysis results: ok on the first call, repaired after a retry, or failed."),
+    "lark_analysis_rejections_total": ("counter", "Analysis responses that failed schema validation, by whether a repair call followed."),
+    "lark_context_tokens_total": ("counter", "Estimated candidate tokens sent to Claude (sent) and what the full resumes would have cost (full)."),
+    "lark_context_dropped_candidates_total": ("counter", "Candidates left out of the analysis context by the token budget."),
+    "lark_embedding_tokens_total": ("counter", "Tokens sent to the embedding API (cache misses only)."),
+}
+
+def key_label(api_key: str) -> str:
+    # API keys are secrets; metrics and headers only carry a short fingerprint of them.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12] if api_key else UNLABELED
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class MetricsRegistry:
+    """Thread-safe in-process histograms and counters rendered in the Prometheus text format. Like the
+    search cache it is per worker; every series carries a `worker` label so scrapes of different
+    gunicorn workers don't overwrite each other."""
+
+    def __init__(self, buckets: tuple = METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str, labels: dict) -> tuple:
+        return name, tuple(sorted({**labels, "worker": str(os.getpid())}.items()))
+
+    def observe(self, name: str, labels: dict, seconds: float):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound: histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def inc(self, name: str, labels: dict, amount: float = 1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (series, labels), value in sorted(counters.items()):
+                if series == name: lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (series, labels), histogram in sorted(histograms.items()):
+                if series != name: continue
+                for bound, count in zip(self.buckets + ("+Inf",), histogram["buckets"] + [histogram["count"]]):
+                    le = 'le="%s"' % (bound if isinstance(bound, str) else f"{bound:g}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class RequestTrace:
+    """Spans and token usage collected for one request. Stages record into the trace of the current
+    context, so work handed to threads must run under `contextvars.copy_context()`."""
+
+    def __init__(self, api_key: str = None, source: str = None, endpoint: str = None):
+        self.labels = {"api_key": key_label(api_key), "source": source or UNLABELED}
+        self.endpoint = endpoint or UNLABELED
+        self.started = time.perf_counter()
+        self.spans = []
+        self.usage = {"input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0, "embedding_tokens": 0, "claude_calls": 0,
+                      "parse_failures": 0, "repair_retries": 0}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float, attributes: dict):
+        with self._lock: self.spans.append({"stage": stage, "ms": round(seconds * 1000, 3), **attributes})
+
+    def add_usage(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items(): self.usage[name] += amount
+
+    def stage_totals(self) -> dict:
+        with self._lock: spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            total = totals.setdefault(span["stage"], {"ms": 0.0, "count": 0})
+            total["ms"] += span["ms"]
+            total["count"] += 1
+        return totals
+
+    def server_timing(self) -> str:
+        # Overlapping stages (the federated fan-out) are summed per stage, so they can add up to more than "total".
+        entries = [f'{stage};dur={total["ms"]:.1f}' + (f';desc="x{total["count"]}"' if total["count"] > 1 else "") for stage, total in self.stage_totals().items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        if self.usage["claude_calls"]: entries.append(f'tokens;desc="in={self.usage["input_tokens"]} out={self.usage["output_tokens"]} cache_read={self.usage["cache_read_input_tokens"]} embed={self.usage["embedding_tokens"]}"')
+        return ", ".join(entries)
+
+    def finish(self, status: str, cache: str = "miss"):
+        seconds = time.perf_counter() - self.started
+        labels = {**self.labels, "endpoint": self.endpoint}
+        registry.observe("lark_request_duration_seconds", labels, seconds)
+        registry.inc("lark_requests_total", {**labels, "status": status, "cache": cache})
+
+_current_trace = contextvars.ContextVar("lark_request_trace", default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextlib.contextmanager
+def request_trace(api_key: str = None, source: str = None, endpoint: str = None):
+    trace = RequestTrace(api_key, source, endpoint)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def _stage_labels(labels: dict) -> dict:
+    trace = _current_trace.get()
+    return {**(trace.labels if trace else {"api_key": UNLABELED, "source": UNLABELED}), **labels}
+
+def record_stage(stage: str, seconds: float, labels: dict = None, **attributes):
+    registry.observe("lark_stage_duration_seconds", {**_stage_labels(labels or {}), "stage": stage}, seconds)
+    trace = _current_trace.get()
+    if trace: trace.add_span(stage, seconds, attributes)
+
+@contextlib.contextmanager
+def span(stage: str, labels: dict = None, **attributes):
+    """Times the block as `stage`. `labels` overrides the trace's api_key/source (background Drive syncs
+    have no request trace); `attributes` only go into the trace's span list."""
+    started = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        record_stage(stage, time.perf_counter() - started, labels, **attributes)
+
+def record_llm_usage(call: str, input_tokens: int, output_tokens: int, cache_read_input_tokens: int = 0, cache_creation_input_tokens: int = 0):
+    labels = {**_stage_labels({}), "call": call}
+    registry.inc("lark_llm_tokens_total", {**labels, "direction": "input"}, input_tokens)
+    registry.inc("lark_llm_tokens_total", {**labels, "direction": "output"}, output_tokens)
+    registry.inc("lark_llm_tokens_total", {**labels, "direction": "cache_read"}, cache_read_input_tokens)
+    registry.inc("lark_llm_tokens_total", {**labels, "direction": "cache_write"}, cache_creation_input_tokens)
+    trace = _current_trace.get()
+    if trace: trace.add_usage(input_tokens=input_tokens, output_tokens=output_tokens, cache_read_input_tokens=cache_read_input_tokens,
+                              cache_creation_input_tokens=cache_creation_input_tokens, claude_calls=1)
+
+def record_analysis_failure(retrying: bool):
+    """One analysis response that failed schema validation; `retrying` when a repair call follows."""
+    registry.inc("lark_analysis_rejections_total", {**_stage_labels({}), "retrying": str(retrying).lower()})
+    trace = _current_trace.get()
+    if trace: trace.add_usage(parse_failures=1, repair_retries=int(retrying))
+
+def record_analysis_outcome(outcome: str):
+    registry.inc("lark_analysis_outcomes_total", {**_stage_labels({}), "outcome": outcome})
+
+def record_context_tokens(sent: int, full: int, dropped: int):
+    labels = _stage_labels({})
+    registry.inc("lark_context_tokens_total", {**labels, "kind": "sent"}, sent)
+    registry.inc("lark_context_tokens_total", {**labels, "kind": "full"}, full)
+    registry.inc("lark_context_dropped_candidates_total", labels, dropped)
+
+def record_embedding_tokens(tokens: int):
+    registry.inc("lark_embedding_tokens_total", _stage_labels({}), tokens)
+    trace = _current_trace.get()
+    if trace: trace.add_usage(embedding_tokens=tokens)
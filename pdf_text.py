@@ -0,0 +1,10 @@
+"""PDF text extraction for the spawned PDF worker processes. Each worker imports this module on its own, so it
+imports PyMuPDF and nothing else (importing core_logic there would load Chroma, the API clients and NumPy per worker)."""
+import fitz  # PyMuPDF
+
+def extract_text(pdf_content: bytes) -> str:
+    try:
+        with fitz.open(stream=pdf_content, filetype="pdf") as doc: return "".join(page.get_text() for page in doc)
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return ""
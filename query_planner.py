@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+PLANNER_MODE = os.getenv("PLANNER_MODE", "local")  # "local" (LLM fallback on low confidence), "llm" (always) or "compare"
+PLANNER_CONFIDENCE_THRESHOLD = float(os.getenv("PLANNER_CONFIDENCE_THRESHOLD", "0.6"))
+
+# Common ways recruiters write the stored vocabulary; only aliases whose target exists in the corpus are used.
+LEVEL_ALIASES = {"sr": "Senior", "sr.": "Senior", "jr": "Junior", "jr.": "Junior", "entry level": "Junior", "entry-level": "Junior",
+                 "mid-level": "Mid", "mid level": "Mid", "midlevel": "Mid", "intermediate": "Mid", "vice president": "VP",
+                 "team lead": "Lead", "tech lead": "Lead"}
+# Only unambiguous industry names: words like "software", "technology" or "auto" describe roles and skills far more
+# often than an employer's industry ("software architect", "auto-scaling").
+INDUSTRY_ALIASES = {"ecommerce": "E-commerce", "e commerce": "E-commerce", "fintech": "Finance", "financial services": "Finance",
+                    "banking": "Finance", "pharma": "Biotech", "life sciences": "Biotech", "health care": "Healthcare"}
+SKILL_ALIASES = {"ml": "Machine Learning", "amazon web services": "AWS", "google cloud": "GCP", "postgres": "SQL", "postgresql": "SQL",
+                 "mysql": "SQL", "ux": "UI/UX Design", "ui": "UI/UX Design", "backend": "Backend Development", "back-end": "Backend Development",
+                 "frontend": "Frontend Development", "front-end": "Frontend Development", "salesforce": "Salesforce CRM", "sap": "SAP ERP",
+                 "security": "Cybersecurity"}
+# Only a skill phrase right next to one of these cues ("no Java", "must have AWS", "AWS required") becomes a hard
+# must-not / must-have filter; every other skill stays a soft ranking signal. Skills joined by and/or/nor share the cue.
+NEGATION_CUES = re.compile(r"\b(?:no|not|without|excluding|except|(?:must|should|does|do) not(?: have| know| use)?)\s+$")
+REQUIREMENT_CUES = re.compile(r"\b(?:must[- ]have|must know|requires?|required|mandatory)\s*:?\s+$")
+REQUIREMENT_SUFFIXES = re.compile(r"^\s+(?:is |are )?(?:required|mandatory|a must(?:-have)?|must-have)\b")
+CLAUSE_SPLIT = re.compile(r"[,;]|[.](?=\s|$)|\bbut\b")
+SKILL_JOINER = re.compile(r"^\s*(?:and|or|nor|&|/)\s*$")
+# A hard filter removes candidates before retrieval, so a plan that extracts one needs more evidence to skip Claude.
+HARD_CONSTRAINT_PENALTY = 0.1
+# A level only becomes a filter when it modifies the role ("lead engineer", "Senior Python developer"), not when the
+# word is used as a verb or adjective elsewhere ("can lead our payments platform"). Nouns of stored job titles count too.
+ROLE_NOUNS = frozenset("engineer engineers developer developers programmer scientist analyst manager designer architect consultant specialist "
+                       "administrator director officer recruiter accountant researcher technician strategist coordinator executive marketer "
+                       "representative associate owner head nurse writer".split())
+LEVEL_MODIFIER_WORDS = 3  # words allowed between the level and the role noun, e.g. "Senior [machine learning] engineer"
+FUNCTION_WORDS = frozenset("a an the our your their my to who which that can will and or of for with on in at by as is are be".split())
+
+@dataclass
+class QueryPlan:
+    query: str
+    level: str = None
+    industry: str = None
+    skills: list = field(default_factory=list)
+    job_titles: list = field(default_factory=list)
+    confidence: float = 0.0
+    must_have_skills: list = field(default_factory=list)
+    must_not_have_skills: list = field(default_factory=list)
+    notes: list = field(default_factory=list)
+    # Values found only through an alias or away from the role noun: reranking hints, never filters.
+    soft_level: str = None
+    soft_industry: str = None
+
+    @property
+    def rank_level(self):
+        return self.level or self.soft_level
+
+    @property
+    def rank_industry(self):
+        return self.industry or self.soft_industry
+
+    def tool_input(self, num_results: int) -> dict:
+        tool_input = {"query": self.query, "num_results": num_results}
+        if self.level: tool_input["level"] = self.level
+        if self.industry: tool_input["industry"] = self.industry
+        if self.must_have_skills: tool_input["must_have_skills"] = self.must_have_skills
+        if self.must_not_have_skills: tool_input["must_not_have_skills"] = self.must_not_have_skills
+        return tool_input
+
+def _phrase_pattern(phrase: str) -> re.Pattern:
+    # Word boundaries that also work for phrases starting/ending in punctuation ("UI/UX Design", "sr.").
+    return re.compile(r"(?<![\w])" + re.escape(phrase.lower()) + r"(?![\w])")
+
+class QueryPlanner:
+    """Extracts resume_search_tool arguments (level, industry) plus skills and job titles from a recruiter
+    query by matching it against the vocabulary actually stored in the collection's metadata. The
+    vocabulary is reloaded whenever `version_fn()` changes."""
+
+    def __init__(self, metadata_loader, version_fn=lambda: 0):
+        self.metadata_loader = metadata_loader
+        self.version_fn = version_fn
+        self._version = None
+        self._lock = threading.Lock()
+        self.vocabulary = {"level": {}, "industry": {}, "skill": {}, "job_title": {}}
+        self.role_nouns = ROLE_NOUNS
+        self.counters = {"local": 0, "llm_fallback": 0, "compared": 0, "compare_agreed": 0}
+
+    def ensure_fresh(self):
+        version = self.version_fn()
+        if version == self._version: return
+        with self._lock:
+            if version == self._version: return
+            self._load(self.metadata_loader())
+            self._version = version
+
+    def _load(self, metadatas):
+        values = {"level": set(), "industry": set(), "skill": set(), "job_title": set()}
+        for metadata in metadatas:
+            if metadata.get("level"): values["level"].add(metadata["level"])
+            if metadata.get("industry"): values["industry"].add(metadata["industry"])
+            if metadata.get("job_title"): values["job_title"].add(metadata["job_title"])
+            values["skill"].update(skill.strip() for skill in (metadata.get("skills") or "").split(",") if skill.strip())
+        aliases = {"level": LEVEL_ALIASES, "industry": INDUSTRY_ALIASES, "skill": SKILL_ALIASES, "job_title": {}}
+        vocabulary = {}
+        for facet, facet_values in values.items():
+            phrases = {value.lower(): value for value in facet_values}
+            phrases.update({alias: target for alias, target in aliases[facet].items() if target in facet_values and alias not in phrases})
+            # Longest phrases first so "Director of Engineering" wins over "Director".
+            vocabulary[facet] = {phrase: (_phrase_pattern(phrase), phrases[phrase]) for phrase in sorted(phrases, key=len, reverse=True)}
+        self.vocabulary = vocabulary
+        self.role_nouns = ROLE_NOUNS | {title.split()[-1].lower() for title in values["job_title"] if title.split()}
+
+    def _match(self, facet: str, text: str, strong=lambda match, text: True) -> tuple:
+        """(strong values, weak values, text with every match masked). A value is strong when it was written as
+        stored (not through an alias) and `strong(match, text)` holds for one of its mentions."""
+        found, weak = [], []
+        for phrase, (pattern, value) in self.vocabulary[facet].items():
+            matches = list(pattern.finditer(text))
+            if not matches: continue
+            target = found if phrase == value.lower() and any(strong(match, text) for match in matches) else weak
+            if value not in target: target.append(value)
+            text = pattern.sub(lambda m: " " * len(m.group(0)), text)
+        return found, [value for value in weak if value not in found], text
+
+    def _modifies_role(self, match, text: str) -> bool:
+        """Whether a role noun follows the level within a few words, read from the unmasked query (titles are masked)."""
+        for word in text[match.end():].split()[:LEVEL_MODIFIER_WORDS + 1]:
+            word = word.strip(".,;:!?()")
+            if word in self.role_nouns: return True
+            if not word or word in FUNCTION_WORDS: return False
+        return False
+
+    @staticmethod
+    def _pick(plan: QueryPlan, facet: str, strong: list, weak: list):
+        """The hard value (one strong mention and nothing conflicting) or the soft hint; conflicting values are neither."""
+        values = strong + weak
+        if len(values) > 1:
+            plan.notes.append(f"ambiguous {facet} {values}")
+            return None, None
+        return (strong[0], None) if strong else (None, weak[0] if weak else None)
+
+    def _skill_runs(self, clause: str) -> list:
+        """Skill mentions in `clause` as runs of (start, end, [values]); mentions separated only by and/or/nor form one run."""
+        spans = []
+        for pattern, value in self.vocabulary["skill"].values():
+            for match in pattern.finditer(clause):
+                if not any(start < match.end() and match.start() < end for start, end, _ in spans): spans.append((match.start(), match.end(), value))
+        runs = []
+        for start, end, value in sorted(spans):
+            if runs and SKILL_JOINER.match(clause[runs[-1][1]:start]): runs[-1] = (runs[-1][0], end, runs[-1][2] + [value])
+            else: runs.append((start, end, [value]))
+        return runs
+
+    def _skill_constraints(self, text: str) -> tuple:
+        must_have, must_not_have = [], []
+        for clause in CLAUSE_SPLIT.split(text):
+            for start, end, skills in self._skill_runs(clause):
+                if NEGATION_CUES.search(clause[:start]): target = must_not_have
+                elif REQUIREMENT_CUES.search(clause[:start]) or REQUIREMENT_SUFFIXES.match(clause[end:]): target = must_have
+                else: continue
+                target.extend(skill for skill in skills if skill not in target)
+        return [skill for skill in must_have if skill not in must_not_have], must_not_have
+
+    def plan(self, query: str) -> QueryPlan:
+        text = original = " ".join(query.lower().split())
+        plan = QueryPlan(query=query)
+        plan.must_have_skills, plan.must_not_have_skills = self._skill_constraints(text)
+        # Titles are matched (and masked) first so "Marketing Manager" or "Technical Lead" don't also read as a level.
+        job_titles, titles_by_alias, text = self._match("job_title", text)
+        plan.job_titles = job_titles + titles_by_alias
+        levels, soft_levels, text = self._match("level", text, strong=lambda match, _: self._modifies_role(match, original))
+        industries, soft_industries, text = self._match("industry", text)
+        skills, skills_by_alias, text = self._match("skill", text)
+        plan.skills = [skill for skill in skills + skills_by_alias if skill not in plan.must_not_have_skills]
+        confidence = 0.5
+        plan.level, plan.soft_level = self._pick(plan, "level", levels, soft_levels)
+        plan.industry, plan.soft_industry = self._pick(plan, "industry", industries, soft_industries)
+        signals = bool(plan.level) + bool(plan.industry) + bool(plan.skills) + bool(plan.job_titles)
+        hints = bool(plan.soft_level) + bool(plan.soft_industry)
+        confidence += 0.15 * signals + 0.05 * hints - 0.3 * len(plan.notes) - HARD_CONSTRAINT_PENALTY * bool(plan.must_have_skills or plan.must_not_have_skills)
+        if len(re.findall(r"\w+", query)) < 3 and not signals + hints:
+            plan.notes.append("too short to plan")
+            confidence = 0.0
+        plan.confidence = round(max(0.0, min(1.0, confidence)), 2)
+        return plan
+
+    def record_comparison(self, plan: QueryPlan, llm_input: dict):
+        agreed = (llm_input.get("level") or None) == plan.level and (llm_input.get("industry") or None) == plan.industry
+        self.counters["compared"] += 1
+        self.counters["compare_agreed"] += agreed
+        print(f"PLANNER_COMPARE: agreed={agreed} local={{'level': {plan.level!r}, 'industry': {plan.industry!r}, 'confidence': {plan.confidence}}} llm={llm_input}")
+
+    def stats(self) -> dict:
+        return {**self.counters, "mode": PLANNER_MODE, "threshold": PLANNER_CONFIDENCE_THRESHOLD,
+                "vocabulary_sizes": {facet: len(set(value for _, value in phrases.values())) for facet, phrases in self.vocabulary.items()}}
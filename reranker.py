@@ -0,0 +1,51 @@
+import json
+import os
+import time
+
+import numpy as np
+
+RERANK_POOL_SIZE = int(os.getenv("RERANK_POOL_SIZE", "200"))
+# Each feature is scaled to [0, 1] before weighting; RERANK_WEIGHTS='{"skills": 0.3}' overrides individual weights.
+DEFAULT_RERANK_WEIGHTS = {"cosine": 0.5, "lexical": 0.2, "skills": 0.15, "level": 0.05, "industry": 0.05, "years": 0.05}
+RERANK_WEIGHTS = {**DEFAULT_RERANK_WEIGHTS, **json.loads(os.getenv("RERANK_WEIGHTS", "{}") or "{}")}
+
+def _matches(values: list, wanted) -> np.ndarray:
+    # `wanted` is one value or a collection of accepted values (a multi-value level/industry filter); matching is case-insensitive.
+    if not wanted: return np.zeros(len(values))
+    accepted = {str(value).casefold() for value in ([wanted] if isinstance(wanted, str) else wanted)}
+    return np.fromiter((str(value or "").casefold() in accepted for value in values), dtype=bool, count=len(values))
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min() if len(values) else 0.0
+    return (values - values.min()) / spread if spread > 0 else np.zeros_like(values)
+
+class Reranker:
+    """Second-stage scorer for the retrieval pool: one weighted sum over cosine similarity, BM25, skill
+    overlap, level/industry match and years of experience, computed as NumPy column operations."""
+
+    def __init__(self, weights: dict = None):
+        self.weights = {**RERANK_WEIGHTS, **(weights or {})}
+        self.counters = {"calls": 0, "candidates": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    def score(self, query_embedding: np.ndarray, embeddings: np.ndarray, lexical: np.ndarray, candidate_skills: list, levels: list, industries: list,
+              years: np.ndarray, query_skills: set = frozenset(), level=None, industry=None, min_years: float = 0.0) -> np.ndarray:
+        started = time.perf_counter()
+        cosine = embeddings @ query_embedding / (np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query_embedding) or 1.0) + 1e-12)
+        features = {"cosine": _min_max(cosine), "lexical": lexical / lexical.max() if len(lexical) and lexical.max() > 0 else np.zeros(len(lexical))}
+        features["skills"] = (np.fromiter((len(query_skills & skills) for skills in candidate_skills), dtype=np.float32, count=len(candidate_skills)) / len(query_skills)
+                              if query_skills else np.zeros(len(candidate_skills)))
+        features["level"] = _matches(levels, level)
+        features["industry"] = _matches(industries, industry)
+        # Years only count against a requirement stated in the query ("5+ years"), so they don't act as a seniority prior.
+        features["years"] = np.clip(years / min_years, 0.0, 1.0) if min_years > 0 else np.zeros(len(years))
+        scores = sum(self.weights.get(name, 0.0) * np.asarray(values, dtype=np.float32) for name, values in features.items())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.counters["calls"] += 1
+        self.counters["candidates"] += len(cosine)
+        self.counters["total_ms"] += elapsed_ms
+        self.counters["max_ms"] = max(self.counters["max_ms"], elapsed_ms)
+        return scores
+
+    def stats(self) -> dict:
+        calls = self.counters["calls"]
+        return {**self.counters, "avg_ms": round(self.counters["total_ms"] / calls, 3) if calls else 0.0, "weights": self.weights, "pool_size": RERANK_POOL_SIZE}
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+# Cosine similarity above which a differently-worded query reuses a cached answer; unset disables semantic hits.
+SEARCH_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("SEARCH_CACHE_SEMANTIC_THRESHOLD", "0") or 0)
+CORPUS_VERSIONS_PATH = os.getenv("CORPUS_VERSIONS_PATH", "./lark_db/corpus_versions.sqlite3")
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class CorpusVersions:
+    """Monotonic per-partition version numbers kept in a small SQLite file, so a write in any worker
+    (or in the ingest command) changes the cache keys every worker computes for that partition."""
+
+    def __init__(self, path: str = CORPUS_VERSIONS_PATH, refresh_seconds: float = 1.0):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._local = threading.local()
+        self._snapshot = {}
+        self._snapshot_at = 0.0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS corpus_versions (partition TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _cached(self, partition: str):
+        with self._lock:
+            if time.time() - self._snapshot_at < self.refresh_seconds: return self._snapshot.get(partition)
+        return None
+
+    def get(self, partition: str) -> int:
+        now = time.time()
+        version = self._cached(partition)
+        if version is not None: return version
+        try:
+            row = self._connection().execute("SELECT version FROM corpus_versions WHERE partition = ?", (partition,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Corpus version read failed: {e}")
+            return -1  # never matches a cached key, so a broken version store only costs cache hits
+        version = row[0] if row else 0
+        with self._lock:
+            self._snapshot[partition] = version
+            self._snapshot_at = now
+        return version
+
+    async def aget(self, partition: str) -> int:
+        """get() for the event loop: the in-memory copy while it is fresh, otherwise the SQLite read runs in a worker thread."""
+        version = self._cached(partition)
+        return version if version is not None else await asyncio.to_thread(self.get, partition)
+
+    def bump(self, partition: str):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT INTO corpus_versions (partition, version) VALUES (?, 1) ON CONFLICT(partition) DO UPDATE SET version = version + 1", (partition,))
+        except sqlite3.Error as e:
+            print(f"Corpus version bump failed for {partition}: {e}")
+        with self._lock:
+            self._snapshot.pop(partition, None)
+
+class SearchResponseCache:
+    """In-process TTL/LRU cache of whole search responses with request coalescing.
+
+    Keys cover the normalized query plus everything else that changes the answer (source, folders,
+    num_results, user partition, corpus versions), so corpus writes invalidate by changing the key.
+    Optionally, a miss falls back to the closest cached query with the same scope whose embedding is
+    within `semantic_threshold` cosine similarity."""
+
+    def __init__(self, ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 semantic_threshold: float = SEARCH_CACHE_SEMANTIC_THRESHOLD):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(query: str, scope: dict) -> tuple:
+        scope_key = hashlib.sha256(json.dumps(scope, sort_keys=True).encode("utf-8")).hexdigest()
+        query_key = hashlib.sha256(f"{scope_key}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+        return query_key, scope_key
+
+    def get(self, key: tuple, query_embedding: list = None) -> tuple:
+        """Returns (value, "hit" | "semantic_hit") or (None, None)."""
+        query_key, scope_key = key
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(query_key)
+            if entry is not None and entry["expires_at"] > now:
+                self._entries.move_to_end(query_key)
+                self.counters["hits"] += 1
+                return entry["value"], "hit"
+            if entry is not None:
+                del self._entries[query_key]
+            if query_embedding is not None and self.semantic_threshold > 0:
+                candidates = [(k, e) for k, e in self._entries.items() if e["scope_key"] == scope_key and e["embedding"] is not None and e["expires_at"] > now]
+                if candidates:
+                    matrix = np.stack([e["embedding"] for _, e in candidates])
+                    query_vector = np.asarray(query_embedding, dtype=np.float32)
+                    similarities = matrix @ query_vector / (np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0) + 1e-12)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.semantic_threshold:
+                        self._entries.move_to_end(candidates[best][0])
+                        self.counters["semantic_hits"] += 1
+                        return candidates[best][1]["value"], "semantic_hit"
+            self.counters["misses"] += 1
+            return None, None
+
+    def put(self, key: tuple, value: dict, query_embedding: list = None):
+        query_key, scope_key = key
+        embedding = np.asarray(query_embedding, dtype=np.float32) if query_embedding is not None else None
+        with self._lock:
+            self._entries[query_key] = {"value": value, "scope_key": scope_key, "embedding": embedding, "expires_at": time.time() + self.ttl_seconds}
+            self._entries.move_to_end(query_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    async def get_or_compute(self, key: tuple, compute, query_embedding: list = None, cacheable=lambda value: True) -> tuple:
+        """Returns (value, outcome) where outcome is "hit", "semantic_hit", "coalesced" or "miss". Concurrent
+        callers with the same key share one `compute()`; only values passing `cacheable` are stored. The compute
+        runs in its own task, so a caller that is cancelled (a client disconnect) leaves it running for the others;
+        it is only cancelled once every caller waiting on it is gone."""
+        query_key = key[0]
+        cached, outcome = self.get(key, query_embedding)
+        if cached is not None: return cached, outcome
+        flight = self._in_flight.get(query_key)
+        if flight is not None:
+            self.counters["coalesced"] += 1
+            outcome = "coalesced"
+        else:
+            flight = self._in_flight[query_key] = {"waiters": 0}
+            flight["task"] = asyncio.create_task(self._compute(key, flight, compute, query_embedding, cacheable))
+            outcome = "miss"
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(flight["task"]), outcome
+        finally:
+            flight["waiters"] -= 1
+            if not flight["waiters"] and not flight["task"].done():
+                # The last caller gave up; later callers start a fresh compute instead of joining a cancelled one.
+                self._forget(query_key, flight)
+                flight["task"].cancel()
+
+    async def _compute(self, key: tuple, flight: dict, compute, query_embedding: list, cacheable):
+        try:
+            value = await compute()
+            if cacheable(value): self.put(key, value, query_embedding)
+            return value
+        finally:
+            self._forget(key[0], flight)
+
+    def _forget(self, query_key: str, flight: dict):
+        if self._in_flight.get(query_key) is flight: del self._in_flight[query_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        return {**self.counters, "entries": entries, "in_flight": len(self._in_flight)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import random
+import re
+import uuid
+
+TEMPLATES_DIR = "mock_resume_database/raw_resumes"
+SYNTHETIC_NAMESPACE = uuid.UUID("5b0c3d2e-8f5a-4c57-9d0e-3f1a2b4c5d6e")
+
+def load_templates(path: str = TEMPLATES_DIR) -> list:
+    templates = []
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith(".json"): continue
+        with open(os.path.join(path, file_name), encoding="utf-8") as f: record = json.load(f)
+        if record.get("raw_text") and record.get("skills"): templates.append(record)
+    return templates
+
+def generate_resumes(count: int, templates: list = None, seed: int = 0):
+    """Yields `count` resumes shaped like the `raw_resumes` templates. Each one re-uses a template's text and
+    experience lines but gets a fresh id, name, contact details, level, industry, years of experience and
+    skill set drawn from the values seen across all templates, so facet and skill distributions stay realistic.
+    The same seed always produces the same corpus."""
+    templates = templates if templates is not None else load_templates()
+    if not templates: raise ValueError("No resume templates found.")
+    rng = random.Random(seed)
+    levels = sorted({template["level"] for template in templates})
+    industries = sorted({template["industry"] for template in templates})
+    skills_pool = sorted({skill for template in templates for skill in template["skills"]})
+    for i in range(count):
+        template = templates[i % len(templates)]
+        text = template["raw_text"]
+        name = f"Candidate {i} from Synthetic Labs"
+        email, phone = f"candidate.{i}@example.com", f"(555) {i // 10000 % 1000:03d}-{i % 10000:04d}"
+        level, industry = rng.choice(levels), rng.choice(industries)
+        skills = rng.sample(skills_pool, min(len(skills_pool), rng.randint(3, 7)))
+        role_years = sum(int(years) for years in re.findall(r"\((\d+) years?\)", text))
+        years = rng.randint(max(1, role_years), max(1, role_years) + 10)
+        text = text.replace(template["name"], name)
+        text = re.sub(r"Email:\s*[^\s|]+", f"Email: {email}", text)
+        text = re.sub(r"Phone:\s*[^\n|]+", f"Phone: {phone}", text)
+        text = text.replace(f"{template['level']} {template['job_title']} with", f"{level} {template['job_title']} with")
+        text = re.sub(r"with \d+ years in the .+? industry", f"with {years} years in the {industry} industry", text, count=1)
+        text = text.replace(", ".join(template["skills"]), ", ".join(skills))
+        # Experience lines mention individual template skills ("using Azure"); map them onto the new set.
+        for old_skill, new_skill in zip(template["skills"], skills * len(template["skills"])):
+            text = text.replace(f"using {old_skill}.", f"using {new_skill}.")
+        yield {"id": str(uuid.uuid5(SYNTHETIC_NAMESPACE, f"{seed}:{i}")), "name": name, "email": email, "phone": phone, "pdf_url": "",
+               "job_title": template["job_title"], "industry": industry, "level": level, "skills": skills, "raw_text": text}
+
+def write_corpus(path: str, count: int, seed: int = 0, templates_dir: str = TEMPLATES_DIR) -> str:
+    directory = os.path.dirname(path)
+    if directory: os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for resume in generate_resumes(count, load_templates(templates_dir), seed):
+            f.write(json.dumps(resume) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic resume corpus (JSONL) from the raw_resumes templates.")
+    parser.add_argument("count", type=int, help="Number of resumes, e.g. 10000, 100000 or 1000000.")
+    parser.add_argument("--output", default=None, help="Output .jsonl path (default: synthetic_<count>.jsonl).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--templates", default=TEMPLATES_DIR)
+    args = parser.parse_args()
+    path = write_corpus(args.output or f"synthetic_{args.count}.jsonl", args.count, args.seed, args.templates)
+    print(f"Wrote {args.count} resumes to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Offline backends (fakes.py) and throwaway state files for every test; set before core_logic and friends read
+# their configuration at import time.
+WORK_DIR = tempfile.mkdtemp(prefix="lark-tests-")
+os.environ.update({"EMBEDDING_BACKEND": "fake", "LLM_BACKEND": "fake", "DRIVE_BACKEND": "fake", "FAKE_EMBEDDING_DIM": "64", "FAKE_LLM_LATENCY_SECONDS": "0",
+                   "EMBEDDING_CACHE_PATH": os.path.join(WORK_DIR, "embedding_cache.sqlite3"), "CORPUS_VERSIONS_PATH": os.path.join(WORK_DIR, "corpus_versions.sqlite3"),
+                   "BATCH_JOBS_PATH": os.path.join(WORK_DIR, "batch_jobs.sqlite3"), "INDEX_SNAPSHOT_DIR": ""})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def lark():
+    """core_logic on the fake clients with a small synthetic Lark's Database in a temporary Chroma."""
+    import chromadb
+    import core_logic
+    import ingest
+    import synthetic_corpus
+    core_logic.initialize_api_clients()
+    core_logic.chroma_client = chromadb.PersistentClient(os.path.join(WORK_DIR, "chroma"))
+    corpus = synthetic_corpus.write_corpus(os.path.join(WORK_DIR, "resumes.jsonl"), 120)
+    ingest.ingest_resumes(corpus, core_logic.COLLECTION_NAME)
+    return core_logic
+
+@pytest.fixture
+def api(lark, monkeypatch):
+    """Makes httpx clients for the FastAPI app, authenticated with a valid key and without rate limits."""
+    import httpx
+    import api_server
+    monkeypatch.setattr(api_server.limiter, "enabled", False)
+    headers = {"Authorization": f"Bearer {next(iter(api_server.VALID_API_KEYS))}"}
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://test", headers=headers)
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+
+import api_server
+import metrics
+
+LARK = "Lark's Database"
+
+@pytest.fixture
+def malformed(lark):
+    """Every first analysis attempt drops the first candidate's phone; the repair call answers correctly."""
+    lark.global_async_client_anthropic.malformed_rate = 1.0
+    yield lark
+    lark.global_async_client_anthropic.malformed_rate = 0.0
+
+def _collect(generator) -> list:
+    async def collect():
+        return [event async for event in generator]
+    return asyncio.run(collect())
+
+def test_repair_produces_a_valid_analysis(malformed):
+    with metrics.request_trace("test-key") as trace:
+        result = malformed.search_lark_database("Software engineer with Python and AWS", 5)
+    assert result["status"] == "success"
+    api_server.SearchResponseWrapper(**result)
+    assert trace.usage["parse_failures"] == 1 and trace.usage["repair_retries"] == 1 and trace.usage["claude_calls"] == 2
+
+def test_failure_without_repair_retries(malformed, monkeypatch):
+    monkeypatch.setattr(malformed, "ANALYSIS_REPAIR_RETRIES", 0)
+    with metrics.request_trace("test-key") as trace:
+        result = malformed.search_lark_database("Software engineer with Python and AWS", 5)
+    assert result["status"] == "error" and "phone" in result["message"]
+    assert trace.usage["parse_failures"] == 1 and trace.usage["repair_retries"] == 0
+
+def test_prompt_cache_reads_the_static_prefix(lark, monkeypatch):
+    monkeypatch.setattr(lark, "PROMPT_CACHE_ENABLED", True)
+    usages = [lark.search_lark_database(f"Data Scientist with Machine Learning, variant {n}", 5)["usage"] for n in range(2)]
+    assert usages[1]["cache_read_input_tokens"] > 0 and usages[1]["cache_creation_input_tokens"] == 0
+
+def test_stream_never_sends_or_caches_invalid_candidates(malformed):
+    query = "Product Manager with Agile"
+    events = _collect(malformed.stream_claude_search(query, 5, LARK, [], "user", {}))
+    names = [name for name, _ in events]
+    streamed = [data for name, data in events if name == "candidate"]
+    assert all(malformed.candidate_validator.is_valid(candidate) for candidate in streamed)
+    assert streamed and "replace" in names and names[-1] == "done"
+    replaced = next(data for name, data in events if name == "replace")
+    assert all(malformed.candidate_validator.is_valid(candidate) for candidate in replaced)
+    cached = asyncio.run(malformed.perform_claude_search_with_tool_async(query, 5, LARK, [], "user", {}))
+    assert cached["cache"] == "hit" and cached["analysis_data"]["candidates"] == replaced
+    api_server.SearchResponseWrapper(**cached)
+
+def test_clean_stream_sends_no_replace(lark):
+    events = _collect(lark.stream_claude_search("DevOps Engineer with Kubernetes", 5, LARK, [], "user", {}))
+    assert "replace" not in [name for name, _ in events]
+    assert [name for name, _ in events][-1] == "done"
+
+def _parse_in_chunks(lark, text: str, size: int) -> list:
+    parser, found = lark._CandidateStreamParser(), []
+    for start in range(0, len(text), size): found.extend(parser.feed(text[start:start + size]))
+    return found
+
+def test_stream_parser_yields_each_candidate_once_whatever_the_chunking(lark):
+    candidates = [{"name": "Ada {Lovelace}", "summary": "Said \"hi]\" twice", "skills": ["Python", "C++"], "contact": {"email": "a@x.io"}},
+                  {"name": "Grace", "summary": "", "skills": [], "contact": {"email": None}}]
+    text = '{"overall_summary": "two [matches]", "candidates": ' + json.dumps(candidates) + ', "overall_recommendation": {"hire": ["Ada"]}}'
+    for size in (1, 3, 7, 64, len(text)):
+        assert _parse_in_chunks(lark, text, size) == candidates
+
+def test_stream_parser_skips_malformed_objects_and_stops_at_the_array_end(lark):
+    parser = lark._CandidateStreamParser()
+    assert parser.feed('{"candidates": [{"name": "A"}, {"name": bad}, ') == [{"name": "A"}]
+    assert parser.feed('{"name": "B"}] , "later": [{"name": "C"}]}') == [{"name": "B"}]
+    assert parser.done and parser.feed('{"name": "D"}') == []
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+
+import httpx
+
+QUERIES = ["Software engineer with Python and AWS", "Product Manager with Agile", "DevOps Engineer with Kubernetes"]
+
+def test_batch_job_writes_run_off_the_event_loop(lark, monkeypatch):
+    import api_server
+    monkeypatch.setattr(api_server.limiter, "enabled", False)
+    headers = {"Authorization": f"Bearer {next(iter(api_server.VALID_API_KEYS))}"}
+    writers = []
+    for name in ("create", "record", "finish"):
+        method = getattr(api_server.batch_jobs, name)
+        monkeypatch.setattr(api_server.batch_jobs, name, lambda *args, method=method, name=name: writers.append((name, threading.current_thread().name)) or method(*args))
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server.app), base_url="http://test") as client:
+            submitted = await client.post("/v1/search_candidates/batch/jobs", headers=headers, json={"items": [{"query": query, "id": str(i)} for i, query in enumerate(QUERIES)]})
+            assert submitted.status_code == 202
+            for _ in range(200):
+                job = (await client.get(f"/v1/search_candidates/batch/jobs/{submitted.json()['job_id']}", headers=headers)).json()
+                if job["status"] != "running": return job
+                await asyncio.sleep(0.05)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "done" and job["completed"] == len(QUERIES) and sorted(result["id"] for result in job["results"]) == ["0", "1", "2"]
+    assert [name for name, _ in writers] == ["create", "record", "record", "record", "finish"]
+    assert all(thread.startswith("batch-jobs") for _, thread in writers)
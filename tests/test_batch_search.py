@@ -0,0 +1,43 @@
+import asyncio
+
+LARK = "Lark's Database"
+
+def _batch(lark, queries: list) -> list:
+    return asyncio.run(lark.search_batch_async([{"query": query, "num_results": 5} for query in queries], LARK, [], "user", {}))
+
+def _record_claude_calls(lark, monkeypatch) -> list:
+    calls, claude = [], lark._claude_async
+    async def recording(call, request):
+        calls.append((call, request["messages"][0]["content"]))
+        return await claude(call, request)
+    monkeypatch.setattr(lark, "_claude_async", recording)
+    return calls
+
+def test_one_failing_item_does_not_fail_the_batch(api, lark, monkeypatch):
+    analyze = lark._analyze_async
+    async def failing(request, response=None):
+        if request["messages"][0]["content"].startswith("Data Scientist in Finance"): raise RuntimeError("analysis exploded")
+        return await analyze(request, response)
+    monkeypatch.setattr(lark, "_analyze_async", failing)
+    queries = ["Senior Software Engineer with Python and AWS in Tech, batch", "Data Scientist in Finance requires SQL, batch", "DevOps Engineer with Kubernetes, batch"]
+    async def scenario():
+        async with api() as client:
+            return await client.post("/v1/search_candidates/batch", json={"items": [{"query": query, "id": str(i)} for i, query in enumerate(queries)]})
+    body = asyncio.run(scenario()).json()
+    assert body["status"] == "partial"
+    assert [result["status"] for result in body["results"]] == ["success", "error", "success"]
+    assert "analysis exploded" in body["results"][1]["error"] and body["results"][0]["analysis_data"]["overall_summary"]
+
+def test_low_confidence_items_fall_back_to_claude_planning(lark, monkeypatch):
+    calls, counters = _record_claude_calls(lark, monkeypatch), dict(lark.query_planner.counters)
+    results = _batch(lark, ["Senior Software Engineer with Python and AWS in Tech, confident", "someone great to join our team"])
+    assert [result["status"] for result in results] == ["success", "success"]
+    assert [query for call, query in calls if call == "planning"] == ["someone great to join our team"]
+    assert lark.query_planner.counters["local"] == counters["local"] + 1 and lark.query_planner.counters["llm_fallback"] == counters["llm_fallback"] + 1
+
+def test_llm_planner_mode_plans_every_batch_item_with_claude(lark, monkeypatch):
+    monkeypatch.setattr(lark, "PLANNER_MODE", "llm")
+    calls = _record_claude_calls(lark, monkeypatch)
+    queries = ["Senior Software Engineer with Python and AWS in Tech, llm mode", "Data Scientist in Finance requires SQL, llm mode"]
+    assert all(result["status"] == "success" for result in _batch(lark, queries))
+    assert sorted(query for call, query in calls if call == "planning") == sorted(queries)
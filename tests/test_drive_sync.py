@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import pytest
+
+import drive_ingest
+from drive_ingest import DriveIngestionEngine, gdrive_record_id
+from metrics import key_label
+from fakes import FakeDriveService, FakeEmbedder
+
+USER = "user-1"
+FOLDER = "https://drive.google.com/drive/folders/folder-1"
+
+@pytest.fixture
+def drive(tmp_path, monkeypatch):
+    # Two files per listing page, so five files take three files().list calls.
+    monkeypatch.setattr(drive_ingest, "DRIVE_PAGE_SIZE", 2)
+    service, writes, pdf_executor = FakeDriveService(), [], ThreadPoolExecutor(max_workers=2)
+    engine = DriveIngestionEngine(service_factory=lambda token: service, embed_texts=lambda texts: FakeEmbedder(dim=16).embed(texts, "m"),
+                                  extract_text=lambda content: content.decode("utf-8"), pdf_executor_factory=lambda: pdf_executor,
+                                  embed_batch_size=2, on_write=writes.append)
+    collection = chromadb.PersistentClient(str(tmp_path / "chroma")).get_or_create_collection("gdrive_resumes")
+    for i in range(5): service.add_file("folder-1", f"file-{i}", f"resume-{i}.pdf", f"Resume {i}: Python engineer".encode("utf-8"))
+    yield service, engine, collection, writes
+    engine.shutdown()
+    pdf_executor.shutdown()
+
+def _sync(engine, collection) -> dict:
+    return engine.sync(collection, [FOLDER], USER, {"access_token": "token"})
+
+def test_paginated_listing_indexes_every_file(drive):
+    service, engine, collection, writes = drive
+    stats = _sync(engine, collection)
+    assert service.list_calls == 3 and service.download_calls == 5
+    assert {key: stats[key] for key in ("listed", "changed", "indexed", "failed")} == {"listed": 5, "changed": 5, "indexed": 5, "failed": 0}
+    assert collection.count() == 5 and writes == [USER] * 3
+
+def test_unchanged_files_are_not_downloaded_again(drive):
+    service, engine, collection, writes = drive
+    _sync(engine, collection)
+    stats = _sync(engine, collection)
+    assert stats["changed"] == 0 and stats["indexed"] == 0 and service.download_calls == 5 and len(writes) == 3
+
+def test_modified_files_are_reindexed(drive):
+    service, engine, collection, _ = drive
+    _sync(engine, collection)
+    service.add_file("folder-1", "file-2", "resume-2.pdf", b"Resume 2: now a data scientist")
+    # Without an md5Checksum the modifiedTime decides.
+    unhashed = service.add_file("folder-1", "file-4", "resume-4.pdf", b"Resume 4: Python engineer", modified_time="2024-02-01T00:00:00.000Z")
+    unhashed["md5Checksum"] = ""
+    stats = _sync(engine, collection)
+    assert stats["changed"] == 2 and stats["indexed"] == 2 and service.download_calls == 7
+    record = collection.get(ids=[gdrive_record_id(USER, "file-2")], include=["documents"])
+    assert record["documents"] == ["Resume 2: now a data scientist"] and collection.count() == 5
+    assert _sync(engine, collection)["changed"] == 0
+
+def test_legacy_records_are_replaced_once(drive):
+    service, engine, collection, writes = drive
+    deleted_chunks = []
+    engine.delete_chunks = deleted_chunks.extend
+    embedding = FakeEmbedder(dim=16).embed(["old"], "m")[0]
+    # A bare file id (the original scheme), a raw-key prefix, and another user's bare record that must survive.
+    collection.add(ids=["file-1", f"{USER}:file-2", "file-3"], embeddings=[embedding] * 3, documents=["old"] * 3,
+                   metadatas=[{"user_id": USER, "file_name": "resume-1.pdf"}, {"user_id": USER, "file_id": "file-2"}, {"user_id": "user-2", "file_name": "resume-3.pdf"}])
+    stats = _sync(engine, collection)
+    assert stats["removed_legacy"] == 2 and stats["indexed"] == 5 and sorted(deleted_chunks) == ["file-1", f"{USER}:file-2"]
+    ids = collection.get(where={"user_id": USER}, include=[])["ids"]
+    assert sorted(ids) == sorted(gdrive_record_id(USER, f"file-{i}") for i in range(5)) and not any(USER in record_id for record_id in ids)
+    assert all(record_id.startswith(key_label(USER)) for record_id in ids) and collection.get(ids=["file-3"])["ids"] == ["file-3"]
+    assert _sync(engine, collection)["removed_legacy"] == 0
+
+def test_drive_cache_hit_follows_a_sync_that_changed_files(lark, monkeypatch):
+    import asyncio
+    from fakes import make_pdf
+    service, folder = lark.fake_drive_service, "https://drive.google.com/drive/folders/cache-folder"
+    service.add_file("cache-folder", "cache-1", "ada.pdf", make_pdf("Ada Lovelace\nada@example.com\nSenior Python engineer, 9 years of AWS"))
+    def search():
+        return asyncio.run(lark.perform_claude_search_with_tool_async("Python engineer", 3, "Google Drive", [folder], "cache-user", {"access_token": "token"}))
+    assert search()["status"] == "success"
+    listed = service.list_calls
+    # Within DRIVE_SYNC_MIN_INTERVAL_SECONDS the hit reuses the finished sync instead of listing again.
+    assert search()["cache"] == "hit" and service.list_calls == listed
+    service.add_file("cache-folder", "cache-2", "grace.pdf", make_pdf("Grace Hopper\ngrace@example.com\nLead Python engineer, 15 years"))
+    monkeypatch.setattr(drive_ingest, "DRIVE_SYNC_MIN_INTERVAL_SECONDS", 0)
+    result = search()
+    assert "cache" not in result and service.list_calls == listed + 1
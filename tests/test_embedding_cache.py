@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import tracemalloc
+
+from embedding_cache import EmbeddingCache, cache_key
+from fakes import FakeEmbedder
+
+def _cache(tmp_path, **kwargs) -> EmbeddingCache:
+    return EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), **kwargs)
+
+def test_memory_then_disk_then_compute(tmp_path):
+    embedder = FakeEmbedder(dim=16)
+    cache = _cache(tmp_path)
+    first = cache.get_many(["Senior  Python\nengineer", "Data scientist"], "m", embedder.embed)
+    assert embedder.calls == 1 and cache.counters["misses"] == 2
+    # Whitespace variants share the entry; a repeat is served from memory.
+    assert cache.get("Senior Python engineer", "m", embedder.embed) == first[0]
+    assert cache.counters["memory_hits"] == 1
+    # A second process (empty LRU, same file) reads the disk tier.
+    other = _cache(tmp_path)
+    assert other.get_many(["Data scientist"], "m", embedder.embed) == [first[1]]
+    assert other.counters["disk_hits"] == 1 and embedder.calls == 1
+
+def test_duplicates_are_computed_once(tmp_path):
+    computed = []
+    def compute(texts, model):
+        computed.extend(texts)
+        return [[float(len(text))] * 4 for text in texts]
+    vectors = _cache(tmp_path).get_many(["a b", "a  b", "c"], "m", compute)
+    assert computed == ["a b", "c"] and vectors[0] == vectors[1]
+
+def test_eviction_by_entries_and_bytes(tmp_path):
+    embedder = FakeEmbedder(dim=64)
+    by_entries = _cache(tmp_path, max_entries=2)
+    by_entries.get_many(["one", "two", "three"], "m", embedder.embed)
+    assert by_entries.stats()["memory_entries"] == 2 and by_entries.counters["evictions"] == 1
+    assert cache_key("m", "one") not in by_entries._memory
+    by_bytes = EmbeddingCache(path="", max_bytes=1000)
+    by_bytes.get_many([f"text {n}" for n in range(10)], "m", embedder.embed)
+    assert 0 < by_bytes.stats()["memory_bytes"] <= 1000 and by_bytes.stats()["memory_entries"] < 10
+
+def test_byte_bound_matches_real_memory(tmp_path):
+    embedder = FakeEmbedder(dim=1536)
+    texts = [f"job description {n}" for n in range(200)]
+    vectors = embedder.embed(texts)
+    cache = EmbeddingCache(path="")
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    cache.get_many(texts, "m", lambda batch, model: vectors)
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    # Within 25% of what tracemalloc sees (dict nodes and bookkeeping are not counted).
+    assert cache.stats()["memory_bytes"] >= 0.75 * used
+
+def test_async_lookups_read_and_write_disk_off_the_event_loop(tmp_path, monkeypatch):
+    embedder, threads = FakeEmbedder(dim=16), []
+    cache = _cache(tmp_path)
+    for name in ("_lookup_disk", "_store_disk"):
+        method = getattr(cache, name)
+        monkeypatch.setattr(cache, name, lambda *args, method=method, name=name: threads.append((name, threading.current_thread() is threading.main_thread())) or method(*args))
+    async def compute(texts, model): return embedder.embed(texts, model)
+    first = asyncio.run(cache.aget_many(["Data scientist", "ML engineer"], "m", compute))
+    assert threads == [("_lookup_disk", False), ("_store_disk", False)]
+    # Memory hits never leave the event loop.
+    assert asyncio.run(cache.aget_many(["Data scientist"], "m", compute)) == [first[0]] and len(threads) == 2
+    assert _cache(tmp_path).get_many(["ML engineer"], "m", embedder.embed) == [first[1]] and embedder.calls == 1
+
+def test_fake_vectors_are_not_stored_under_the_real_model(lark):
+    text = "Staff platform engineer for the fake-backend cache test"
+    vector = lark.get_embeddings([text])[0]
+    real, fake = cache_key("text-embedding-3-small", text), cache_key(f"fake:{lark.fake_embedder.dim}", text)
+    assert lark.embedding_cache._lookup_disk([real]) == {} and real not in lark.embedding_cache._memory
+    assert list(lark.embedding_cache._lookup_disk([fake]).values())[0].tolist() == vector
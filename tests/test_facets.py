@@ -0,0 +1,49 @@
+import asyncio
+
+from candidate_store import CandidateStore
+
+ROWS = [
+    ({"level": "Senior", "industry": "Tech", "job_title": "Software Engineer", "skills": "Python, AWS"}, 8.0),
+    ({"level": "Junior", "industry": "Tech", "job_title": "Software Engineer", "skills": "Python"}, 2.0),
+    ({"level": "Senior", "industry": "Finance", "job_title": "Data Scientist", "skills": "SQL, python"}, 12.0),
+    ({"level": "Mid", "industry": "Finance", "job_title": "Product Manager", "skills": "Agile"}, 5.0),
+    ({"level": "Senior", "industry": "Tech", "job_title": "Software Engineer", "skills": "Python, Go"}, 20.0),
+]
+
+def _store() -> CandidateStore:
+    store = CandidateStore(capacity=2)  # grows past the first word while rows are added
+    for slot, (metadata, years) in enumerate(ROWS): store.add(slot, metadata, years)
+    store.remove(4)
+    return store
+
+def test_counts_under_a_filter():
+    store = _store()
+    slots = store.select(required=[store.any_of("level", ["senior", "JUNIOR"]), store.bits("skills", "Python")])
+    assert list(slots) == [0, 1, 2]
+    counts = store.counts(slots)
+    assert counts["total"] == 3
+    assert counts["facets"] == {"level": {"Senior": 2, "Junior": 1}, "industry": {"Tech": 2, "Finance": 1},
+                                "job_title": {"Software Engineer": 2, "Data Scientist": 1}, "skills": {"Python": 3, "AWS": 1, "SQL": 1}}
+    assert counts["years_of_experience"] == {"1+": 3, "3+": 2, "5+": 2, "10+": 1, "15+": 0}
+
+def test_counts_skip_removed_rows_and_respect_the_limit():
+    counts = _store().counts(limit=1)
+    assert counts["total"] == 4 and counts["years_of_experience"]["15+"] == 0
+    assert counts["facets"]["level"] == {"Senior": 2} and counts["facets"]["skills"] == {"Python": 3}
+
+def test_facets_endpoint(api, lark):
+    async def scenario():
+        async with api() as client:
+            filtered = await client.post("/v1/facets", json={"filters": {"level": ["senior"], "min_years": 5}})
+            planned = await client.post("/v1/facets", json={"query": "Senior Python engineer in Tech"})
+            unauthenticated = await client.post("/v1/facets", json={}, headers={"Authorization": ""})
+            return filtered, planned, unauthenticated
+    filtered, planned, unauthenticated = asyncio.run(scenario())
+    assert filtered.status_code == 200 and unauthenticated.status_code in (401, 403)
+    body = filtered.json()
+    store = lark.lexical_index.store
+    expected = store.counts(store.select(required=[store.any_of("level", ["Senior"]), store.years_between(min_years=5)]))
+    assert body["filters"] == {"level": ["senior"], "min_years": 5} and 0 < body["total"] < store.counts()["total"]
+    assert {key: body[key] for key in ("total", "facets", "years_of_experience")} == expected and set(body["facets"]["level"]) == {"Senior"}
+    # Without explicit filters the planner's hard constraints for the query apply.
+    assert planned.json()["filters"] == {"level": "Senior", "industry": "Tech"} and planned.json()["total"] <= store.counts()["total"]
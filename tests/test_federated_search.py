@@ -0,0 +1,35 @@
+import asyncio
+
+import core_logic
+from core_logic import fuse_ranked_candidates
+
+def _candidate(name: str, email: str = "", text: str = "") -> dict:
+    return {"resume_id": name, "name": name, "contact_information": {"email": email, "phone": ""}, "raw_resume_text": text or f"{name} resume"}
+
+def test_rrf_orders_by_summed_reciprocal_ranks():
+    a, b, c, d = (_candidate(name, f"{name}@example.com") for name in "abcd")
+    fused = fuse_ranked_candidates({"lark": [a, b, c], "gdrive": [d, b]}, num_results=3)
+    # b is second in both lists (2/62) and beats either first place (1/61); ties keep the source order.
+    assert [candidate["name"] for candidate in fused] == ["b", "a", "d"]
+    assert fused[0]["sources"] == ["lark", "gdrive"] and fused[1]["sources"] == ["lark"]
+
+def test_duplicates_across_sources_are_merged():
+    lark = [_candidate("lark-ada", "Ada@Example.com "), _candidate("lark-anon", text="No email\n  here")]
+    drive = [_candidate("drive-ada", "ada@example.com"), _candidate("drive-anon", text="no email here")]
+    fused = fuse_ranked_candidates({"lark": lark, "gdrive": drive}, num_results=10)
+    assert [candidate["resume_id"] for candidate in fused] == ["lark-ada", "lark-anon"]
+    assert all(candidate["sources"] == ["lark", "gdrive"] for candidate in fused)
+
+def test_a_source_that_times_out_is_reported_and_the_other_is_returned(lark, monkeypatch):
+    async def hanging(*args): await asyncio.sleep(5)
+    monkeypatch.setattr(core_logic, "_drive_candidates_async", hanging)
+    monkeypatch.setattr(core_logic, "FEDERATED_SOURCE_TIMEOUT_SECONDS", 0.2)
+    result = asyncio.run(core_logic.search_both_async("Senior Python engineer with AWS", 3, [], "user", {"access_token": "token"}))
+    assert result["status"] == "success" and result["source_status"] == {"lark": "ok", "gdrive": "timeout"}
+    assert result["analysis_data"]["candidates"]
+
+def test_a_failing_source_is_reported(lark, monkeypatch):
+    async def failing(*args): raise RuntimeError("drive down")
+    monkeypatch.setattr(core_logic, "_drive_candidates_async", failing)
+    result = asyncio.run(core_logic.search_both_async("Senior Python engineer with AWS", 3, [], "user", {"access_token": "token"}))
+    assert result["status"] == "success" and result["source_status"] == {"lark": "ok", "gdrive": "error: drive down"}
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from conftest import WORK_DIR
+from index_snapshot import IndexSnapshot, build_snapshot
+from lexical_index import LexicalIndex
+from query_planner import QueryPlanner
+
+QUERIES = ["Senior Python engineer with AWS", "data scientist healthcare machine learning", "kubernetes devops", "nonexistentterm"]
+FILTERS = [{}, {"level": "Senior"}, {"industry": ["Tech", "Finance"], "min_years": 5}, {"must_have_skills": ["Python"], "must_not_have_skills": ["Java"]},
+           {"must_have_skills": ["Kubernetes"]}]
+
+@pytest.fixture(scope="module")
+def snapshot(lark):
+    root = os.path.join(WORK_DIR, "snapshots")
+    manifest = build_snapshot(lark.chroma_client, lark.COLLECTION_NAME, root, lark.chunk_collection_name(lark.COLLECTION_NAME))
+    return IndexSnapshot(os.path.join(root, manifest["version"]))
+
+def _indexes(snapshot):
+    built = LexicalIndex(fingerprint_loader=lambda: [], document_loader=lambda ids: snapshot.iter_records(ids))
+    for record_id, document, metadata in snapshot.iter_records(): built._add(record_id, document, metadata)
+    mapped = LexicalIndex(fingerprint_loader=None, document_loader=None, snapshot_loader=lambda: snapshot)
+    mapped.ensure_fresh()
+    return built, mapped
+
+def test_mapped_lexical_index_matches_a_built_one(snapshot):
+    built, mapped = _indexes(snapshot)
+    assert mapped.mapped == snapshot.version and built.mapped is None
+    for query in QUERIES:
+        built_scores, mapped_scores = built.bm25_scores(query), mapped.bm25_scores(query)
+        assert {built.ids[slot]: round(score, 6) for slot, score in built_scores.items()} == {mapped.ids[slot]: round(score, 6) for slot, score in mapped_scores.items()}
+    for filters in FILTERS:
+        built_allowed, mapped_allowed = built.allowed_slots(**filters), mapped.allowed_slots(**filters)
+        assert (built_allowed is None) == (mapped_allowed is None)
+        if built_allowed is not None: assert [built.ids[slot] for slot in built_allowed] == [mapped.ids[slot] for slot in mapped_allowed]
+        assert built.store.counts(built_allowed) == mapped.store.counts(mapped_allowed)
+    assert all(built.slot_skills[slot] == mapped.slot_skills[slot] for slot in range(snapshot.count))
+
+def test_planner_vocabulary_from_snapshot_facets(lark, snapshot):
+    from_metadata = QueryPlanner(metadata_loader=lambda: (snapshot.metadata(row) for row in range(snapshot.count)))
+    from_metadata.ensure_fresh()
+    from_facets = QueryPlanner(metadata_loader=lambda: ({facet: value} for facet, values in snapshot.facet_values.items() for value in values))
+    from_facets.ensure_fresh()
+    assert from_metadata.vocabulary.keys() == from_facets.vocabulary.keys()
+    assert all(from_metadata.vocabulary[facet].keys() == from_facets.vocabulary[facet].keys() for facet in from_metadata.vocabulary)
+
+def test_format_1_snapshot_builds_the_index_from_documents(lark, snapshot):
+    # Drop the lexical section, as a snapshot written before it existed looks.
+    with open(os.path.join(snapshot.path, "manifest.json"), encoding="utf-8") as f: manifest = json.load(f)
+    del manifest["lexical"]
+    manifest["format_version"] = 1
+    with open(os.path.join(snapshot.path, "manifest.json"), "w", encoding="utf-8") as f: json.dump(manifest, f)
+    old = IndexSnapshot(snapshot.path)
+    index = LexicalIndex(fingerprint_loader=lambda: [(record_id, 0) for record_id in old.ids], document_loader=old.iter_records, snapshot_loader=lambda: old)
+    index.ensure_fresh()
+    assert index.mapped is None and index.live_count == old.count
+    assert index.top(index.bm25_scores("python"), 3)
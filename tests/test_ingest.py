@@ -0,0 +1,73 @@
+import os
+import threading
+
+import core_logic
+import ingest
+import synthetic_corpus
+from conftest import WORK_DIR
+from context_builder import build_context, estimate_tokens
+
+def test_embedding_requests_respect_input_and_token_caps(monkeypatch):
+    monkeypatch.setattr(core_logic, "EMBED_REQUEST_MAX_INPUTS", 100)
+    monkeypatch.setattr(core_logic, "EMBED_REQUEST_MAX_TOKENS", 1000)
+    texts = ["x" * 40] * 250 + ["y" * 8000] + ["z" * 40] * 10
+    requests = list(core_logic._embedding_requests(texts))
+    assert [text for request in requests for text in request] == texts
+    assert all(len(request) <= 100 for request in requests)
+    assert all(sum(core_logic.estimate_tokens(text) for text in request) <= 1000 or len(request) == 1 for request in requests)
+
+def test_large_flush_embeds_chunks_in_api_sized_requests(lark):
+    # ~700 resumes x ~4 sections is more chunks than one embeddings request may carry (the fake enforces 2048).
+    corpus = synthetic_corpus.write_corpus(os.path.join(WORK_DIR, "large.jsonl"), 700, seed=7)
+    collection_name = "test_large_flush"
+    stats = ingest.ingest_resumes(corpus, collection_name, write_batch_size=2048)
+    chunks = core_logic.chroma_client.get_collection(core_logic.chunk_collection_name(collection_name))
+    assert stats["written"] == 700 and chunks.count() > 2048
+
+def test_failed_chunk_write_leaves_the_batch_unwritten(lark, monkeypatch):
+    corpus = synthetic_corpus.write_corpus(os.path.join(WORK_DIR, "small.jsonl"), 20, seed=9)
+    collection_name = "test_atomic_flush"
+    def fail(*args): raise RuntimeError("embeddings unavailable")
+    monkeypatch.setattr(core_logic, "write_resume_chunks", fail)
+    try:
+        ingest.ingest_resumes(corpus, collection_name)
+    except RuntimeError:
+        pass
+    assert core_logic.chroma_client.get_collection(collection_name).count() == 0
+    monkeypatch.undo()
+    assert ingest.ingest_resumes(corpus, collection_name)["written"] == 20
+    assert core_logic.chroma_client.get_collection(core_logic.chunk_collection_name(collection_name)).count() > 0
+
+def test_chunks_are_embedded_on_the_pool_threads(lark, monkeypatch):
+    corpus = synthetic_corpus.write_corpus(os.path.join(WORK_DIR, "threads.jsonl"), 30, seed=11)
+    embed, on_main_thread = core_logic.embed_resume_chunks, []
+    def recording(*args):
+        on_main_thread.append(threading.current_thread() is threading.main_thread())
+        return embed(*args)
+    monkeypatch.setattr(core_logic, "embed_resume_chunks", recording)
+    assert ingest.ingest_resumes(corpus, "test_chunk_threads", embed_batch_size=10)["written"] == 30
+    assert on_main_thread == [False] * 3
+    assert core_logic.chroma_client.get_collection(core_logic.chunk_collection_name("test_chunk_threads")).count() > 30
+
+def _scored(resume_id: str, words: int) -> list:
+    return [(1.0 - position / 10, position, section, f"{resume_id} {section} " + "kubernetes " * words) for position, section in enumerate(["Experience", "Skills", "Education"])]
+
+def test_context_stays_within_the_token_budget():
+    candidates = [{"resume_id": f"r{i}", "name": f"Candidate {i}", "resume_pdf_url": f"https://example.com/{i}.pdf"} for i in range(10)]
+    context, stats = build_context("kubernetes", candidates, {f"r{i}": _scored(f"r{i}", 60) for i in range(10)}, token_budget=800, max_chunks=2)
+    assert stats["tokens"] <= 800 and stats["dropped"] == 10 - len(context) > 0
+    assert [entry["name"] for entry in context] == [f"Candidate {i}" for i in range(len(context))]
+    assert all(entry["resume_excerpts"].count("kubernetes ") <= 2 * 60 for entry in context)
+    # A budget too small for even the best chunk still sends the top candidate, cut to fit.
+    context, stats = build_context("kubernetes", candidates, {"r0": _scored("r0", 2000)}, token_budget=100)
+    assert [entry["name"] for entry in context] == ["Candidate 0"] and stats["tokens"] <= 100
+    assert estimate_tokens(context[0]["resume_excerpts"]) < 100
+
+def test_context_lists_each_candidate_once():
+    # The same profile found twice (here by Lark and by Drive, with the email in another case) goes in once, in its best rank.
+    ada = {"resume_id": "r1", "name": "Ada Lovelace", "contact_information": {"email": "ada@example.com"}}
+    candidates = [ada, {"resume_id": "r2", "name": "Grace Hopper", "contact_information": {"email": "grace@example.com"}},
+                  {"name": "Ada Lovelace", "contact_information": {"email": "ADA@example.com "}, "raw_resume_text": "Skills: Kubernetes"}, dict(ada)]
+    context, stats = build_context("kubernetes", candidates, {"r1": _scored("r1", 5), "r2": _scored("r2", 5)}, key=core_logic._candidate_fingerprint)
+    assert [entry["name"] for entry in context] == ["Ada Lovelace", "Grace Hopper"]
+    assert "r1 Experience" in context[0]["resume_excerpts"] and stats["candidates"] == 2 and stats["dropped"] == 0
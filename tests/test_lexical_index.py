@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+import lexical_index
+from lexical_index import LexicalIndex, metadata_fingerprint
+
+@pytest.fixture(autouse=True)
+def incremental(monkeypatch):
+    # The corpus is tiny, so any removal would otherwise trigger a full rebuild instead of the incremental path.
+    monkeypatch.setattr(lexical_index, "LEXICAL_COMPACT_RATIO", 1.0)
+
+class FakeCollection:
+    """Records by id plus a version bumped on every write, like Chroma with corpus_versions."""
+
+    def __init__(self, records: dict):
+        self.records = dict(records)
+        self.version = 0
+
+    def upsert(self, record_id: str, document: str, metadata: dict):
+        self.records[record_id] = (document, metadata)
+        self.version += 1
+
+    def delete(self, record_id: str):
+        del self.records[record_id]
+        self.version += 1
+
+    def index(self) -> LexicalIndex:
+        return LexicalIndex(fingerprint_loader=lambda: [(record_id, metadata_fingerprint(metadata)) for record_id, (_, metadata) in self.records.items()],
+                            document_loader=lambda ids: [(record_id, *self.records[record_id]) for record_id in (ids if ids is not None else list(self.records))],
+                            version_fn=lambda: self.version)
+
+def _collection() -> FakeCollection:
+    return FakeCollection({
+        "dev-001": ("Senior engineer, 8 years of Python and AWS", {"level": "Senior", "industry": "Tech", "skills": "Python, AWS", "content_hash": "a"}),
+        "dev-002": ("Junior engineer, 2 years of Java", {"level": "Junior", "industry": "Tech", "skills": "Java", "content_hash": "b"}),
+        "pm-001": ("Product manager, 5 years of Agile", {"level": "Mid", "industry": "Finance", "skills": "Agile", "content_hash": "c"}),
+    })
+
+def _ids(index, slots) -> set:
+    return {index.ids[slot] for slot in slots}
+
+def test_filters_and_bm25():
+    index = _collection().index()
+    index.ensure_fresh()
+    assert _ids(index, index.allowed_slots(level=["Senior", "Junior"])) == {"dev-001", "dev-002"}
+    assert _ids(index, index.allowed_slots(industry="Tech", must_not_have_skills=["Java"])) == {"dev-001"}
+    assert _ids(index, index.allowed_slots(min_years=4)) == {"dev-001", "pm-001"}
+    assert index.allowed_slots() is None
+    assert [record_id for record_id, _ in index.top(index.bm25_scores("java engineer"), 1)] == ["dev-002"]
+
+def test_upsert_under_existing_id_reindexes_the_record():
+    collection = _collection()
+    index = collection.index()
+    index.ensure_fresh()
+    collection.upsert("dev-001", "Junior engineer, 1 year of Go", {"level": "Junior", "industry": "Tech", "skills": "Go", "content_hash": "d"})
+    index.ensure_fresh()
+    counts = index.store.counts()
+    assert counts["total"] == 3 and "Senior" not in counts["facets"]["level"] and counts["facets"]["level"]["Junior"] == 2
+    assert _ids(index, index.allowed_slots(level="Senior", min_years=1)) == set()
+    assert _ids(index, index.allowed_slots(must_have_skills=["Go"])) == {"dev-001"}
+    assert index.bm25_scores("python") == {}
+
+def test_delete_and_unchanged_records():
+    collection = _collection()
+    index = collection.index()
+    index.ensure_fresh()
+    slot = index.slot_of["pm-001"]
+    collection.delete("dev-002")
+    index.ensure_fresh()
+    assert index.slot_of["pm-001"] == slot and "dev-002" not in index.slot_of
+    assert index.store.counts()["total"] == 2
+
+def test_readers_during_refreshes():
+    collection = _collection()
+    index = collection.index()
+    index.ensure_fresh()
+    errors, done = [], threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                with index.reading():
+                    allowed = index.allowed_slots(industry="Tech")
+                    scores = index.bm25_scores("python engineer", allowed)
+                    assert all(index.store.years[slot] >= 0 for slot in scores)
+                    index.top(scores, 3)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers: reader.start()
+    for i in range(300):
+        collection.upsert(f"dev-{i + 100}", f"Engineer, {i % 9} years of Python", {"level": "Mid", "industry": "Tech", "skills": "Python", "content_hash": str(i)})
+        if i % 3 == 0: collection.delete(f"dev-{i + 100}")
+        index.ensure_fresh()
+    done.set()
+    for reader in readers: reader.join()
+    assert not errors
+    assert index.store.counts()["total"] == len(collection.records)
+
+def test_background_refresh_serves_the_previous_index():
+    collection = _collection()
+    index = collection.index()
+    index.ensure_fresh(background=True)  # the first build happens inline
+    assert index.store.counts()["total"] == 3
+    scanning, release = threading.Event(), threading.Event()
+    load = index.fingerprint_loader
+    def slow_load():
+        scanning.set()
+        release.wait(5)
+        return load()
+    index.fingerprint_loader = slow_load
+    collection.upsert("dev-003", "Senior engineer, 10 years of Rust", {"level": "Senior", "industry": "Tech", "skills": "Rust", "content_hash": "e"})
+    index.ensure_fresh(background=True)
+    assert scanning.wait(5) and index.refreshing()
+    # The query does not wait for the scan and still sees the old index.
+    index.ensure_fresh(background=True)
+    assert index.store.counts()["total"] == 3 and index.stats()["refreshing"]
+    release.set()
+    index._refresher.join(5)
+    assert not index.refreshing() and _ids(index, index.allowed_slots(must_have_skills=["Rust"])) == {"dev-003"}
@@ -0,0 +1,27 @@
+import asyncio
+import re
+
+import api_server
+import metrics
+
+def test_search_reports_server_timing_and_metrics(api, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TIMING_HEADER", True)
+
+    async def scenario():
+        async with api() as client:
+            search = await client.post("/v1/search_candidates", json={"query": "Data engineer with Spark and Airflow for the metrics test", "source": "Lark's Database", "num_results": 3})
+            unauthenticated = await client.get("/metrics", headers={"Authorization": ""})
+            return search, unauthenticated, await client.get("/metrics")
+
+    search, unauthenticated, scraped = asyncio.run(scenario())
+    assert search.status_code == 200
+    timing = search.headers["Server-Timing"]
+    assert all(re.search(rf"(^|, ){stage};dur=[\d.]+", timing) for stage in ("embedding", "context_build", "claude", "total"))
+    assert unauthenticated.status_code in (401, 403)
+    body = scraped.text
+    assert re.search(r'^lark_stage_duration_seconds_bucket\{.*stage="context_build".*le="\+Inf".*\} [1-9]', body, re.M)
+    assert re.search(r'^lark_request_duration_seconds_count\{.*endpoint="search".*\} [1-9]', body, re.M)
+    assert re.search(r'^lark_requests_total\{.*cache="miss".*endpoint="search".*status="success".*\} [1-9]', body, re.M)
+    assert re.search(r'^lark_context_tokens_total\{.*kind="sent".*\} [1-9]', body, re.M)
+    # Series carry the key's fingerprint, never the key itself.
+    assert next(iter(api_server.VALID_API_KEYS)) not in body
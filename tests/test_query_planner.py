@@ -0,0 +1,91 @@
+import pytest
+
+from query_planner import PLANNER_CONFIDENCE_THRESHOLD, QueryPlanner
+
+METADATAS = [
+    {"level": "Senior", "industry": "Tech", "job_title": "Software Engineer", "skills": "Python, AWS, Kubernetes, Java"},
+    {"level": "Junior", "industry": "Finance", "job_title": "Data Scientist", "skills": "SQL, Machine Learning, C++"},
+    {"level": "Lead", "industry": "Automotive", "job_title": "DevOps Engineer", "skills": "AWS, Terraform"},
+]
+
+@pytest.fixture
+def planner():
+    planner = QueryPlanner(lambda: METADATAS)
+    planner.ensure_fresh()
+    return planner
+
+@pytest.mark.parametrize("query", [
+    "Looking for an engineer with Python, no remote, AWS required",
+    "Senior Python engineer without a degree is fine, Kubernetes a plus",
+    "Python developer who is not afraid of AWS or Kubernetes",
+])
+def test_cues_only_bind_to_the_adjacent_skill(planner, query):
+    plan = planner.plan(query)
+    assert plan.must_not_have_skills == []
+    assert "AWS" not in plan.must_not_have_skills and "Kubernetes" not in plan.must_not_have_skills
+
+def test_requirement_suffix(planner):
+    plan = planner.plan("Looking for an engineer with Python, no remote, AWS required")
+    assert plan.must_have_skills == ["AWS"]
+    assert "Python" in plan.skills
+
+def test_soft_skills_stay_soft(planner):
+    plan = planner.plan("Senior Python engineer without a degree is fine, Kubernetes a plus")
+    assert plan.must_have_skills == [] and set(plan.skills) == {"Python", "Kubernetes"}
+
+@pytest.mark.parametrize("query, must_have, must_not_have", [
+    ("Senior Python engineer, must not have Java", [], ["Java"]),
+    ("Senior engineer with Python, no Java or C++", [], ["Java", "C++"]),
+    ("Data scientist, must have SQL and Machine Learning", ["SQL", "Machine Learning"], []),
+    ("Senior engineer, Kubernetes is a must, without Java", ["Kubernetes"], ["Java"]),
+])
+def test_adjacent_cues(planner, query, must_have, must_not_have):
+    plan = planner.plan(query)
+    assert plan.must_have_skills == must_have
+    assert plan.must_not_have_skills == must_not_have
+    assert not set(plan.skills) & set(must_not_have)
+
+def test_hard_constraints_lower_confidence(planner):
+    soft = planner.plan("Senior Python engineer in Tech with Java")
+    hard = planner.plan("Senior Python engineer in Tech, no Java")
+    assert hard.confidence < soft.confidence
+    assert soft.confidence >= PLANNER_CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("query", [
+    "DevOps engineer experienced with auto-scaling on AWS",
+    "Software developer who can lead our payments platform",
+    "software architect with strong technology vision",
+    "Engineer to lead the migration of our billing system",
+])
+def test_incidental_level_and_industry_words_are_not_filters(planner, query):
+    plan = planner.plan(query)
+    assert plan.level is None and plan.industry is None
+    assert "level" not in plan.tool_input(5) and "industry" not in plan.tool_input(5)
+
+def test_level_away_from_the_role_is_a_soft_hint(planner):
+    plan = planner.plan("Software developer who can lead our payments platform")
+    assert plan.soft_level == "Lead" and plan.rank_level == "Lead"
+    assert plan.confidence < PLANNER_CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("query, level, industry", [
+    ("Senior Python engineer in Tech", "Senior", "Tech"),
+    ("Lead DevOps engineer for an automotive company", "Lead", "Automotive"),
+    ("Senior Software Engineer with Python", "Senior", None),
+])
+def test_level_modifying_the_role_is_a_filter(planner, query, level, industry):
+    plan = planner.plan(query)
+    assert (plan.level, plan.industry) == (level, industry)
+    assert plan.tool_input(5).get("level") == level
+
+def test_alias_only_values_are_soft(planner):
+    plan = planner.plan("Python engineer from fintech")
+    assert plan.industry is None and plan.soft_industry == "Finance"
+
+def test_local_plan_versus_llm_fallback(lark, planner, monkeypatch):
+    confident, vague = planner.plan("Senior Python engineer in Tech"), planner.plan("Engineer to lead the migration of our billing system")
+    before = dict(lark.query_planner.counters)
+    assert lark._use_local_plan(confident) and not lark._use_local_plan(vague)
+    monkeypatch.setattr(lark, "PLANNER_MODE", "llm")
+    assert not lark._use_local_plan(confident)
+    counters = lark.query_planner.counters
+    assert counters["local"] - before.get("local", 0) == 1 and counters["llm_fallback"] - before.get("llm_fallback", 0) == 2
@@ -0,0 +1,36 @@
+import numpy as np
+
+from fakes import FakeEmbedder
+from lexical_index import skill_set
+from reranker import Reranker
+
+QUERY = "Senior Python engineer with AWS, 5+ years"
+# (text, skills, level, industry, years, bm25)
+POOL = [
+    ("Python engineer with AWS", "Python, AWS", "Junior", "Tech", 2.0, 1.5),
+    ("Marketing manager, SEO and content strategy", "SEO", "Senior", "E-commerce", 10.0, 0.0),
+    ("Senior Python engineer with AWS and Kubernetes", "Python, AWS, Kubernetes", "Senior", "Tech", 8.0, 2.0),
+    ("Senior Python engineer with AWS and Kubernetes", "Python, AWS, Kubernetes", "Junior", "Finance", 3.0, 2.0),
+]
+
+def _score(reranker: Reranker, **kwargs) -> np.ndarray:
+    embedder = FakeEmbedder(dim=64)
+    embeddings = np.asarray(embedder.embed([text for text, *_ in POOL]), dtype=np.float32)
+    return reranker.score(np.asarray(embedder.embed_one(QUERY), dtype=np.float32), embeddings, np.asarray([row[5] for row in POOL], dtype=np.float32),
+                          [skill_set(row[1]) for row in POOL], [row[2] for row in POOL], [row[3] for row in POOL], np.asarray([row[4] for row in POOL], dtype=np.float32),
+                          **{"query_skills": skill_set("Python, AWS"), "level": "Senior", "industry": "Tech", "min_years": 5.0, **kwargs})
+
+def test_ranking_is_deterministic():
+    scores = _score(Reranker())
+    assert list(np.argsort(-scores, kind="stable")) == [2, 3, 0, 1]
+    assert np.array_equal(scores, _score(Reranker()))
+
+def test_level_industry_and_years_break_ties_between_equal_texts():
+    scores = _score(Reranker())
+    weights = Reranker().weights
+    assert np.isclose(scores[2] - scores[3], weights["level"] + weights["industry"] + weights["years"] * (1 - 3.0 / 5.0))
+
+def test_weights_change_the_order():
+    # With only the years feature, the two candidates meeting the 5-year requirement lead, the marketing manager included.
+    scores = _score(Reranker({"cosine": 0, "lexical": 0, "skills": 0, "level": 0, "industry": 0, "years": 1}))
+    assert list(np.argsort(-scores, kind="stable")) == [1, 2, 3, 0] and scores[1] == scores[2] == 1.0
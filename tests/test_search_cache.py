@@ -0,0 +1,66 @@
+import asyncio
+
+from search_cache import SearchResponseCache
+
+KEY = SearchResponseCache.make_key("Senior Python engineer", {"source": "Lark's Database"})
+
+def _slow_compute(calls: list, release: asyncio.Event):
+    async def compute():
+        calls.append("started")
+        await release.wait()
+        calls.append("finished")
+        return {"status": "success", "analysis_data": {"candidates": []}}
+    return compute
+
+def test_cancelled_leader_leaves_the_compute_to_waiters():
+    async def scenario():
+        cache, calls, release = SearchResponseCache(), [], asyncio.Event()
+        leader = asyncio.create_task(cache.get_or_compute(KEY, _slow_compute(calls, release)))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute(KEY, _slow_compute(calls, release)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        value, outcome = await waiter
+        assert leader.cancelled() and outcome == "coalesced" and value["status"] == "success"
+        assert calls == ["started", "finished"]
+        assert cache.get(KEY) == (value, "hit") and not cache._in_flight
+    asyncio.run(scenario())
+
+def test_compute_is_cancelled_when_every_caller_is_gone():
+    async def scenario():
+        cache, calls, release = SearchResponseCache(), [], asyncio.Event()
+        callers = [asyncio.create_task(cache.get_or_compute(KEY, _slow_compute(calls, release))) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers: caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert calls == ["started"] and not cache._in_flight
+        # A later caller starts a fresh compute rather than joining the cancelled one.
+        release.set()
+        value, outcome = await cache.get_or_compute(KEY, _slow_compute(calls, release))
+        assert outcome == "miss" and calls == ["started", "started", "finished"]
+    asyncio.run(scenario())
+
+def test_failure_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        cache, started = SearchResponseCache(), asyncio.Event()
+        async def compute():
+            started.set()
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+        leader = asyncio.create_task(cache.get_or_compute(KEY, compute))
+        await started.wait()
+        results = await asyncio.gather(leader, cache.get_or_compute(KEY, compute), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache.get(KEY) == (None, None) and not cache._in_flight
+    asyncio.run(scenario())
+
+def test_uncacheable_value_is_shared_but_not_stored():
+    async def scenario():
+        cache = SearchResponseCache()
+        async def compute(): return {"status": "error"}
+        value, outcome = await cache.get_or_compute(KEY, compute, cacheable=lambda value: value["status"] == "success")
+        assert outcome == "miss" and value == {"status": "error"} and cache.get(KEY) == (None, None)
+    asyncio.run(scenario())
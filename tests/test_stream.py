@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+STREAM = "/v1/search_candidates/stream"
+
+def _events(body: str) -> list:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def _stream(api, query: str) -> list:
+    async def scenario():
+        async with api() as client:
+            response = await client.post(STREAM, json={"query": query, "source": "Lark's Database", "num_results": 5})
+            assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+            return _events(response.text)
+    return asyncio.run(scenario())
+
+def _collapse(names: list) -> list:
+    return [name for i, name in enumerate(names) if i == 0 or name != names[i - 1]]
+
+def test_stream_sends_plan_candidates_summary_then_done(api, lark):
+    events = _stream(api, "Senior Python engineer with AWS and Kubernetes, streamed")
+    names = [name for name, _ in events]
+    assert _collapse(names) == ["plan", "candidates", "candidate", "summary", "done"]
+    data = dict(events)
+    assert data["plan"]["query"] and data["plan"]["num_results"] == 5
+    streamed = [candidate for name, candidate in events if name == "candidate"]
+    assert {candidate["name"] for candidate in streamed} <= {profile["name"] for profile in data["candidates"]}
+    assert "overall_summary" in data["summary"] and "candidates" not in data["summary"]
+    assert data["done"]["usage"]["output_tokens"] > 0
+
+def test_stream_ends_with_an_error_event_when_claude_fails(api, lark, monkeypatch):
+    def unavailable(**kwargs): raise RuntimeError("Anthropic is unavailable")
+    monkeypatch.setattr(lark.global_async_client_anthropic, "stream", unavailable)
+    events = _stream(api, "Data scientist with healthcare machine learning, stream failure")
+    names = [name for name, _ in events]
+    assert names == ["plan", "candidates", "error"]
+    assert "Anthropic is unavailable" in events[-1][1]["message"]
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+import pytest
+
+def test_timed_out_thread_keeps_its_permit_until_it_finishes(lark, monkeypatch):
+    monkeypatch.setitem(lark.UPSTREAM_LIMITS, "slow", {"concurrency": 1, "timeout": 0.05})
+    release, finished = threading.Event(), []
+
+    def blocking():
+        release.wait(5)
+        finished.append(True)
+
+    async def scenario():
+        with pytest.raises(TimeoutError): await lark._run_in_thread("slow", blocking)
+        # The caller gave up but the thread still runs, so the next call has to wait for it.
+        assert lark._upstream_semaphore("slow").locked()
+        follower = asyncio.create_task(lark._run_in_thread("slow", lambda: bool(finished)))
+        await asyncio.sleep(0.02)
+        assert not follower.done()
+        release.set()
+        assert await follower is True
+        assert not lark._upstream_semaphore("slow").locked()
+    asyncio.run(scenario())
+
+def test_thread_errors_propagate_and_release_the_permit(lark, monkeypatch):
+    monkeypatch.setitem(lark.UPSTREAM_LIMITS, "slow", {"concurrency": 1, "timeout": 1})
+
+    def failing(): raise ValueError("chroma down")
+
+    async def scenario():
+        with pytest.raises(ValueError): await lark._run_in_thread("slow", failing)
+        await asyncio.sleep(0)
+        assert not lark._upstream_semaphore("slow").locked()
+    asyncio.run(scenario())
+
+def test_each_event_loop_gets_its_own_semaphores(lark):
+    async def semaphore(): return lark._upstream_semaphore("chroma")
+    first, second = asyncio.run(semaphore()), asyncio.run(semaphore())
+    assert first is not second